@@ -1,11 +1,14 @@
+from typing import Any
+
 from fastapi import Request
 from sqladmin import Admin, ModelView
 from sqladmin.authentication import AuthenticationBackend
 from wtforms.fields import TextAreaField
 
+from app import crud
+from app.core.cache import structure_cache, token_claims_cache
 from app.core.config import settings
 from app.core.db import AsyncSessionLocal, async_engine
-from app.core.security import verify_password
 from app.models import (
     Category,
     Classroom,
@@ -32,16 +35,12 @@ class AdminAuth(AuthenticationBackend):
             return False
 
         async with AsyncSessionLocal() as session:
-            # ищем по email
-            from sqlmodel import select
-
-            stmt = select(User).where(User.email == username)
-            user = (await session.exec(stmt)).first()
-
+            # Та же проверка, что и при входе в API, с пересчётом устаревшего хеша
+            user = await crud.authenticate(
+                session=session, email=str(username), password=str(password)
+            )
             if not user or not user.is_superuser:
                 return False
-            if not verify_password(password, user.hashed_password):
-                return False
 
         # помечаем сессию как вошедшую
         request.session["admin_user_id"] = str(user.id)
@@ -61,15 +60,7 @@ class AdminAuth(AuthenticationBackend):
         if auth.startswith("Bearer "):
             token = auth[7:].strip()
             try:
-                import jwt
-
-                from app.core import security
-                from app.core.config import settings
-
-                payload = jwt.decode(
-                    token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
-                )
-                user_id = payload.get("sub")
+                user_id = token_claims_cache.decode(token).sub
                 if not user_id:
                     return False
                 async with AsyncSessionLocal() as session:
@@ -137,7 +128,23 @@ class MetaCategoryAdmin(ModelView, model=MetaCategory):
 # Currency removed
 
 
-class CourseAdmin(ModelView, model=Course):
+class CourseStructureAdminMixin:
+    """Сбрасывает кэш структуры курса после правок через админку."""
+
+    @staticmethod
+    def course_id_of(model: Any) -> Any:
+        return model.course_id
+
+    async def after_model_change(
+        self, data: dict, model: Any, is_created: bool, request: Request
+    ) -> None:
+        await structure_cache.invalidate(self.course_id_of(model))
+
+    async def after_model_delete(self, model: Any, request: Request) -> None:
+        await structure_cache.invalidate(self.course_id_of(model))
+
+
+class CourseAdmin(CourseStructureAdminMixin, ModelView, model=Course):
     name = "Course"
     name_plural = "Courses"
     column_searchable_list = [Course.title]
@@ -156,8 +163,14 @@ class CourseAdmin(ModelView, model=Course):
         "description": {"rows": 8},
     }
 
+    @staticmethod
+    def course_id_of(model: Any) -> Any:
+        return model.id
+
 
-class CourseDescriptionBlockAdmin(ModelView, model=CourseDescriptionBlock):
+class CourseDescriptionBlockAdmin(
+    CourseStructureAdminMixin, ModelView, model=CourseDescriptionBlock
+):
     name = "Course Block"
     name_plural = "Course Blocks"
     column_list = [
@@ -173,7 +186,9 @@ class CourseDescriptionBlockAdmin(ModelView, model=CourseDescriptionBlock):
     }
 
 
-class CourseDescriptionLineAdmin(ModelView, model=CourseDescriptionLine):
+class CourseDescriptionLineAdmin(
+    CourseStructureAdminMixin, ModelView, model=CourseDescriptionLine
+):
     name = "Course Line"
     name_plural = "Course Lines"
     column_list = [
@@ -0,0 +1,108 @@
+"""add_course_search_vector
+
+Revision ID: 3e1f7b9a2c04
+Revises: ac05b5f8339b
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '3e1f7b9a2c04'
+down_revision = 'ac05b5f8339b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('course', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+
+    # Документ курса: title (A) > short_description (B) > description (C) > автор (D).
+    # Тексты курса индексируются в русской и английской конфигурациях,
+    # имя автора — без стемминга.
+    op.execute("""
+        CREATE FUNCTION course_search_document(
+            title text, short_description text, description text, author_name text
+        ) RETURNS tsvector AS $$
+            SELECT
+                setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('russian', coalesce(short_description, '')), 'B') ||
+                setweight(to_tsvector('english', coalesce(short_description, '')), 'B') ||
+                setweight(to_tsvector('russian', coalesce(description, '')), 'C') ||
+                setweight(to_tsvector('english', coalesce(description, '')), 'C') ||
+                setweight(to_tsvector('simple', coalesce(author_name, '')), 'D')
+        $$ LANGUAGE sql IMMUTABLE
+    """)
+
+    op.execute("""
+        CREATE FUNCTION course_search_vector_trigger() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := course_search_document(
+                NEW.title,
+                NEW.short_description,
+                NEW.description,
+                (SELECT concat_ws(' ', u.first_name, u.last_name)
+                 FROM users u WHERE u.id = NEW.author_id)
+            );
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER course_search_vector_update
+        BEFORE INSERT OR UPDATE OF title, short_description, description, author_id
+        ON course
+        FOR EACH ROW EXECUTE FUNCTION course_search_vector_trigger()
+    """)
+
+    op.execute("""
+        CREATE FUNCTION users_course_search_vector_trigger() RETURNS trigger AS $$
+        BEGIN
+            UPDATE course SET search_vector = course_search_document(
+                title,
+                short_description,
+                description,
+                concat_ws(' ', NEW.first_name, NEW.last_name)
+            )
+            WHERE author_id = NEW.id;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER users_course_search_vector_update
+        AFTER UPDATE OF first_name, last_name ON users
+        FOR EACH ROW
+        WHEN (OLD.first_name IS DISTINCT FROM NEW.first_name
+              OR OLD.last_name IS DISTINCT FROM NEW.last_name)
+        EXECUTE FUNCTION users_course_search_vector_trigger()
+    """)
+
+    op.execute("""
+        UPDATE course c SET search_vector = course_search_document(
+            c.title,
+            c.short_description,
+            c.description,
+            concat_ws(' ', u.first_name, u.last_name)
+        )
+        FROM users u
+        WHERE u.id = c.author_id
+    """)
+    op.create_index(
+        'ix_course_search_vector', 'course', ['search_vector'],
+        unique=False, postgresql_using='gin'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_course_search_vector', table_name='course', postgresql_using='gin')
+    op.execute("DROP TRIGGER users_course_search_vector_update ON users")
+    op.execute("DROP FUNCTION users_course_search_vector_trigger()")
+    op.execute("DROP TRIGGER course_search_vector_update ON course")
+    op.execute("DROP FUNCTION course_search_vector_trigger()")
+    op.execute("DROP FUNCTION course_search_document(text, text, text, text)")
+    op.drop_column('course', 'search_vector')
@@ -0,0 +1,24 @@
+"""add_course_keyset_index
+
+Revision ID: 5b8e0d2f4a61
+Revises: 7c2d4e6f8a10
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e0d2f4a61'
+down_revision = '7c2d4e6f8a10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_course_datetime_create_id', 'course', ['datetime_create', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_course_datetime_create_id', table_name='course')
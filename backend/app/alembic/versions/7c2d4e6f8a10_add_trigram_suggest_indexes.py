@@ -0,0 +1,35 @@
+"""add_trigram_suggest_indexes
+
+Revision ID: 7c2d4e6f8a10
+Revises: 3e1f7b9a2c04
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2d4e6f8a10'
+down_revision = '3e1f7b9a2c04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        'ix_course_title_trgm', 'course', ['title'], unique=False,
+        postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}
+    )
+    # Выражение совпадает с app.search.user_full_name
+    op.execute("""
+        CREATE INDEX ix_users_full_name_trgm ON users USING gin (
+            (coalesce(first_name, '') || ' ' || coalesce(last_name, '')) gin_trgm_ops
+        )
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX ix_users_full_name_trgm")
+    op.drop_index('ix_course_title_trgm', table_name='course', postgresql_using='gin')
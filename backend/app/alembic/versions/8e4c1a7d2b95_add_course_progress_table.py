@@ -0,0 +1,53 @@
+"""add_course_progress_table
+
+Revision ID: 8e4c1a7d2b95
+Revises: 5b8e0d2f4a61
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4c1a7d2b95'
+down_revision = '5b8e0d2f4a61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('course_progress',
+    sa.Column('user_id', sa.Uuid(), nullable=False),
+    sa.Column('course_id', sa.Uuid(), nullable=False),
+    sa.Column('completed_steps', sa.Integer(), nullable=False),
+    sa.Column('last_step_id', sa.Uuid(), nullable=True),
+    sa.Column('last_activity_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['course_id'], ['course.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['last_step_id'], ['step.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'course_id')
+    )
+    op.create_index(op.f('ix_course_progress_course_id'), 'course_progress', ['course_id'], unique=False)
+    # Заполняем прогресс по существующим отметкам
+    op.execute("""
+        INSERT INTO course_progress (
+            user_id, course_id, completed_steps, last_step_id, last_activity_at
+        )
+        SELECT
+            p.user_id,
+            m.course_id,
+            count(*),
+            (array_agg(p.step_id ORDER BY p.completed_at DESC))[1],
+            max(p.completed_at)
+        FROM step_progress p
+        JOIN step s ON s.id = p.step_id
+        JOIN lesson ls ON ls.id = s.lesson_id
+        JOIN module m ON m.id = ls.module_id
+        GROUP BY p.user_id, m.course_id
+    """)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_course_progress_course_id'), table_name='course_progress')
+    op.drop_table('course_progress')
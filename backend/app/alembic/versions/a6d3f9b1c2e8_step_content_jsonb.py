@@ -0,0 +1,40 @@
+"""step_content_jsonb
+
+Revision ID: a6d3f9b1c2e8
+Revises: 8e4c1a7d2b95
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d3f9b1c2e8'
+down_revision = '8e4c1a7d2b95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column(
+        'step', 'content',
+        type_=postgresql.JSONB(),
+        existing_type=sa.JSON(),
+        postgresql_using='content::jsonb',
+    )
+    op.create_index(
+        'ix_step_content', 'step', ['content'], unique=False,
+        postgresql_using='gin', postgresql_ops={'content': 'jsonb_path_ops'},
+    )
+
+
+def downgrade():
+    op.drop_index('ix_step_content', table_name='step', postgresql_using='gin')
+    op.alter_column(
+        'step', 'content',
+        type_=sa.JSON(),
+        existing_type=postgresql.JSONB(),
+        postgresql_using='content::json',
+    )
@@ -0,0 +1,59 @@
+"""add_course_stats_table
+
+Revision ID: ac05b5f8339b
+Revises: 6a7f5f87cfbf
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ac05b5f8339b'
+down_revision = '6a7f5f87cfbf'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('course_stats',
+    sa.Column('course_id', sa.Uuid(), nullable=False),
+    sa.Column('students_count', sa.Integer(), nullable=False),
+    sa.Column('favorites_count', sa.Integer(), nullable=False),
+    sa.Column('modules_count', sa.Integer(), nullable=False),
+    sa.Column('lessons_count', sa.Integer(), nullable=False),
+    sa.Column('steps_count', sa.Integer(), nullable=False),
+    sa.Column('completions_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['course_id'], ['course.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('course_id')
+    )
+    # Заполняем статистику по существующим данным
+    op.execute("""
+        INSERT INTO course_stats (
+            course_id, students_count, favorites_count, modules_count,
+            lessons_count, steps_count, completions_count
+        )
+        SELECT
+            c.id,
+            (SELECT count(*) FROM course_student_link l WHERE l.course_id = c.id),
+            (SELECT count(*) FROM course_favorite_link f WHERE f.course_id = c.id),
+            (SELECT count(*) FROM module m WHERE m.course_id = c.id),
+            (SELECT count(*) FROM lesson ls
+                JOIN module m ON m.id = ls.module_id
+                WHERE m.course_id = c.id),
+            (SELECT count(*) FROM step s
+                JOIN lesson ls ON ls.id = s.lesson_id
+                JOIN module m ON m.id = ls.module_id
+                WHERE m.course_id = c.id),
+            (SELECT count(*) FROM step_progress p
+                JOIN step s ON s.id = p.step_id
+                JOIN lesson ls ON ls.id = s.lesson_id
+                JOIN module m ON m.id = ls.module_id
+                WHERE m.course_id = c.id)
+        FROM course c
+    """)
+
+
+def downgrade():
+    op.drop_table('course_stats')
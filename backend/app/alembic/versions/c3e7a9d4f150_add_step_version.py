@@ -0,0 +1,24 @@
+"""add_step_version
+
+Revision ID: c3e7a9d4f150
+Revises: a6d3f9b1c2e8
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e7a9d4f150'
+down_revision = 'a6d3f9b1c2e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('step', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    op.drop_column('step', 'version')
@@ -0,0 +1,34 @@
+"""refresh_token_rotation
+
+Revision ID: d4b8f2a6c915
+Revises: c3e7a9d4f150
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b8f2a6c915'
+down_revision = 'c3e7a9d4f150'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Строки выданных, но не отозванных токенов больше не нужны: выданные
+    # токены в БД не хранятся. Отозванный старый токен — отозванное семейство
+    # из одного токена, его family_id равен token_id.
+    op.execute("DELETE FROM refresh_token WHERE NOT revoked")
+    op.add_column('refresh_token', sa.Column('family_id', sa.String(), nullable=True))
+    op.execute("UPDATE refresh_token SET family_id = token_id")
+    op.alter_column('refresh_token', 'family_id', nullable=False)
+    op.create_index(op.f('ix_refresh_token_expires_at'), 'refresh_token', ['expires_at'], unique=False)
+    op.create_index(op.f('ix_refresh_token_created_at'), 'refresh_token', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_refresh_token_created_at'), table_name='refresh_token')
+    op.drop_index(op.f('ix_refresh_token_expires_at'), table_name='refresh_token')
+    op.drop_column('refresh_token', 'family_id')
@@ -1,18 +1,27 @@
-from collections.abc import AsyncGenerator, Generator
-from typing import Annotated
-
-import jwt
-from fastapi import Depends, HTTPException, status
+import functools
+import inspect
+from collections.abc import AsyncGenerator, Callable, Coroutine, Generator
+from contextvars import ContextVar
+from typing import Annotated, Any
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi.routing import APIRoute
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.core import security
+from app.core.cache import token_claims_cache, user_cache
 from app.core.config import settings
-from app.core.db import AsyncSessionLocal, engine
-from app.models import TokenPayload, User
+from app.core.db import (
+    AsyncSessionLocal,
+    ReadAsyncSessionLocal,
+    current_user_id,
+    get_engine,
+)
+from app.models import User
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
@@ -20,38 +29,123 @@ reusable_oauth2 = OAuth2PasswordBearer(
 
 
 def get_db() -> Generator[Session, None, None]:
-    with Session(engine) as session:
+    with Session(get_engine()) as session:
         yield session
 
 
 SessionDep = Annotated[Session, Depends(get_db)]
 
 
+# Сессии, открытые для текущего запроса (заполняется в DBSessionRoute)
+_request_sessions: ContextVar[list[AsyncSession] | None] = ContextVar(
+    "request_sessions", default=None
+)
+
+
 async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    # Соединение из пула берётся только при первом запросе к БД
     async with AsyncSessionLocal() as session:
+        sessions = _request_sessions.get()
+        if sessions is not None:
+            sessions.append(session)
+        yield session
+
+
+def _release_sessions_after(
+    endpoint: Callable[..., Coroutine[Any, Any, Any]],
+) -> Callable[..., Coroutine[Any, Any, Any]]:
+    @functools.wraps(endpoint)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            sessions = _request_sessions.get()
+            if sessions and settings.DB_RELEASE_SESSION_EARLY:
+                for session in sessions:
+                    await session.close()
+
+    wrapper._releases_sessions = True  # type: ignore[attr-defined]
+    return wrapper
+
+
+class DBSessionRoute(APIRoute):
+    """
+    Закрывает сессии запроса сразу после обработчика, до сериализации ответа:
+    без этого соединение держится в пуле до выхода из зависимости, т.е. пока
+    строится response_model. Незакоммиченные изменения при закрытии
+    откатываются, как и раньше; загруженные объекты остаются доступны.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        if inspect.iscoroutinefunction(endpoint) and not getattr(
+            endpoint, "_releases_sessions", False
+        ):
+            endpoint = _release_sessions_after(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            token = _request_sessions.set([])
+            try:
+                return await handler(request)
+            finally:
+                _request_sessions.reset(token)
+
+        return route_handler
+
+
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Сессия для обработчиков только для чтения: запросы уходят на реплику,
+    если она настроена и пользователь недавно ничего не записывал.
+    """
+    async with ReadAsyncSessionLocal() as session:
+        sessions = _request_sessions.get()
+        if sessions is not None:
+            sessions.append(session)
         yield session
 
 
 AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
+async def get_user_by_token_subject(session: AsyncSession, sub: str) -> User | None:
+    """
+    Пользователь по sub токена. При попадании в user_cache строка не читается
+    из БД: объект собирается из снимка и присоединяется к сессии как уже
+    загруженный, поэтому его можно менять и сохранять как обычно.
+    """
+    snapshot = user_cache.get(sub)
+    if snapshot is not None:
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        session.add(user)
+        return user
+
+    user = await session.get(User, sub)
+    if user:
+        user_cache.set(sub, user.model_dump())
+    return user
+
+
 async def get_current_user(session: AsyncSessionDep, token: TokenDep) -> User:
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
-        )
-        token_data = TokenPayload(**payload)
+        token_data = token_claims_cache.decode(token)
     except (InvalidTokenError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = await session.get(User, token_data.sub)  # type: ignore[arg-type]
+    user = await get_user_by_token_subject(session, token_data.sub)  # type: ignore[arg-type]
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    current_user_id.set(str(user.id))
     return user
 
 
@@ -0,0 +1,206 @@
+"""
+Пагинация списков: классический OFFSET/LIMIT и keyset (курсорный) режим.
+
+В курсорном режиме клиент получает непрозрачный токен next_cursor, в котором
+закодированы значения ключей сортировки последней строки страницы. Следующая
+страница выбирается условием (k1, k2, ...) < (v1, v2, ...) по индексу, поэтому
+стоимость страницы не зависит от её глубины.
+
+Общее количество строк считается отдельно по стратегии count_strategy:
+exact — COUNT(*), estimated — оценка планировщика (pg_class.reltuples для
+запросов без фильтров, иначе EXPLAIN) с точным подсчётом ниже
+COUNT_ESTIMATE_THRESHOLD, none — без подсчёта.
+"""
+
+import base64
+import json
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Generic, TypeVar
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import (
+    ClauseElement,
+    ColumnElement,
+    Executable,
+    Select,
+    Table,
+    func,
+    text,
+    tuple_,
+)
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.compiler import SQLCompiler
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.models import CountStrategy
+
+T = TypeVar("T")
+
+
+@dataclass
+class Page(Generic[T]):
+    items: list[T]
+    count: int | None
+    count_strategy: CountStrategy
+    has_more: bool
+    next_cursor: str | None = None
+
+    def meta(self) -> dict[str, Any]:
+        """Поля ListPublic для ответа со списком."""
+        return {
+            "count": self.count,
+            "count_strategy": self.count_strategy,
+            "has_more": self.has_more,
+            "next_cursor": self.next_cursor,
+        }
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) для произвольного запроса с сохранением параметров."""
+
+    inherit_cache = False
+
+    def __init__(self, statement: Select[Any]) -> None:
+        self.statement = statement
+
+
+@compiles(Explain)
+def _compile_explain(element: Explain, compiler: SQLCompiler, **kw: Any) -> str:
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def _decode_value(key: ColumnElement[Any], value: Any) -> Any:
+    python_type = key.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is UUID:
+        return UUID(value)
+    return python_type(value)
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: Sequence[ColumnElement[Any]]) -> list[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError("cursor does not match sort keys")
+        return [
+            _decode_value(key, value) for key, value in zip(keys, values, strict=True)
+        ]
+    except (ValueError, TypeError, NotImplementedError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def _exact_count(session: AsyncSession, statement: Select[Any]) -> int:
+    count_statement = statement.with_only_columns(
+        func.count(), maintain_column_froms=True
+    ).order_by(None)
+    return (await session.exec(count_statement)).one()  # type: ignore[call-overload,no-any-return]
+
+
+async def _estimated_count(session: AsyncSession, statement: Select[Any]) -> int:
+    froms = statement.get_final_froms()
+    if (
+        statement.whereclause is None
+        and len(froms) == 1
+        and isinstance(froms[0], Table)
+    ):
+        reltuples_statement = text(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:name AS regclass)"
+        ).bindparams(name=froms[0].name)
+        estimate = (await session.exec(reltuples_statement)).scalar()  # type: ignore[call-overload]
+    else:
+        plan = (await session.exec(Explain(statement.order_by(None)))).scalar()  # type: ignore[call-overload]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = plan[0]["Plan"]["Plan Rows"]
+    # reltuples равен -1, пока таблица ни разу не анализировалась
+    return int(estimate) if estimate is not None else -1
+
+
+async def count_rows(
+    session: AsyncSession, statement: Select[Any], strategy: CountStrategy
+) -> tuple[int | None, CountStrategy]:
+    """Посчитать строки statement; возвращает число и фактическую стратегию."""
+    if strategy == "none":
+        return None, "none"
+    if strategy == "estimated":
+        estimate = await _estimated_count(session, statement)
+        if estimate >= settings.COUNT_ESTIMATE_THRESHOLD:
+            return estimate, "estimated"
+    return await _exact_count(session, statement), "exact"
+
+
+async def paginate(
+    session: AsyncSession,
+    statement: Select[Any],
+    *,
+    keys: Sequence[ColumnElement[Any]],
+    descending: bool = False,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count_strategy: CountStrategy | None = None,
+) -> Page[Any]:
+    """
+    Выбрать страницу statement, отсортированную по keys (последний ключ должен
+    быть уникальным). Если cursor передан (пустая строка — первая страница),
+    используется keyset-режим, иначе OFFSET/LIMIT. Без явной count_strategy
+    количество считается точно в режиме OFFSET и не считается в курсорном.
+    """
+    if count_strategy is None:
+        count_strategy = "exact" if cursor is None else "none"
+    count, used_strategy = await count_rows(session, statement, count_strategy)
+
+    order_by = [key.desc() if descending else key.asc() for key in keys]
+
+    if cursor is None:
+        page_statement = statement.order_by(*order_by).offset(skip).limit(limit + 1)
+        items = list((await session.exec(page_statement)).all())  # type: ignore[call-overload]
+        return Page(
+            items=items[:limit],
+            count=count,
+            count_strategy=used_strategy,
+            has_more=len(items) > limit,
+        )
+
+    page_statement = statement.add_columns(*keys).order_by(*order_by)
+    if cursor:
+        values = decode_cursor(cursor, keys)
+        row_keys, row_values = tuple_(*keys), tuple_(*values)
+        page_statement = page_statement.where(
+            row_keys < row_values if descending else row_keys > row_values
+        )
+    # exec() у sqlmodel для select(Model) отдаёт только первую колонку,
+    # а здесь нужны и значения ключей, поэтому берём строки через execute()
+    rows = (await session.execute(page_statement.limit(limit + 1))).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    key_count = len(keys)
+    next_cursor = encode_cursor(rows[-1][-key_count:]) if has_more else None
+    items = [row[0] for row in rows]
+    return Page(
+        items=items,
+        count=count,
+        count_strategy=used_strategy,
+        has_more=has_more,
+        next_cursor=next_cursor,
+    )
@@ -4,31 +4,42 @@ from uuid import UUID
 from fastapi import APIRouter
 from sqlmodel import col, func, select
 
-from app.api.deps import AsyncSessionDep, CurrentUser
+from app.api.deps import CurrentUser, DBSessionRoute, ReadSessionDep
+from app.api.pagination import paginate
 from app.models import (
     CategoriesPublic,
     Category,
+    CountStrategy,
     MetaCategoriesWithChildrenPublic,
     MetaCategory,
     MetaCategoryWithSubcategoriesPublic,
     Subcategory,
 )
 
-router = APIRouter(prefix="/categories", tags=["categories"])
+router = APIRouter(
+    prefix="/categories", tags=["categories"], route_class=DBSessionRoute
+)
 
 
 @router.get("/", response_model=CategoriesPublic)
 async def read_categories(
-    session: AsyncSessionDep,
+    session: ReadSessionDep,
     current_user: CurrentUser,
     skip: int = 0,
     limit: int = 100,
+    cursor: str | None = None,
+    count_strategy: CountStrategy | None = None,
 ) -> Any:
-    count_statement = select(func.count()).select_from(Category)
-    count = (await session.exec(count_statement)).one()
-    statement = select(Category).offset(skip).limit(limit)
-    categories = (await session.exec(statement)).all()
-    return CategoriesPublic(data=categories, count=count)
+    page = await paginate(
+        session,
+        select(Category),
+        keys=[col(Category.name)],
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        count_strategy=count_strategy,
+    )
+    return CategoriesPublic(data=page.items, **page.meta())
 
 
 @router.get(
@@ -36,7 +47,7 @@ async def read_categories(
 )
 async def read_meta_categories_by_category(
     category_id: UUID,
-    session: AsyncSessionDep,
+    session: ReadSessionDep,
     current_user: CurrentUser,
     skip: int = 0,
     limit: int = 100,
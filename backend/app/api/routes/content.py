@@ -5,9 +5,11 @@ from uuid import uuid4
 
 from fastapi import APIRouter, HTTPException, UploadFile, File
 
-from app.api.deps import AsyncSessionDep, CurrentUser
+from app import crud
+from app.api.deps import AsyncSessionDep, CurrentUser, DBSessionRoute
+from app.models import StepPublic
 
-router = APIRouter(prefix="/content", tags=["content"])
+router = APIRouter(prefix="/content", tags=["content"], route_class=DBSessionRoute)
 
 CONTENT_IMAGES_DIR = Path("app/static/content_images")
 
@@ -72,3 +74,44 @@ async def delete_content_image(
                 )
 
     raise HTTPException(status_code=404, detail="Image not found")
+
+
+@router.get("/steps", response_model=list[StepPublic])
+async def find_my_steps(
+    session: AsyncSessionDep,
+    current_user: CurrentUser,
+    language: str | None = None,
+    image_url: str | None = None,
+    limit: int = 100,
+) -> Any:
+    """
+    Найти шаги своих курсов по content: по языку задачи (CODE, DATASET) или
+    по ссылке на изображение (TEXT). Content в ответе не возвращается.
+    """
+    contains: dict[str, Any] = {}
+    if language is not None:
+        contains["language"] = language
+    if image_url is not None:
+        contains["images"] = [image_url]
+    if not contains:
+        raise HTTPException(
+            status_code=400, detail="Either language or image_url is required"
+        )
+
+    steps = await crud.find_author_steps(
+        session=session,
+        author_id=current_user.id,
+        contains=contains,
+        limit=min(limit, 1000),
+    )
+    return [
+        StepPublic(
+            id=step.id,
+            lesson_id=step.lesson_id,
+            title=step.title,
+            step_type=step.step_type,
+            position=step.position,
+            content=None,
+        )
+        for step in steps
+    ]
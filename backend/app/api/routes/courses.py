@@ -1,15 +1,38 @@
+from collections.abc import Sequence
 from datetime import datetime
+from functools import partial
 from pathlib import Path
-from typing import Any
+from typing import Any, NamedTuple
 from uuid import UUID, uuid4
 
-from fastapi import APIRouter, HTTPException, File, UploadFile
-from sqlmodel import col, func, select
+from fastapi import APIRouter, Depends, HTTPException, File, Query, UploadFile
+from pydantic import TypeAdapter
+from sqlmodel import col, select
 
+from app import crud, queries
+from app.api.pagination import paginate
 from app.api.utils import detect_image_ext_by_magic
+from app.core.cache import structure_cache
 from app.core.config import settings
+from app.core.progress_queue import progress_queue
+from app.search import (
+    SearchMode,
+    course_ilike_match,
+    course_search_match,
+    course_search_query,
+    course_search_rank,
+    trigram_match,
+    trigram_rank,
+    user_full_name,
+)
 
-from app.api.deps import AsyncSessionDep, CurrentUser
+from app.api.deps import (
+    AsyncSessionDep,
+    CurrentUser,
+    DBSessionRoute,
+    ReadSessionDep,
+    get_current_user,
+)
 from app.models import (
     Course,
     CourseCreate,
@@ -20,44 +43,67 @@ from app.models import (
     CoursePublic,
     CoursesPublic,
     CourseStudentLink,
+    CourseSuggestion,
+    CourseSuggestionsPublic,
+    AuthorSuggestion,
+    CountStrategy,
+    CourseOutline,
+    CourseProgressPublic,
     User,
     Subcategory,
 )
 
-router = APIRouter(prefix="/courses", tags=["courses"])
+router = APIRouter(prefix="/courses", tags=["courses"], route_class=DBSessionRoute)
 
+# Верхняя граница размера ответа /courses/suggest
+SUGGEST_MAX_RESULTS = 10
 
-async def enrich_course_public(
-    course: Course, session: AsyncSessionDep, user_id: UUID
-) -> CoursePublic:
+
+async def enrich_courses_public(
+    courses: Sequence[Course], session: AsyncSessionDep, user_id: UUID
+) -> list[CoursePublic]:
     """
-    Обогатить объект Course дополнительными полями для CoursePublic
+    Обогатить страницу курсов полями is_favorite, students_count и is_enrolled.
+    Число запросов не зависит от размера страницы: счётчики берутся из
+    course_stats, членство пользователя — двумя выборками по IN-списку.
     """
-    is_favorite_stmt = select(CourseFavoriteLink).where(
-        CourseFavoriteLink.course_id == course.id,
-        CourseFavoriteLink.user_id == user_id,
-    )
-    is_favorite = (await session.exec(is_favorite_stmt)).first() is not None
+    if not courses:
+        return []
 
-    students_count_stmt = (
-        select(func.count())
-        .select_from(CourseStudentLink)
-        .where(CourseStudentLink.course_id == course.id)
-    )
-    students_count = (await session.exec(students_count_stmt)).one()
+    course_ids = [course.id for course in courses]
 
-    is_enrolled_stmt = select(CourseStudentLink).where(
-        CourseStudentLink.course_id == course.id,
-        CourseStudentLink.user_id == user_id,
+    favorite_ids = set(
+        (await session.exec(queries.favorite_course_ids(user_id, course_ids)))
+        .scalars()
+        .all()
+    )
+    students_counts = dict(
+        (await session.exec(queries.students_counts(course_ids))).tuples().all()
+    )
+    enrolled_ids = set(
+        (await session.exec(queries.enrolled_course_ids(user_id, course_ids)))
+        .scalars()
+        .all()
     )
-    is_enrolled = (await session.exec(is_enrolled_stmt)).first() is not None
 
-    course_dict = course.model_dump()
-    course_dict["is_favorite"] = is_favorite
-    course_dict["students_count"] = students_count
-    course_dict["is_enrolled"] = is_enrolled
+    courses_public: list[CoursePublic] = []
+    for course in courses:
+        course_dict = course.model_dump()
+        course_dict["is_favorite"] = course.id in favorite_ids
+        course_dict["students_count"] = students_counts.get(course.id, 0)
+        course_dict["is_enrolled"] = course.id in enrolled_ids
+        courses_public.append(CoursePublic(**course_dict))
 
-    return CoursePublic(**course_dict)
+    return courses_public
+
+
+async def enrich_course_public(
+    course: Course, session: AsyncSessionDep, user_id: UUID
+) -> CoursePublic:
+    """
+    Обогатить объект Course дополнительными полями для CoursePublic
+    """
+    return (await enrich_courses_public([course], session, user_id))[0]
 
 
 @router.post("/", response_model=CoursePublic)
@@ -80,26 +126,39 @@ async def create_course(
     return await enrich_course_public(course, session, current_user.id)
 
 
+# Порядок списков курсов по умолчанию: сначала новые
+COURSE_SORT_KEYS = (col(Course.datetime_create), col(Course.id))
+
+
 @router.get("/", response_model=CoursesPublic)
 async def read_courses(
-    session: AsyncSessionDep,
+    session: ReadSessionDep,
     current_user: CurrentUser,
     skip: int = 0,
     limit: int = 100,
+    cursor: str | None = None,
+    count_strategy: CountStrategy | None = None,
     category_id: UUID | None = None,
     subcategory_id: UUID | None = None,
     meta_category_id: UUID | None = None,
     language_id: int | None = None,
     difficulty_level: int | None = None,
     q: str | None = None,
+    search_mode: SearchMode = "fts",
 ) -> Any:
     """
     Получить список курсов с фильтрами по категории, подкатегории и текстовому поиску
-    по полям title и description. Поддерживает пагинацию.
+    по названию, описаниям и имени автора. Поддерживает пагинацию через skip/limit
+    или через cursor (пустая строка — первая страница, далее next_cursor).
+    count_strategy=estimated заменяет точный COUNT(*) оценкой планировщика.
     Только опубликованные курсы.
+
+    search_mode=fts (по умолчанию) ищет по полнотекстовому индексу и сортирует
+    по релевантности, search_mode=ilike — прежний поиск подстрокой.
     """
 
     statement = select(Course).where(col(Course.is_published) == True)
+    sort_keys: tuple[Any, ...] = COURSE_SORT_KEYS
 
     if category_id is not None:
         statement = statement.where(col(Course.category_id) == category_id)
@@ -118,29 +177,28 @@ async def read_courses(
     if difficulty_level is not None:
         statement = statement.where(col(Course.difficulty_level) == difficulty_level)
 
-    if q:
-        pattern = f"%{q}%"
+    if q and search_mode == "fts":
+        tsquery = course_search_query(q)
+        statement = statement.where(course_search_match(tsquery))
+        sort_keys = (course_search_rank(tsquery), col(Course.id))
+    elif q:
         statement = statement.join(User, col(User.id) == col(Course.author_id)).where(
-            (col(Course.title).ilike(pattern))
-            | (col(Course.description).ilike(pattern))
-            | (col(User.first_name).ilike(pattern))
-            | (col(User.last_name).ilike(pattern))
-            | False
+            course_ilike_match(q)
         )
 
-    count_statement = statement.with_only_columns(func.count()).order_by(None)
-    count = (await session.exec(count_statement)).one()
-
-    # Пагинация
-    statement = statement.offset(skip).limit(limit)
-    courses = (await session.exec(statement)).all()
-
-    courses_public = []
-    for course in courses:
-        course_public = await enrich_course_public(course, session, current_user.id)
-        courses_public.append(course_public)
+    page = await paginate(
+        session,
+        statement,
+        keys=sort_keys,
+        descending=True,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        count_strategy=count_strategy,
+    )
+    courses_public = await enrich_courses_public(page.items, session, current_user.id)
 
-    return CoursesPublic(data=courses_public, count=count)
+    return CoursesPublic(data=courses_public, **page.meta())
 
 
 @router.get("/favorites", response_model=CoursesPublic)
@@ -149,37 +207,32 @@ async def read_favorite_courses(
     current_user: CurrentUser,
     skip: int = 0,
     limit: int = 100,
+    cursor: str | None = None,
+    count_strategy: CountStrategy | None = None,
 ) -> Any:
     """
     Получить список избранных курсов текущего пользователя
     """
-    # Получаем ID избранных курсов
-    favorite_links_statement = select(CourseFavoriteLink.course_id).where(
-        CourseFavoriteLink.user_id == current_user.id
+    statement = select(Course).join(
+        CourseFavoriteLink,
+        (col(CourseFavoriteLink.course_id) == col(Course.id))
+        & (col(CourseFavoriteLink.user_id) == current_user.id),
+    )
+    page = await paginate(
+        session,
+        statement,
+        keys=COURSE_SORT_KEYS,
+        descending=True,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        count_strategy=count_strategy,
     )
-    favorite_course_ids = (await session.exec(favorite_links_statement)).all()
-
-    if not favorite_course_ids:
-        return CoursesPublic(data=[], count=0)
-
-    # Получаем курсы по ID
-    statement = select(Course).where(col(Course.id).in_(favorite_course_ids))
-
-    # Подсчет
-    count_statement = statement.with_only_columns(func.count()).order_by(None)
-    count = (await session.exec(count_statement)).one()
-
-    # Пагинация
-    statement = statement.offset(skip).limit(limit)
-    courses = (await session.exec(statement)).all()
 
     # Преобразуем курсы в CoursePublic
-    courses_public = []
-    for course in courses:
-        course_public = await enrich_course_public(course, session, current_user.id)
-        courses_public.append(course_public)
+    courses_public = await enrich_courses_public(page.items, session, current_user.id)
 
-    return CoursesPublic(data=courses_public, count=count)
+    return CoursesPublic(data=courses_public, **page.meta())
 
 
 @router.get("/progress", response_model=CoursesPublic)
@@ -188,27 +241,39 @@ async def read_my_courses(
     current_user: CurrentUser,
     skip: int = 0,
     limit: int = 100,
+    cursor: str | None = None,
+    count_strategy: CountStrategy | None = None,
 ) -> Any:
-    """Курсы, на которые записан текущий пользователь"""
-    course_ids_stmt = select(CourseStudentLink.course_id).where(
-        CourseStudentLink.user_id == current_user.id
+    """
+    Курсы, на которые записан текущий пользователь, с прогрессом по каждому
+    (пройдено шагов, всего, процент, последний шаг)
+    """
+    statement = select(Course).join(
+        CourseStudentLink,
+        (col(CourseStudentLink.course_id) == col(Course.id))
+        & (col(CourseStudentLink.user_id) == current_user.id),
+    )
+    page = await paginate(
+        session,
+        statement,
+        keys=COURSE_SORT_KEYS,
+        descending=True,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        count_strategy=count_strategy,
     )
-    enrolled_ids = (await session.exec(course_ids_stmt)).all()
-    if not enrolled_ids:
-        return CoursesPublic(data=[], count=0)
-
-    statement = select(Course).where(col(Course.id).in_(enrolled_ids))
-    count_statement = statement.with_only_columns(func.count()).order_by(None)
-    count = (await session.exec(count_statement)).one()
-    statement = statement.offset(skip).limit(limit)
-    courses = (await session.exec(statement)).all()
 
-    courses_public: list[CoursePublic] = []
-    for course in courses:
-        course_public = await enrich_course_public(course, session, current_user.id)
-        courses_public.append(course_public)
+    courses_public = await enrich_courses_public(page.items, session, current_user.id)
+    progress = await crud.get_courses_progress(
+        session=session,
+        user_id=current_user.id,
+        course_ids=[course.id for course in page.items],
+    )
+    for course_public in courses_public:
+        course_public.progress = progress.get(course_public.id, CourseProgressPublic())
 
-    return CoursesPublic(data=courses_public, count=count)
+    return CoursesPublic(data=courses_public, **page.meta())
 
 
 @router.get("/author", response_model=CoursesPublic)
@@ -217,25 +282,73 @@ async def read_author_courses(
     current_user: CurrentUser,
     skip: int = 0,
     limit: int = 100,
+    cursor: str | None = None,
+    count_strategy: CountStrategy | None = None,
 ) -> Any:
     """Курсы, созданные текущим пользователем (где он автор)"""
     statement = select(Course).where(col(Course.author_id) == current_user.id)
+    page = await paginate(
+        session,
+        statement,
+        keys=COURSE_SORT_KEYS,
+        descending=True,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        count_strategy=count_strategy,
+    )
 
-    count_statement = statement.with_only_columns(func.count()).order_by(None)
-    count = (await session.exec(count_statement)).one()
+    courses_public = await enrich_courses_public(page.items, session, current_user.id)
+    # Автор не записан на свой курс, так что переопределяем
+    for course_public in courses_public:
+        course_public.is_enrolled = False
 
-    statement = statement.offset(skip).limit(limit)
-    courses = (await session.exec(statement)).all()
+    return CoursesPublic(data=courses_public, **page.meta())
 
-    courses_public: list[CoursePublic] = []
-    for course in courses:
-        course_public = await enrich_course_public(course, session, current_user.id)
-        # Автор не записан на свой курс, так что переопределяем
-        course_dict = course_public.model_dump()
-        course_dict["is_enrolled"] = False
-        courses_public.append(CoursePublic(**course_dict))
 
-    return CoursesPublic(data=courses_public, count=count)
+@router.get(
+    "/suggest",
+    dependencies=[Depends(get_current_user)],
+    response_model=CourseSuggestionsPublic,
+)
+async def suggest_courses(
+    session: ReadSessionDep,
+    q: str = Query(min_length=2, max_length=64),
+    limit: int = Query(default=5, ge=1, le=SUGGEST_MAX_RESULTS),
+) -> Any:
+    """
+    Подсказки для строки поиска: названия опубликованных курсов и авторы.
+    Рассчитан на вызов при каждом нажатии клавиши — без обогащения и подсчёта,
+    только индексные выборки по триграммам с ограниченным размером ответа.
+    """
+    title = col(Course.title)
+    courses_stmt = (
+        select(Course.id, Course.title)
+        .where(col(Course.is_published).is_(True), trigram_match(title, q))
+        .order_by(trigram_rank(title, q).desc(), title)
+        .limit(limit)
+    )
+    courses = (await session.exec(courses_stmt)).all()
+
+    has_published_course = (
+        select(Course.id)
+        .where(
+            col(Course.author_id) == col(User.id), col(Course.is_published).is_(True)
+        )
+        .exists()
+    )
+    authors_stmt = (
+        select(User.id, user_full_name)
+        .where(trigram_match(user_full_name, q), has_published_course)
+        .order_by(trigram_rank(user_full_name, q).desc())
+        .limit(limit)
+    )
+    authors = (await session.exec(authors_stmt)).all()
+
+    return CourseSuggestionsPublic(
+        courses=[CourseSuggestion(id=id_, title=title) for id_, title in courses],
+        authors=[AuthorSuggestion(id=id_, name=name) for id_, name in authors],
+    )
 
 
 @router.post("/{course_id}/publish")
@@ -255,6 +368,7 @@ async def publish_course(
     course.is_published = True
     session.add(course)
     await session.commit()
+    await structure_cache.invalidate(course.id)
 
     return {"message": "Course published successfully"}
 
@@ -262,7 +376,7 @@ async def publish_course(
 @router.get("/{course_id}", response_model=CoursePublic)
 async def read_course_by_id(
     course_id: UUID,
-    session: AsyncSessionDep,
+    session: ReadSessionDep,
     current_user: CurrentUser,
 ) -> Any:
     course = await session.get(Course, course_id)
@@ -303,6 +417,9 @@ async def add_to_favorites(
     # Добавляем в избранное
     favorite_link = CourseFavoriteLink(course_id=course_id, user_id=current_user.id)
     session.add(favorite_link)
+    await crud.update_course_stats(
+        session=session, course_id=course_id, favorites_count=1
+    )
     await session.commit()
 
     return {"message": "Course added to favorites"}
@@ -331,6 +448,9 @@ async def remove_from_favorites(
 
     # Удаляем из избранного
     await session.delete(favorite_link)
+    await crud.update_course_stats(
+        session=session, course_id=course_id, favorites_count=-1
+    )
     await session.commit()
 
     return {"message": "Course removed from favorites"}
@@ -358,6 +478,9 @@ async def enroll_course(
         return {"message": "Already enrolled"}
 
     session.add(CourseStudentLink(course_id=course_id, user_id=current_user.id))
+    await crud.update_course_stats(
+        session=session, course_id=course_id, students_count=1
+    )
     await session.commit()
     return {"message": "Enrolled"}
 
@@ -379,36 +502,135 @@ async def unenroll_course(
     if not link:
         return {"message": "Not enrolled"}
     await session.delete(link)
+    await crud.update_course_stats(
+        session=session, course_id=course_id, students_count=-1
+    )
     await session.commit()
     return {"message": "Unenrolled"}
 
 
+LEARN_LINES_ADAPTER = TypeAdapter(list[str])
+DESCRIPTION_BLOCKS_ADAPTER = TypeAdapter(list[dict[str, str]])
+COURSE_OUTLINE_ADAPTER = TypeAdapter(CourseOutline)
+
+
+class CourseAccess(NamedTuple):
+    author_id: UUID
+    is_published: bool
+
+
+COURSE_ACCESS_ADAPTER = TypeAdapter(CourseAccess)
+
+
+async def load_course_learn_lines(
+    session: AsyncSessionDep, course_id: UUID
+) -> list[str]:
+    statement = select(CourseDescriptionLine.text).where(
+        col(CourseDescriptionLine.course_id) == course_id
+    )
+    results = (await session.exec(statement)).all()
+    return [r for r in results]
+
+
+async def load_course_description_blocks(
+    session: AsyncSessionDep, course_id: UUID
+) -> list[dict[str, str]]:
+    statement = select(CourseDescriptionBlock.title, CourseDescriptionBlock.text).where(
+        col(CourseDescriptionBlock.course_id) == course_id
+    )
+    rows = (await session.exec(statement)).all()
+    return [{"title": title, "text": text} for title, text in rows]
+
+
+async def load_course_access(session: AsyncSessionDep, course_id: UUID) -> CourseAccess:
+    course = await session.get(Course, course_id)
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+    return CourseAccess(author_id=course.author_id, is_published=course.is_published)
+
+
 @router.get("/{course_id}/learn", response_model=list[str])
 async def read_course_learn_lines(
     course_id: UUID,
-    session: AsyncSessionDep,
+    session: ReadSessionDep,
     current_user: CurrentUser,
 ) -> list[str]:
     """Вернуть список CourseDescriptionLine.text для курса"""
-    statement = select(CourseDescriptionLine.text).where(
-        col(CourseDescriptionLine.course_id) == course_id
+    return await structure_cache.get_or_load(
+        course_id,
+        "learn",
+        LEARN_LINES_ADAPTER,
+        partial(load_course_learn_lines, session, course_id),
     )
-    results = (await session.exec(statement)).all()
-    return [r for r in results]
 
 
 @router.get("/{course_id}/blocks", response_model=list[dict])
 async def read_course_description_blocks(
     course_id: UUID,
-    session: AsyncSessionDep,
+    session: ReadSessionDep,
     current_user: CurrentUser,
-) -> list[dict]:
+) -> list[dict[str, str]]:
     """Вернуть список CourseDescriptionBlock для курса (title, text)"""
-    statement = select(CourseDescriptionBlock.title, CourseDescriptionBlock.text).where(
-        col(CourseDescriptionBlock.course_id) == course_id
+    return await structure_cache.get_or_load(
+        course_id,
+        "blocks",
+        DESCRIPTION_BLOCKS_ADAPTER,
+        partial(load_course_description_blocks, session, course_id),
     )
-    rows = (await session.exec(statement)).all()
-    return [{"title": title, "text": text} for title, text in rows]
+
+
+def apply_outline_progress(
+    outline: CourseOutline, completed_step_ids: set[UUID]
+) -> CourseOutline:
+    """Копия outline с отметками is_completed; исходное дерево не меняется."""
+    outline = outline.model_copy(deep=True)
+    for module in outline.modules:
+        for lesson in module.lessons:
+            for step in lesson.steps:
+                step.is_completed = step.id in completed_step_ids
+    return outline
+
+
+@router.get("/{course_id}/outline", response_model=CourseOutline)
+async def read_course_outline(
+    course_id: UUID,
+    session: ReadSessionDep,
+    current_user: CurrentUser,
+) -> Any:
+    """
+    Дерево курса: модули, уроки и шаги (без content) с отметками о прохождении
+    шагов текущим пользователем. Число запросов не зависит от размера курса;
+    структура берётся из кэша, из БД читается только прогресс.
+    """
+    access = await structure_cache.get_or_load(
+        course_id,
+        "access",
+        COURSE_ACCESS_ADAPTER,
+        partial(load_course_access, session, course_id),
+    )
+    if not access.is_published and access.author_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Course not found")
+
+    outline = await structure_cache.get_or_load(
+        course_id,
+        "outline",
+        COURSE_OUTLINE_ADAPTER,
+        partial(crud.get_course_outline, session=session, course_id=course_id),
+    )
+    completed_step_ids = await crud.get_completed_step_ids(
+        session=session, user_id=current_user.id, course_id=course_id
+    )
+    # Отметки, ещё не записанные из очереди write-behind
+    completed_step_ids |= progress_queue.pending_step_ids(
+        current_user.id,
+        (
+            step.id
+            for module in outline.modules
+            for lesson in module.lessons
+            for step in lesson.steps
+        ),
+    )
+    return apply_outline_progress(outline, completed_step_ids)
 
 
 @router.post("/{course_id}/cover", response_model=CoursePublic)
@@ -529,6 +751,7 @@ async def update_course(
 
     session.add(course)
     await session.commit()
+    await structure_cache.invalidate(course.id)
     await session.refresh(course)
 
     return await enrich_course_public(course, session, current_user.id)
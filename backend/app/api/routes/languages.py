@@ -1,20 +1,30 @@
 from typing import Any
 
 from fastapi import APIRouter
-from sqlmodel import func, select
+from sqlmodel import col, select
 
-from app.api.deps import AsyncSessionDep
-from app.models import Language, LanguagesPublic
+from app.api.deps import DBSessionRoute, ReadSessionDep
+from app.api.pagination import paginate
+from app.models import CountStrategy, Language, LanguagesPublic
 
-router = APIRouter(prefix="/languages", tags=["languages"])
+router = APIRouter(prefix="/languages", tags=["languages"], route_class=DBSessionRoute)
 
 
 @router.get("/", response_model=LanguagesPublic)
 async def read_languages(
-    session: AsyncSessionDep, skip: int = 0, limit: int = 100
+    session: ReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count_strategy: CountStrategy | None = None,
 ) -> Any:
-    count_statement = select(func.count()).select_from(Language)
-    count = (await session.exec(count_statement)).one()
-    statement = select(Language).offset(skip).limit(limit)
-    languages = (await session.exec(statement)).all()
-    return LanguagesPublic(data=languages, count=count)
+    page = await paginate(
+        session,
+        select(Language),
+        keys=[col(Language.id)],
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        count_strategy=count_strategy,
+    )
+    return LanguagesPublic(data=page.items, **page.meta())
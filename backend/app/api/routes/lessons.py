@@ -3,10 +3,12 @@ from uuid import UUID, uuid4
 from pathlib import Path
 
 from fastapi import APIRouter, HTTPException, File, UploadFile
-from sqlmodel import select
+from sqlmodel import col, select
 
-from app.api.deps import AsyncSessionDep, CurrentUser
+from app import crud
+from app.api.deps import AsyncSessionDep, CurrentUser, DBSessionRoute
 from app.api.utils import detect_image_ext_by_magic
+from app.core.cache import structure_cache
 from app.core.config import settings
 from app.models import (
     Course,
@@ -15,9 +17,10 @@ from app.models import (
     LessonCreate,
     LessonUpdate,
     LessonPublic,
+    Step,
 )
 
-router = APIRouter(prefix="/lessons", tags=["lessons"])
+router = APIRouter(prefix="/lessons", tags=["lessons"], route_class=DBSessionRoute)
 
 
 async def get_lesson_with_course(
@@ -78,6 +81,7 @@ async def update_lesson(
 
     session.add(lesson)
     await session.commit()
+    await structure_cache.invalidate(course.id)
     await session.refresh(lesson)
 
     return LessonPublic(**lesson.model_dump())
@@ -99,8 +103,17 @@ async def delete_lesson(
             status_code=403, detail="Only course author can delete lessons"
         )
 
+    # step_progress не удаляется каскадом вместе с шагами урока
+    statement = select(Step.id).where(col(Step.lesson_id) == lesson.id)
+    step_ids = (await session.exec(statement)).all()
+    await crud.delete_steps_progress(
+        session=session, course_id=course.id, step_ids=step_ids
+    )
     await session.delete(lesson)
+    await session.flush()
+    await crud.refresh_course_structure_stats(session=session, course_id=course.id)
     await session.commit()
+    await structure_cache.invalidate(course.id)
 
     return {"message": "Lesson deleted successfully"}
 
@@ -154,6 +167,7 @@ async def upload_lesson_cover(
     lesson.cover_image = f"/static/covers/{filename}"
     session.add(lesson)
     await session.commit()
+    await structure_cache.invalidate(course.id)
     await session.refresh(lesson)
 
     return LessonPublic(**lesson.model_dump())
@@ -186,6 +200,7 @@ async def delete_lesson_cover(
     lesson.cover_image = None
     session.add(lesson)
     await session.commit()
+    await structure_cache.invalidate(course.id)
     await session.refresh(lesson)
 
     return LessonPublic(**lesson.model_dump())
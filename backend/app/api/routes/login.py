@@ -1,18 +1,31 @@
 from datetime import datetime, timedelta
 from typing import Annotated, Any
-from uuid import uuid4
+from uuid import UUID, uuid4
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlmodel import select
+from sqlalchemy.exc import IntegrityError
 
 from app import crud
-from app.api.deps import AsyncSessionDep, CurrentUser, get_current_active_superuser
+from app.api.deps import (
+    AsyncSessionDep,
+    CurrentUser,
+    DBSessionRoute,
+    get_current_active_superuser,
+)
 from app.core import security
 from app.core.config import settings
-from app.core.security import get_password_hash, decode_token
-from app.models import Message, NewPassword, RefreshToken, Token, UserPublic
+from app.core.rate_limit import (
+    LOGIN_PER_EMAIL,
+    LOGIN_PER_IP,
+    RECOVERY_PER_EMAIL,
+    RECOVERY_PER_IP,
+    rate_limiter,
+)
+from app.core.refresh_tokens import refresh_token_revocations
+from app.core.security import decode_token, get_password_hash_async
+from app.models import Message, NewPassword, Token, UserPublic
 from app.utils import (
     generate_password_reset_token,
     generate_reset_password_email,
@@ -20,16 +33,24 @@ from app.utils import (
     verify_password_reset_token,
 )
 
-router = APIRouter(tags=["login"])
+router = APIRouter(tags=["login"], route_class=DBSessionRoute)
 
 
 @router.post("/login/access-token")
 async def login_access_token(
-    session: AsyncSessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+    request: Request,
+    session: AsyncSessionDep,
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
 ) -> Token:
     """
     OAuth2 compatible token login, get an access and refresh token for future requests
     """
+    await rate_limiter.hit_request(
+        request,
+        ip_rule=LOGIN_PER_IP,
+        email_rule=LOGIN_PER_EMAIL,
+        email=form_data.username,
+    )
     user = await crud.authenticate(
         session=session, email=form_data.username, password=form_data.password
     )
@@ -38,28 +59,20 @@ async def login_access_token(
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
 
-    # Создаём access token
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    return _issue_tokens(user.id, family_id=str(uuid4()))
+
+
+def _issue_tokens(user_id: UUID | str, *, family_id: str) -> Token:
     access_token = security.create_access_token(
-        user.id, expires_delta=access_token_expires
+        user_id, expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     )
-
-    # Создаём refresh token
-    refresh_token_expires = timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    token_id = str(uuid4())
+    # Выданный refresh token в БД не пишется, см. app/core/refresh_tokens.py
     refresh_token = security.create_refresh_token(
-        user.id, expires_delta=refresh_token_expires, jti=token_id
+        user_id,
+        expires_delta=timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+        jti=str(uuid4()),
+        family_id=family_id,
     )
-
-    # Сохраняем refresh token в БД
-    db_refresh_token = RefreshToken(
-        user_id=user.id,
-        token_id=token_id,
-        expires_at=datetime.utcnow() + refresh_token_expires,
-    )
-    session.add(db_refresh_token)
-    await session.commit()
-
     return Token(access_token=access_token, refresh_token=refresh_token)
 
 
@@ -69,7 +82,9 @@ async def refresh_access_token(
     refresh_token: str,
 ) -> Token:
     """
-    Обновить access token используя refresh token
+    Обменять refresh token на новую пару токенов. Старый refresh token после
+    этого недействителен; его повторное использование отзывает все токены,
+    полученные из того же входа.
     """
     # Декодируем refresh token
     payload = decode_token(refresh_token)
@@ -80,34 +95,43 @@ async def refresh_access_token(
     if payload.get("type") != "refresh":
         raise HTTPException(status_code=401, detail="Invalid token type")
 
-    token_id = payload.get("jti")
-    user_id = payload.get("sub")
-
+    token_id: str | None = payload.get("jti")
+    user_id: str | None = payload.get("sub")
     if not token_id or not user_id:
         raise HTTPException(status_code=401, detail="Invalid token payload")
-
-    # Проверяем существование refresh токена в БД
-    stmt = select(RefreshToken).where(
-        RefreshToken.token_id == token_id, RefreshToken.revoked == False
-    )
-    db_token = (await session.exec(stmt)).first()
-
-    if not db_token:
-        raise HTTPException(
-            status_code=401, detail="Refresh token not found or revoked"
+    # Токены, выданные до ротации, сами составляют семейство
+    family_id: str = payload.get("fam") or token_id
+
+    # Отозванные семейства известны процессу; БД читается, только если
+    # фильтр не исключил отзыв
+    if refresh_token_revocations.might_be_revoked(family_id):
+        if await crud.is_refresh_token_family_revoked(
+            session=session, family_id=family_id
+        ):
+            raise HTTPException(status_code=401, detail="Refresh token revoked")
+
+    try:
+        first_use = await crud.use_refresh_token(
+            session=session,
+            user_id=UUID(user_id),
+            token_id=token_id,
+            family_id=family_id,
+            expires_at=datetime.utcfromtimestamp(payload["exp"]),
         )
+    except IntegrityError:
+        # Пользователь удалён
+        raise HTTPException(status_code=401, detail="User not found")
+    if not first_use:
+        # Токен уже обменяли: он у двоих, и неизвестно, кто из них владелец
+        await crud.revoke_refresh_token_family(
+            session=session, user_id=UUID(user_id), family_id=family_id
+        )
+        await session.commit()
+        refresh_token_revocations.add(family_id)
+        raise HTTPException(status_code=401, detail="Refresh token reuse detected")
+    await session.commit()
 
-    # Проверяем, не истёк ли токен
-    if db_token.expires_at < datetime.utcnow():
-        raise HTTPException(status_code=401, detail="Refresh token expired")
-
-    # Создаём новый access token
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = security.create_access_token(
-        user_id, expires_delta=access_token_expires
-    )
-
-    return Token(access_token=access_token, refresh_token=refresh_token)
+    return _issue_tokens(user_id, family_id=family_id)
 
 
 @router.post("/login/revoke-token")
@@ -117,7 +141,8 @@ async def revoke_refresh_token(
     refresh_token: str,
 ) -> Message:
     """
-    Отозвать (revoke) refresh token (например, при logout)
+    Отозвать (revoke) refresh token (например, при logout) вместе со всеми
+    токенами, полученными из того же входа
     """
     payload = decode_token(refresh_token)
     if not payload:
@@ -127,16 +152,14 @@ async def revoke_refresh_token(
     if not token_id:
         raise HTTPException(status_code=401, detail="Invalid token payload")
 
-    # Находим токен в БД
-    stmt = select(RefreshToken).where(
-        RefreshToken.token_id == token_id, RefreshToken.user_id == current_user.id
-    )
-    db_token = (await session.exec(stmt)).first()
-
-    if db_token:
-        db_token.revoked = True
-        session.add(db_token)
+    # Чужой токен молча не отзывается
+    if payload.get("sub") == str(current_user.id):
+        family_id = payload.get("fam") or token_id
+        await crud.revoke_refresh_token_family(
+            session=session, user_id=current_user.id, family_id=family_id
+        )
         await session.commit()
+        refresh_token_revocations.add(family_id)
 
     return Message(message="Refresh token revoked")
 
@@ -150,10 +173,15 @@ async def test_token(current_user: CurrentUser) -> Any:
 
 
 @router.post("/password-recovery/{email}")
-async def recover_password(email: str, session: AsyncSessionDep) -> Message:
+async def recover_password(
+    request: Request, email: str, session: AsyncSessionDep
+) -> Message:
     """
     Password Recovery
     """
+    await rate_limiter.hit_request(
+        request, ip_rule=RECOVERY_PER_IP, email_rule=RECOVERY_PER_EMAIL, email=email
+    )
     user = await crud.get_user_by_email(session=session, email=email)
     if user:
         try:
@@ -187,7 +215,7 @@ async def reset_password(session: AsyncSessionDep, body: NewPassword) -> Message
         )
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    hashed_password = get_password_hash(password=body.new_password)
+    hashed_password = await get_password_hash_async(body.new_password)
     user.hashed_password = hashed_password
     session.add(user)
     await session.commit()
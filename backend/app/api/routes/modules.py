@@ -1,10 +1,14 @@
+from functools import partial
 from typing import Any
 from uuid import UUID
 
 from fastapi import APIRouter, HTTPException
+from pydantic import TypeAdapter
 from sqlmodel import col, select
 
-from app.api.deps import AsyncSessionDep, CurrentUser
+from app import crud
+from app.api.deps import AsyncSessionDep, CurrentUser, DBSessionRoute, ReadSessionDep
+from app.core.cache import structure_cache
 from app.models import (
     Course,
     Module,
@@ -15,10 +19,15 @@ from app.models import (
     Lesson,
     LessonCreate,
     LessonPublic,
+    Step,
 )
 
-router = APIRouter(prefix="/courses/{course_id}/modules", tags=["modules"])
-modules_router = APIRouter(prefix="/modules", tags=["modules"])
+router = APIRouter(
+    prefix="/courses/{course_id}/modules", tags=["modules"], route_class=DBSessionRoute
+)
+modules_router = APIRouter(
+    prefix="/modules", tags=["modules"], route_class=DBSessionRoute
+)
 
 
 async def get_module_with_course(
@@ -36,15 +45,12 @@ async def get_module_with_course(
     return module, course
 
 
-@router.get("/", response_model=list[ModuleWithLessons])
-async def read_course_modules(
-    course_id: UUID,
-    session: AsyncSessionDep,
-    current_user: CurrentUser,
-) -> Any:
-    """
-    Получить все модули курса с уроками, отсортированные по position
-    """
+MODULES_ADAPTER = TypeAdapter(list[ModuleWithLessons])
+
+
+async def load_course_modules(
+    session: AsyncSessionDep, course_id: UUID
+) -> list[ModuleWithLessons]:
     # Проверяем существование курса
     course = await session.get(Course, course_id)
     if not course:
@@ -59,24 +65,45 @@ async def read_course_modules(
     modules_result = await session.exec(modules_stmt)
     modules = modules_result.all()
 
-    # Для каждого модуля получаем уроки
-    result = []
-    for module in modules:
+    # Уроки всех модулей одним запросом
+    lessons_by_module: dict[UUID, list[Lesson]] = {module.id: [] for module in modules}
+    if modules:
         lessons_stmt = (
             select(Lesson)
-            .where(col(Lesson.module_id) == module.id)
+            .where(col(Lesson.module_id).in_(lessons_by_module))
             .order_by(Lesson.position)
         )
-        lessons_result = await session.exec(lessons_stmt)
-        lessons = lessons_result.all()
+        for lesson in (await session.exec(lessons_stmt)).all():
+            lessons_by_module[lesson.module_id].append(lesson)
 
+    result = []
+    for module in modules:
         module_dict = module.model_dump()
-        module_dict["lessons"] = [lesson.model_dump() for lesson in lessons]
+        module_dict["lessons"] = [
+            lesson.model_dump() for lesson in lessons_by_module[module.id]
+        ]
         result.append(ModuleWithLessons(**module_dict))
 
     return result
 
 
+@router.get("/", response_model=list[ModuleWithLessons])
+async def read_course_modules(
+    course_id: UUID,
+    session: ReadSessionDep,
+    current_user: CurrentUser,
+) -> Any:
+    """
+    Получить все модули курса с уроками, отсортированные по position
+    """
+    return await structure_cache.get_or_load(
+        course_id,
+        "modules",
+        MODULES_ADAPTER,
+        partial(load_course_modules, session, course_id),
+    )
+
+
 @router.post("/", response_model=ModulePublic)
 async def create_module(
     course_id: UUID,
@@ -101,7 +128,11 @@ async def create_module(
         course_id=course_id,
     )
     session.add(module)
+    await crud.update_course_stats(
+        session=session, course_id=course_id, modules_count=1
+    )
     await session.commit()
+    await structure_cache.invalidate(course_id)
     await session.refresh(module)
 
     return ModulePublic(**module.model_dump())
@@ -146,6 +177,7 @@ async def update_module(
 
     session.add(module)
     await session.commit()
+    await structure_cache.invalidate(course.id)
     await session.refresh(module)
 
     return ModulePublic(**module.model_dump())
@@ -167,8 +199,21 @@ async def delete_module(
             status_code=403, detail="Only course author can delete modules"
         )
 
+    # step_progress не удаляется каскадом вместе с шагами модуля
+    statement = (
+        select(Step.id)
+        .join(Lesson, col(Lesson.id) == col(Step.lesson_id))
+        .where(col(Lesson.module_id) == module.id)
+    )
+    step_ids = (await session.exec(statement)).all()
+    await crud.delete_steps_progress(
+        session=session, course_id=course.id, step_ids=step_ids
+    )
     await session.delete(module)
+    await session.flush()
+    await crud.refresh_course_structure_stats(session=session, course_id=course.id)
     await session.commit()
+    await structure_cache.invalidate(course.id)
 
     return {"message": "Module deleted successfully"}
 
@@ -201,7 +246,11 @@ async def create_lesson_in_module(
         module_id=module_id,
     )
     session.add(lesson)
+    await crud.update_course_stats(
+        session=session, course_id=course.id, lessons_count=1
+    )
     await session.commit()
+    await structure_cache.invalidate(course.id)
     await session.refresh(lesson)
 
     return LessonPublic(**lesson.model_dump())
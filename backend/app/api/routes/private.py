@@ -3,14 +3,14 @@ from typing import Any
 from fastapi import APIRouter
 from pydantic import BaseModel
 
-from app.api.deps import AsyncSessionDep
-from app.core.security import get_password_hash
+from app.api.deps import AsyncSessionDep, DBSessionRoute
+from app.core.security import get_password_hash_async
 from app.models import (
     User,
     UserPublic,
 )
 
-router = APIRouter(tags=["private"], prefix="/private")
+router = APIRouter(tags=["private"], prefix="/private", route_class=DBSessionRoute)
 
 
 class PrivateUserCreate(BaseModel):
@@ -31,7 +31,7 @@ async def create_user(user_in: PrivateUserCreate, session: AsyncSessionDep) -> A
         email=user_in.email,
         first_name=user_in.first_name,
         last_name=user_in.last_name,
-        hashed_password=get_password_hash(user_in.password),
+        hashed_password=await get_password_hash_async(user_in.password),
     )
 
     session.add(user)
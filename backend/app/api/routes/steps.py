@@ -1,11 +1,23 @@
+import json
+from datetime import datetime
 from typing import Any
 from uuid import UUID
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Response
+from pydantic import ValidationError
+from sqlalchemy import Text, cast
+from sqlalchemy.orm import defer
 from sqlmodel import col, select
 
-from app.api.deps import AsyncSessionDep, CurrentUser
+from app import crud, grading, queries
+from app.api.deps import AsyncSessionDep, CurrentUser, DBSessionRoute
+from app.core.cache import structure_cache
+from app.core.db import AsyncSessionLocal
+from app.core.progress_queue import ProgressQueueFull, progress_queue
+from app.judge import JudgeJob, JudgeQueueFull, code_judge
 from app.models import (
+    CodeRunPublic,
+    CodeSubmission,
     Course,
     Lesson,
     Module,
@@ -13,11 +25,41 @@ from app.models import (
     StepCreate,
     StepProgress,
     StepProgressPublic,
+    StepsComplete,
+    StepSubmission,
+    StepSubmissionResult,
+    StepsCompletedPublic,
     StepUpdate,
     StepPublic,
+    StepType,
+)
+from app.schemas.step_content import (
+    CodeStepContent,
+    redact_step_content,
+    validate_step_content,
+)
+from app.sql_runner import InvalidSQLStep, SQLRunResult, SQLRunnerBusy, sql_runner
+
+router = APIRouter(
+    prefix="/lessons/{lesson_id}/steps", tags=["steps"], route_class=DBSessionRoute
 )
 
-router = APIRouter(prefix="/lessons/{lesson_id}/steps", tags=["steps"])
+
+def visible_content(
+    step_type: StepType, content: dict[str, Any], *, is_author: bool
+) -> dict[str, Any]:
+    """Content шага для текущего пользователя: ученику — без ключа ответа."""
+    return content if is_author else redact_step_content(step_type, content)
+
+
+def validated_content(step_type: StepType, content: dict[str, Any]) -> dict[str, Any]:
+    try:
+        return validate_step_content(step_type, content)
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=422,
+            detail=e.errors(include_url=False, include_context=False),
+        )
 
 
 @router.get("/", response_model=list[StepPublic])
@@ -25,9 +67,13 @@ async def read_lesson_steps(
     lesson_id: UUID,
     session: AsyncSessionDep,
     current_user: CurrentUser,
+    include_content: bool = True,
 ) -> Any:
     """
-    Получить все шаги урока, отсортированные по position
+    Получить все шаги урока, отсортированные по position. С include_content=false
+    возвращаются только метаданные шагов (content = null): колонка content не
+    читается из БД, а сам content шага берётся из /{step_id}/content. Всем,
+    кроме автора курса, content отдаётся без ключа ответа.
     """
     lesson = await session.get(Lesson, lesson_id)
     if not lesson:
@@ -44,27 +90,38 @@ async def read_lesson_steps(
     steps_stmt = (
         select(Step).where(col(Step.lesson_id) == lesson_id).order_by(Step.position)
     )
+    if not include_content:
+        # raiseload: случайное обращение к content упадёт, а не пойдёт в БД
+        steps_stmt = steps_stmt.options(defer(Step.content, raiseload=True))  # type: ignore[arg-type]
     steps_result = await session.exec(steps_stmt)
     steps = steps_result.all()
 
     step_ids = [step.id for step in steps]
     if step_ids:
-        progress_stmt = select(StepProgress).where(
-            StepProgress.user_id == current_user.id,
-            col(StepProgress.step_id).in_(step_ids)
-        )
+        progress_stmt = queries.completed_step_ids(current_user.id, step_ids)
         progress_result = await session.exec(progress_stmt)
-        completed_step_ids = {progress.step_id for progress in progress_result}
+        completed_step_ids = set(progress_result.scalars().all())
+        completed_step_ids |= progress_queue.pending_step_ids(current_user.id, step_ids)
     else:
         completed_step_ids = set()
 
-    steps_public = []
-    for step in steps:
-        step_dict = step.model_dump()
-        step_dict["is_completed"] = step.id in completed_step_ids
-        steps_public.append(StepPublic(**step_dict))
-
-    return steps_public
+    is_author = course.author_id == current_user.id
+    return [
+        StepPublic(
+            id=step.id,
+            lesson_id=step.lesson_id,
+            title=step.title,
+            step_type=step.step_type,
+            position=step.position,
+            content=(
+                visible_content(step.step_type, step.content, is_author=is_author)
+                if include_content
+                else None
+            ),
+            is_completed=step.id in completed_step_ids,
+        )
+        for step in steps
+    ]
 
 
 @router.post("/", response_model=StepPublic)
@@ -92,9 +149,14 @@ async def create_step(
     if course.author_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    step = Step.model_validate(step_in.model_dump() | {"lesson_id": lesson_id})
+    content = validated_content(step_in.step_type, step_in.content)
+    step = Step.model_validate(
+        step_in.model_dump() | {"lesson_id": lesson_id, "content": content}
+    )
     session.add(step)
+    await crud.update_course_stats(session=session, course_id=course.id, steps_count=1)
     await session.commit()
+    await structure_cache.invalidate(course.id)
     await session.refresh(step)
     return step
 
@@ -107,13 +169,75 @@ async def read_step(
     current_user: CurrentUser,
 ) -> Any:
     """
-    Получить шаг по ID
+    Получить шаг по ID. Всем, кроме автора курса, content отдаётся без ключа
+    ответа.
     """
     step = await session.get(Step, step_id)
     if not step or step.lesson_id != lesson_id:
         raise HTTPException(status_code=404, detail="Step not found")
 
-    return step
+    author_id = await crud.get_lesson_author_id(session=session, lesson_id=lesson_id)
+    return StepPublic(
+        id=step.id,
+        lesson_id=step.lesson_id,
+        title=step.title,
+        step_type=step.step_type,
+        position=step.position,
+        content=visible_content(
+            step.step_type, step.content, is_author=author_id == current_user.id
+        ),
+    )
+
+
+@router.get("/{step_id}/content")
+async def read_step_content(
+    lesson_id: UUID,
+    step_id: UUID,
+    session: AsyncSessionDep,
+    current_user: CurrentUser,
+    if_none_match: str | None = Header(default=None),
+) -> Response:
+    """
+    Получить content шага с ETag. ETag — Step.version, которая растёт при
+    каждой смене content или типа шага, поэтому для ответа 304 на If-None-Match
+    с текущим ETag читается только строка метаданных, без колонки content.
+    Ученик получает content без ключа ответа; автору курса тело отдаётся в
+    текстовом виде из Postgres без разбора и повторной сериализации JSON.
+    """
+    statement = (
+        select(Step.lesson_id, Step.version, Course.author_id)
+        .join(Lesson, col(Lesson.id) == col(Step.lesson_id))
+        .join(Module, col(Module.id) == col(Lesson.module_id))
+        .join(Course, col(Course.id) == col(Module.course_id))
+        .where(col(Step.id) == step_id)
+    )
+    row = (await session.exec(statement)).first()
+    if not row or row[0] != lesson_id:
+        raise HTTPException(status_code=404, detail="Step not found")
+    is_author = row[2] == current_user.id
+
+    def step_etag(version: int) -> str:
+        # Автор и ученик получают разное тело, поэтому и ETag у них разный
+        return f'"{step_id}.{version}{".author" if is_author else ""}"'
+
+    etag = step_etag(row[1])
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    # Версия перечитывается вместе с content: шаг мог измениться между запросами
+    content_column = cast(Step.content, Text) if is_author else col(Step.content)
+    content_statement = select(content_column, Step.version, Step.step_type).where(
+        col(Step.id) == step_id
+    )
+    content_row = (await session.exec(content_statement)).first()
+    if content_row is None:
+        raise HTTPException(status_code=404, detail="Step not found")
+    content, version, step_type = content_row
+    headers["ETag"] = step_etag(version)
+    if not is_author:
+        content = json.dumps(redact_step_content(step_type, content))
+    return Response(content=content, media_type="application/json", headers=headers)
 
 
 @router.put("/{step_id}", response_model=StepPublic)
@@ -147,9 +271,19 @@ async def update_step(
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
     update_data = step_in.model_dump(exclude_unset=True)
+    if "content" in update_data or "step_type" in update_data:
+        update_data["version"] = step.version + 1
+        # Смена типа проверяет и прежний content по схеме нового типа
+        update_data["content"] = validated_content(
+            update_data.get("step_type") or step.step_type,
+            step.content
+            if update_data.get("content") is None
+            else update_data["content"],
+        )
     step.sqlmodel_update(update_data)
     session.add(step)
     await session.commit()
+    await structure_cache.invalidate(course.id)
     await session.refresh(step)
     return step
 
@@ -183,11 +317,98 @@ async def delete_step(
     if course.author_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
+    await crud.delete_steps_progress(
+        session=session, course_id=course.id, step_ids=[step.id]
+    )
     await session.delete(step)
+    await crud.update_course_stats(session=session, course_id=course.id, steps_count=-1)
     await session.commit()
+    await structure_cache.invalidate(course.id)
     return {"ok": True}
 
 
+async def enqueue_progress(
+    user_id: UUID, step_ids: list[UUID]
+) -> tuple[list[tuple[UUID, datetime]], int]:
+    try:
+        return await progress_queue.enqueue(user_id, step_ids)
+    except ProgressQueueFull:
+        raise HTTPException(status_code=503, detail="Progress queue is full")
+
+
+@router.post("/complete", response_model=StepsCompletedPublic)
+async def mark_steps_completed(
+    lesson_id: UUID,
+    steps_in: StepsComplete,
+    session: AsyncSessionDep,
+    current_user: CurrentUser,
+) -> Any:
+    """
+    Отметить несколько шагов урока как пройденные за один запрос (синхронизация
+    прогресса, накопленного офлайн). Повторная отметка не ошибка, шаги не из
+    этого урока пропускаются.
+    """
+    statement = select(Step.id).where(
+        col(Step.lesson_id) == lesson_id, col(Step.id).in_(steps_in.step_ids)
+    )
+    step_ids = list((await session.exec(statement)).all())
+    if not step_ids and not await session.get(Lesson, lesson_id):
+        raise HTTPException(status_code=404, detail="Lesson not found")
+
+    if progress_queue.running:
+        _, queued_count = await enqueue_progress(current_user.id, step_ids)
+        return StepsCompletedPublic(step_ids=step_ids, created_count=queued_count)
+
+    created = await crud.complete_steps(
+        session=session, user_id=current_user.id, step_ids=step_ids
+    )
+    if created:
+        course_id = await crud.get_course_id_by_lesson(
+            session=session, lesson_id=lesson_id
+        )
+        if course_id:
+            await crud.record_completions(
+                session=session,
+                created=created,
+                course_by_step=dict.fromkeys(step_ids, course_id),
+            )
+        await session.commit()
+    return StepsCompletedPublic(step_ids=step_ids, created_count=len(created))
+
+
+async def complete_step(
+    session: AsyncSessionDep, user_id: UUID, lesson_id: UUID, step_id: UUID
+) -> StepProgress:
+    """Отметить шаг пройденным (через очередь, если она запущена)."""
+    if progress_queue.running:
+        # Запись появится в БД при сбросе очереди; id и время — её будущие
+        ((progress_id, completed_at),), _ = await enqueue_progress(user_id, [step_id])
+        return StepProgress(
+            id=progress_id,
+            user_id=user_id,
+            step_id=step_id,
+            completed_at=completed_at,
+        )
+
+    created = await crud.complete_steps(
+        session=session, user_id=user_id, step_ids=[step_id]
+    )
+    if not created:
+        # Шаг уже пройден (или отмечен параллельным запросом)
+        statement = select(StepProgress).where(
+            StepProgress.user_id == user_id, StepProgress.step_id == step_id
+        )
+        return (await session.exec(statement)).one()
+
+    course_id = await crud.get_course_id_by_lesson(session=session, lesson_id=lesson_id)
+    if course_id:
+        await crud.record_completions(
+            session=session, created=created, course_by_step={step_id: course_id}
+        )
+    await session.commit()
+    return created[0]
+
+
 @router.post("/{step_id}/complete", response_model=StepProgressPublic)
 async def mark_step_completed(
     lesson_id: UUID,
@@ -202,17 +423,185 @@ async def mark_step_completed(
     if not step or step.lesson_id != lesson_id:
         raise HTTPException(status_code=404, detail="Step not found")
 
-    statement = select(StepProgress).where(
-        StepProgress.user_id == current_user.id, StepProgress.step_id == step_id
+    return await complete_step(session, current_user.id, lesson_id, step_id)
+
+
+async def get_checker(
+    session: AsyncSessionDep, step_id: UUID, step_type: StepType, version: int
+) -> grading.Checker:
+    key = (step_id, version)
+    checker = grading.checker_cache.get(key)
+    if checker is None:
+        statement = select(Step.content).where(col(Step.id) == step_id)
+        content = (await session.exec(statement)).first() or {}
+        try:
+            checker = grading.compile_checker(step_type, content)
+        except ValidationError:
+            # Шаг без ключа ответа (черновик или content прежнего формата)
+            raise HTTPException(status_code=409, detail="Step has no answer key")
+        grading.checker_cache.set(key, checker)
+    return checker
+
+
+async def check_sql(
+    session: AsyncSessionDep, step_id: UUID, version: int, answer: Any
+) -> SQLRunResult:
+    if not isinstance(answer, str) or not answer.strip():
+        raise HTTPException(status_code=422, detail="Expected an SQL query")
+
+    async def load_content() -> dict[str, Any]:
+        statement = select(Step.content).where(col(Step.id) == step_id)
+        return (await session.exec(statement)).first() or {}
+
+    try:
+        return await sql_runner.run(
+            step_id=step_id, version=version, load_content=load_content, sql=answer
+        )
+    except InvalidSQLStep:
+        raise HTTPException(status_code=409, detail="Step has no valid database")
+    except SQLRunnerBusy:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many SQL checks, try again later",
+            headers={"Retry-After": "1"},
+        )
+
+
+@router.post("/{step_id}/submit", response_model=StepSubmissionResult)
+async def submit_step_answer(
+    lesson_id: UUID,
+    step_id: UUID,
+    submission: StepSubmission,
+    session: AsyncSessionDep,
+    current_user: CurrentUser,
+) -> Any:
+    """
+    Проверить ответ на шаг с известным ключом (тест, сопоставление, сортировка,
+    таблица, пропуски, строка, число) или SQL-запрос на SQL-шаг. Ключ ответа
+    не покидает сервер: он компилируется один раз на версию шага, проверка идёт
+    в памяти (для SQL — на копии заранее подготовленной базы). Верный ответ
+    отмечает шаг пройденным.
+    """
+    statement = select(Step.lesson_id, Step.step_type, Step.version).where(
+        col(Step.id) == step_id
+    )
+    row = (await session.exec(statement)).first()
+    if not row or row[0] != lesson_id:
+        raise HTTPException(status_code=404, detail="Step not found")
+    _, step_type, version = row
+
+    if step_type == StepType.SQL:
+        sql_result = await check_sql(session, step_id, version, submission.answer)
+        is_correct = sql_result.is_correct
+        result = StepSubmissionResult(
+            is_correct=is_correct,
+            is_completed=is_correct,
+            failed_test=sql_result.failed_test,
+            message=sql_result.message,
+        )
+    elif grading.is_auto_graded(step_type):
+        checker = await get_checker(session, step_id, step_type, version)
+        try:
+            is_correct = checker(submission.answer)
+        except grading.InvalidAnswer as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        result = StepSubmissionResult(is_correct=is_correct, is_completed=is_correct)
+    else:
+        raise HTTPException(
+            status_code=400, detail="Step type does not support answer checking"
+        )
+
+    if is_correct:
+        await complete_step(session, current_user.id, lesson_id, step_id)
+        return result
+
+    is_completed = bool(progress_queue.pending_step_ids(current_user.id, [step_id]))
+    if not is_completed:
+        statement = queries.completed_step_ids(current_user.id, [step_id])
+        is_completed = (await session.exec(statement)).scalars().first() is not None
+    result.is_completed = is_completed
+    return result
+
+
+def code_run_public(job: JudgeJob) -> CodeRunPublic:
+    result = job.result
+    return CodeRunPublic(
+        id=job.id,
+        status=job.status,
+        verdict=result.verdict if result else None,
+        passed_tests=result.passed_tests if result else 0,
+        total_tests=len(job.test_cases),
+        failed_test=result.failed_test if result else None,
+        message=result.message if result else None,
+        time_ms=result.time_ms if result else None,
     )
-    existing_progress = await session.exec(statement)
-    existing = existing_progress.first()
 
-    if existing:
-        return existing
 
-    progress = StepProgress(user_id=current_user.id, step_id=step_id)
-    session.add(progress)
-    await session.commit()
-    await session.refresh(progress)
-    return progress
+@router.post("/{step_id}/runs", response_model=CodeRunPublic, status_code=202)
+async def submit_code(
+    lesson_id: UUID,
+    step_id: UUID,
+    submission: CodeSubmission,
+    session: AsyncSessionDep,
+    current_user: CurrentUser,
+) -> Any:
+    """
+    Отправить решение CODE-шага на проверку. Решение ставится в очередь,
+    статус опрашивается через GET /{step_id}/runs/{run_id}. Решение, прошедшее
+    все тесты, отмечает шаг пройденным. Повторная отправка того же кода к той
+    же версии шага отвечается из кэша.
+    """
+    statement = select(Step.lesson_id, Step.step_type, Step.version, Step.content)
+    row = (await session.exec(statement.where(col(Step.id) == step_id))).first()
+    if not row or row[0] != lesson_id:
+        raise HTTPException(status_code=404, detail="Step not found")
+    _, step_type, version, content = row
+    if step_type != StepType.CODE:
+        raise HTTPException(status_code=400, detail="Step is not a code step")
+    try:
+        code_content = CodeStepContent.model_validate(content)
+    except ValidationError:
+        # Черновик без content или content прежнего формата
+        code_content = None
+    if not code_content or not code_content.test_cases:
+        raise HTTPException(status_code=409, detail="Step has no test cases")
+    if code_content.language != "python":
+        raise HTTPException(status_code=400, detail="Language is not supported")
+    if not code_judge.running:
+        raise HTTPException(status_code=503, detail="Code judge is not running")
+
+    user_id = current_user.id
+
+    async def on_accepted() -> None:
+        # Запрос к этому моменту может быть давно завершён
+        async with AsyncSessionLocal() as db_session:
+            await complete_step(db_session, user_id, lesson_id, step_id)
+
+    try:
+        job = await code_judge.submit(
+            user_id=user_id,
+            step_id=step_id,
+            version=version,
+            code=submission.code,
+            test_cases=code_content.test_cases,
+            on_accepted=on_accepted,
+        )
+    except JudgeQueueFull:
+        raise HTTPException(status_code=503, detail="Code judge queue is full")
+    return code_run_public(job)
+
+
+@router.get("/{step_id}/runs/{run_id}", response_model=CodeRunPublic)
+async def read_code_run(
+    lesson_id: UUID,  # noqa: ARG001
+    step_id: UUID,
+    run_id: UUID,
+    current_user: CurrentUser,
+) -> Any:
+    """
+    Статус проверки решения: queued, running, done (см. verdict) или failed.
+    """
+    job = code_judge.get_job(run_id)
+    if not job or job.user_id != current_user.id or job.step_id != step_id:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return code_run_public(job)
@@ -4,18 +4,23 @@ from typing import Any
 from uuid import UUID, uuid4
 
 from app.api.utils import detect_image_ext_by_magic
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
 from sqlmodel import col, func, select
 
 from app import crud
 from app.api.deps import (
     AsyncSessionDep,
     CurrentUser,
+    DBSessionRoute,
+    ReadSessionDep,
     get_current_active_superuser,
 )
+from app.api.pagination import paginate
 from app.core.config import settings
-from app.core.security import get_password_hash, verify_password
+from app.core.rate_limit import SIGNUP_PER_EMAIL, SIGNUP_PER_IP, rate_limiter
+from app.core.security import get_password_hash_async, verify_password_async
 from app.models import (
+    CountStrategy,
     Course,
     Message,
     SetLanguage,
@@ -30,7 +35,7 @@ from app.models import (
 )
 from app.utils import generate_new_account_email, send_email
 
-router = APIRouter(prefix="/users", tags=["users"])
+router = APIRouter(prefix="/users", tags=["users"], route_class=DBSessionRoute)
 
 
 _RE_WEBSITE = re.compile(r"^https?://[^\s]+$")
@@ -83,18 +88,26 @@ def _validate_social_links(payload: dict) -> None:
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UsersPublic,
 )
-async def read_users(session: AsyncSessionDep, skip: int = 0, limit: int = 100) -> Any:
+async def read_users(
+    session: AsyncSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count_strategy: CountStrategy | None = None,
+) -> Any:
     """
-    Retrieve users.
+    Retrieve users. Pass cursor (empty for the first page) for keyset pagination.
     """
-
-    count_statement = select(func.count()).select_from(User)
-    count = (await session.exec(count_statement)).one()
-
-    statement = select(User).offset(skip).limit(limit)
-    users = (await session.exec(statement)).all()
-
-    return UsersPublic(data=users, count=count)
+    page = await paginate(
+        session,
+        select(User),
+        keys=[col(User.id)],
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        count_strategy=count_strategy,
+    )
+    return UsersPublic(data=page.items, **page.meta())
 
 
 @router.post(
@@ -156,13 +169,15 @@ async def update_password_me(
     """
     Update own password.
     """
-    if not verify_password(body.current_password, current_user.hashed_password):
+    if not await verify_password_async(
+        body.current_password, current_user.hashed_password
+    ):
         raise HTTPException(status_code=400, detail="Incorrect password")
     if body.current_password == body.new_password:
         raise HTTPException(
             status_code=400, detail="New password cannot be the same as the current one"
         )
-    hashed_password = get_password_hash(body.new_password)
+    hashed_password = await get_password_hash_async(body.new_password)
     current_user.hashed_password = hashed_password
     session.add(current_user)
     await session.commit()
@@ -170,7 +185,7 @@ async def update_password_me(
 
 
 @router.get("/me", response_model=UserPublic)
-async def read_user_me(current_user: CurrentUser, session: AsyncSessionDep) -> Any:
+async def read_user_me(current_user: CurrentUser, session: ReadSessionDep) -> Any:
     """
     Get current user.
     """
@@ -230,10 +245,15 @@ async def delete_user_me(session: AsyncSessionDep, current_user: CurrentUser) ->
 
 
 @router.post("/signup", response_model=UserPublic)
-async def register_user(session: AsyncSessionDep, user_in: UserRegister) -> Any:
+async def register_user(
+    request: Request, session: AsyncSessionDep, user_in: UserRegister
+) -> Any:
     """
     Create new user without the need to be logged in.
     """
+    await rate_limiter.hit_request(
+        request, ip_rule=SIGNUP_PER_IP, email_rule=SIGNUP_PER_EMAIL, email=user_in.email
+    )
     user = await crud.get_user_by_email(session=session, email=user_in.email)
     if user:
         raise HTTPException(
@@ -247,7 +267,7 @@ async def register_user(session: AsyncSessionDep, user_in: UserRegister) -> Any:
 
 @router.get("/{user_id}", response_model=UserPublic)
 async def read_user_by_id(
-    user_id: UUID, session: AsyncSessionDep, current_user: CurrentUser
+    user_id: UUID, session: ReadSessionDep, current_user: CurrentUser
 ) -> Any:
     """
     Get a specific user by id.
@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
-from app.api.deps import get_current_active_superuser
+from app.api.deps import DBSessionRoute, get_current_active_superuser
+from app.core.cache import structure_cache
+from app.core.db import async_engine, replica_engines
+from app.core.rate_limit import rate_limiter
 from app.models import Message
 from app.utils import generate_test_email, send_email
 
-router = APIRouter(prefix="/utils", tags=["utils"])
+router = APIRouter(prefix="/utils", tags=["utils"], route_class=DBSessionRoute)
 
 
 @router.post(
@@ -26,6 +29,54 @@ def test_email(email_to: EmailStr) -> Message:
     return Message(message="Test email sent")
 
 
+@router.get(
+    "/cache-metrics/",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+async def cache_metrics() -> dict[str, int]:
+    """
+    Hit/miss counters of the course structure cache.
+    """
+    return structure_cache.metrics()
+
+
+@router.get(
+    "/rate-limit-metrics/",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+async def rate_limit_metrics() -> dict[str, int]:
+    """
+    Allowed and rejected requests of rate-limited endpoints, per rule.
+    """
+    return rate_limiter.metrics()
+
+
+@router.get(
+    "/db-metrics/",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+async def db_metrics() -> dict[str, dict[str, float]]:
+    """
+    Connection pool usage and time spent waiting for a connection checkout,
+    per engine: the primary and each read replica.
+    """
+    engines = {"primary": async_engine} | {
+        f"replica-{i}": engine for i, engine in enumerate(replica_engines)
+    }
+    result = {}
+    for name, engine in engines.items():
+        pool = engine.pool
+        metrics = pool.metrics  # type: ignore[attr-defined]
+        result[name] = {
+            "checkouts": metrics.checkouts,
+            "total_wait_seconds": metrics.total_wait_seconds,
+            "max_wait_seconds": metrics.max_wait_seconds,
+            "checked_out": pool.checkedout(),  # type: ignore[attr-defined]
+            "overflow": pool.overflow(),  # type: ignore[attr-defined]
+        }
+    return result
+
+
 @router.get("/health-check/")
 async def health_check() -> bool:
     return True
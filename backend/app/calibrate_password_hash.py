@@ -0,0 +1,134 @@
+"""
+Подбор стоимости хеширования паролей под железо, на котором запущен сервер.
+
+Замеряет проверку пароля (медиана нескольких попыток) и выбирает самую
+дорогую стоимость, при которой проверка укладывается в целевое время:
+
+    python -m app.calibrate_password_hash [--scheme argon2] [--target-ms 250]
+
+Для bcrypt подбираются раунды. Для argon2 — time_cost при заданной памяти;
+если и time_cost=1 не укладывается, память уменьшается вдвое (не ниже
+8 МиБ). Печатает переменные окружения для .env. Запускать на той же машине
+(или типе машины), что и воркеры приложения, без посторонней нагрузки.
+"""
+
+import argparse
+import logging
+import statistics
+import time
+
+from passlib.exc import MissingBackendError
+
+from app.core.config import settings
+from app.core.security import PasswordHashScheme, build_pwd_context
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PASSWORD = "calibration-password"
+MIN_ARGON2_MEMORY_COST_KIB = 8 * 1024
+
+
+def measure_verify_ms(
+    scheme: PasswordHashScheme,
+    *,
+    samples: int,
+    bcrypt_rounds: int = settings.BCRYPT_ROUNDS,
+    argon2_time_cost: int = settings.ARGON2_TIME_COST,
+    argon2_memory_cost_kib: int = settings.ARGON2_MEMORY_COST_KIB,
+    argon2_parallelism: int = settings.ARGON2_PARALLELISM,
+) -> float:
+    context = build_pwd_context(
+        scheme=scheme,
+        bcrypt_rounds=bcrypt_rounds,
+        argon2_time_cost=argon2_time_cost,
+        argon2_memory_cost_kib=argon2_memory_cost_kib,
+        argon2_parallelism=argon2_parallelism,
+    )
+    hashed = context.hash(PASSWORD)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.verify(PASSWORD, hashed)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+Calibration = tuple[dict[str, int], float]  # переменные окружения, мс на проверку
+
+
+def calibrate_bcrypt(target_ms: float, samples: int) -> Calibration:
+    rounds = 4  # минимум bcrypt
+    elapsed = measure_verify_ms("bcrypt", samples=samples, bcrypt_rounds=rounds)
+    # Каждый раунд удваивает стоимость
+    while rounds < 31 and elapsed * 2 <= target_ms:
+        rounds += 1
+        elapsed = measure_verify_ms("bcrypt", samples=samples, bcrypt_rounds=rounds)
+    logger.info("bcrypt rounds=%s: %.1f ms per verify", rounds, elapsed)
+    return {"BCRYPT_ROUNDS": rounds}, elapsed
+
+
+def calibrate_argon2(target_ms: float, samples: int) -> Calibration:
+    memory_cost = settings.ARGON2_MEMORY_COST_KIB
+
+    def measure(time_cost: int) -> float:
+        elapsed = measure_verify_ms(
+            "argon2",
+            samples=samples,
+            argon2_time_cost=time_cost,
+            argon2_memory_cost_kib=memory_cost,
+        )
+        logger.info(
+            "argon2 time_cost=%s memory_cost=%s KiB: %.1f ms per verify",
+            time_cost,
+            memory_cost,
+            elapsed,
+        )
+        return elapsed
+
+    time_cost = 1
+    elapsed = measure(time_cost)
+    while elapsed > target_ms and memory_cost > MIN_ARGON2_MEMORY_COST_KIB:
+        memory_cost = max(memory_cost // 2, MIN_ARGON2_MEMORY_COST_KIB)
+        elapsed = measure(time_cost)
+    while (next_elapsed := measure(time_cost + 1)) <= target_ms:
+        time_cost += 1
+        elapsed = next_elapsed
+    values = {
+        "ARGON2_TIME_COST": time_cost,
+        "ARGON2_MEMORY_COST_KIB": memory_cost,
+        "ARGON2_PARALLELISM": settings.ARGON2_PARALLELISM,
+    }
+    return values, elapsed
+
+
+def main() -> None:
+    # Под python -OO докстрингов нет
+    description = (__doc__ or "").strip().partition("\n")[0]
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--scheme", choices=["bcrypt", "argon2"], default=settings.PASSWORD_HASH_SCHEME
+    )
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--samples", type=int, default=5)
+    args = parser.parse_args()
+
+    calibrate = calibrate_argon2 if args.scheme == "argon2" else calibrate_bcrypt
+    try:
+        values, elapsed = calibrate(args.target_ms, args.samples)
+    except MissingBackendError as e:
+        parser.error(str(e))
+    print(f"PASSWORD_HASH_SCHEME={args.scheme}")  # noqa: T201
+    for name, value in values.items():
+        print(f"{name}={value}")  # noqa: T201
+    logger.info(
+        "%.1f ms per verify: with PASSWORD_HASH_WORKERS=%s an app worker checks "
+        "up to %.0f passwords per second",
+        elapsed,
+        settings.PASSWORD_HASH_WORKERS,
+        settings.PASSWORD_HASH_WORKERS * 1000 / elapsed,
+    )
+
+
+if __name__ == "__main__":
+    main()
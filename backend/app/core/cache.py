@@ -0,0 +1,300 @@
+"""
+Кэши приложения.
+
+Структура курса (модули, уроки, метаданные шагов, блоки и строки описания)
+меняется редко, а читается на каждой странице ученика. Значения хранятся под
+ключом (course_id, версия структуры, имя). Любая правка структуры увеличивает
+версию курса, после чего старые записи больше не запрашиваются и вытесняются
+по LRU — явно удалять их не нужно.
+
+Уровня два: локальный LRU в процессе и бэкенд (CacheBackend) для версий и
+значений. По умолчанию это InMemoryCacheBackend — локальная замена Redis с
+теми же операциями (GET/SET/INCR), у каждого воркера своя: правку сразу видит
+только обработавший её воркер, а в остальных прежняя структура отдаётся не
+дольше STRUCTURE_CACHE_TTL_SECONDS. Общий для воркеров бэкенд (Redis)
+подключается через structure_cache.use_backend(), тогда новая версия видна всем
+сразу.
+
+user_cache — короткоживущий кэш пользователей для get_current_user. Записи
+сбрасываются после commit любой сессии, изменившей или удалившей пользователя;
+в других воркерах устаревшая запись живёт не дольше USER_CACHE_TTL_SECONDS.
+
+token_claims_cache — проверенные claims JWT для get_current_user и входа в
+админку по Bearer-токену. Запись живёт до exp токена.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass
+from typing import Any, Generic, Protocol, TypeVar
+from uuid import UUID
+
+import jwt
+from pydantic import TypeAdapter
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core import security
+from app.core.config import settings
+from app.core.db import primary_reads
+from app.models import TokenPayload, User
+
+K = TypeVar("K")
+V = TypeVar("V")
+T = TypeVar("T")
+
+
+class LRUCache(Generic[K, V]):
+    """Словарь с ограничением размера и вытеснением давно не читанных ключей."""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._data: OrderedDict[K, V] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K) -> V | None:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K) -> V | None:
+        return self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class TTLCache(Generic[K, V]):
+    """LRU, записи которого устаревают через ttl_seconds; ttl_seconds=0 отключает кэш."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._data: LRUCache[K, tuple[float, V]] = LRUCache(max_entries)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K) -> V | None:
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: K, value: V) -> None:
+        if self.ttl_seconds > 0:
+            self._data.set(key, (time.monotonic() + self.ttl_seconds, value))
+
+    def invalidate(self, key: K) -> None:
+        self._data.pop(key)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class TokenClaimsCache:
+    """
+    Claims JWT по SHA-256 токена. Подпись, exp и схема TokenPayload
+    проверяются при первом предъявлении токена; дальше до exp claims
+    берутся из LRU. Ошибки (InvalidTokenError, ValidationError) не кэшируются.
+    Возвращаемый TokenPayload общий для запросов и не должен изменяться.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self._data: LRUCache[bytes, tuple[float, TokenPayload]] = LRUCache(max_entries)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def decode(self, token: str) -> TokenPayload:
+        key = hashlib.sha256(token.encode()).digest()
+        entry = self._data.get(key)
+        if entry is not None:
+            # exp сравнивается с time.time(), как в jwt.decode
+            if entry[0] > time.time():
+                self.hits += 1
+                return entry[1]
+            self._data.pop(key)
+        self.misses += 1
+        payload = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
+        )
+        claims = TokenPayload(**payload)
+        # Токен без exp не истекает сам, такой не кэшируем
+        if isinstance(payload.get("exp"), int | float):
+            self._data.set(key, (float(payload["exp"]), claims))
+        return claims
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class CacheBackend(Protocol):
+    """Общее хранилище: значения с вытеснением и невытесняемые счётчики."""
+
+    async def get(self, key: str) -> bytes | None: ...
+
+    async def set(self, key: str, value: bytes) -> None: ...
+
+    async def get_counter(self, key: str) -> int: ...
+
+    async def incr(self, key: str) -> int: ...
+
+
+class InMemoryCacheBackend:
+    """
+    Замена Redis в пределах одного процесса. Значения устаревают через
+    ttl_seconds: версии в других процессах не растут, и без срока правка курса
+    не дошла бы до них никогда.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self._values: TTLCache[str, bytes] = TTLCache(max_entries, ttl_seconds)
+        # Счётчики версий не вытесняются: сброс версии вернул бы устаревшие данные
+        self._counters: dict[str, int] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        return self._values.get(key)
+
+    async def set(self, key: str, value: bytes) -> None:
+        self._values.set(key, value)
+
+    async def get_counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+
+@dataclass
+class CacheMetrics:
+    hits: int = 0  # найдено в локальном LRU
+    shared_hits: int = 0  # найдено в общем бэкенде
+    misses: int = 0  # загружено из БД
+    invalidations: int = 0
+
+
+class CourseStructureCache:
+    key_prefix = "course-structure"
+
+    def __init__(
+        self, backend: CacheBackend, max_entries: int, ttl_seconds: float
+    ) -> None:
+        self.backend = backend
+        # Срок ограничивает устаревание, если бэкенд не общий для воркеров
+        self._local: TTLCache[str, Any] = TTLCache(max_entries, ttl_seconds)
+        self._metrics = CacheMetrics()
+
+    def use_backend(self, backend: CacheBackend) -> None:
+        """Подключить другой общий бэкенд (например, Redis)."""
+        self.backend = backend
+        self._local.clear()
+
+    def _version_key(self, course_id: UUID) -> str:
+        return f"{self.key_prefix}:{course_id}:version"
+
+    async def version(self, course_id: UUID) -> int:
+        return await self.backend.get_counter(self._version_key(course_id))
+
+    async def get_or_load(
+        self,
+        course_id: UUID,
+        name: str,
+        adapter: TypeAdapter[T],
+        loader: Callable[[], Awaitable[T]],
+    ) -> T:
+        """
+        Вернуть значение name для текущей версии структуры курса, при промахе
+        вызвав loader. Исключения loader (например, 404) не кэшируются.
+        Возвращаемые объекты общие для всех запросов и не должны изменяться.
+        """
+        version = await self.version(course_id)
+        key = f"{self.key_prefix}:{course_id}:{version}:{name}"
+
+        value = self._local.get(key)
+        if value is not None:
+            self._metrics.hits += 1
+            return value  # type: ignore[no-any-return]
+
+        raw = await self.backend.get(key)
+        if raw is not None:
+            self._metrics.shared_hits += 1
+            value = adapter.validate_json(raw)
+        else:
+            self._metrics.misses += 1
+            # Реплика может отставать: устаревшие данные попали бы в кэш
+            # под новой версией и жили бы до следующей правки
+            with primary_reads():
+                value = await loader()
+            await self.backend.set(key, adapter.dump_json(value))
+        self._local.set(key, value)
+        return value
+
+    async def invalidate(self, course_id: UUID) -> None:
+        """
+        Увеличить версию структуры курса. Вызывается после commit: если поднять
+        версию раньше, параллельный запрос закэширует под ней старые данные.
+        """
+        self._metrics.invalidations += 1
+        await self.backend.incr(self._version_key(course_id))
+
+    def metrics(self) -> dict[str, int]:
+        return asdict(self._metrics) | {"local_entries": len(self._local)}
+
+
+structure_cache = CourseStructureCache(
+    InMemoryCacheBackend(
+        settings.STRUCTURE_CACHE_SHARED_MAX_ENTRIES,
+        settings.STRUCTURE_CACHE_TTL_SECONDS,
+    ),
+    settings.STRUCTURE_CACHE_MAX_ENTRIES,
+    settings.STRUCTURE_CACHE_TTL_SECONDS,
+)
+
+
+# Снимки полей пользователя по строковому id (как в sub токена)
+user_cache: TTLCache[str, dict[str, Any]] = TTLCache(
+    settings.USER_CACHE_MAX_ENTRIES, settings.USER_CACHE_TTL_SECONDS
+)
+
+token_claims_cache = TokenClaimsCache(settings.TOKEN_CLAIMS_CACHE_MAX_ENTRIES)
+
+_CHANGED_USERS_KEY = "changed_user_ids"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session: Session, _flush_context: Any) -> None:
+    changed = session.info.setdefault(_CHANGED_USERS_KEY, set())
+    for obj in (*session.dirty, *session.deleted):
+        if isinstance(obj, User):
+            changed.add(str(obj.id))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session: Session) -> None:
+    # Сбрасываем только после commit: иначе параллельный запрос успеет
+    # закэшировать ещё не изменённую строку
+    for user_id in session.info.pop(_CHANGED_USERS_KEY, ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_changed_users(session: Session, _previous_transaction: Any) -> None:
+    session.info.pop(_CHANGED_USERS_KEY, None)
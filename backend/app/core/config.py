@@ -34,9 +34,38 @@ class Settings(BaseSettings):
     SECRET_KEY: str = secrets.token_urlsafe(32)
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    # Потоки для хеширования паролей и предел ждущих операций, сверх него — 429
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 16
+    # Схема и стоимость новых хешей паролей. Хеш другой схемы или стоимости
+    # пересчитывается при следующем входе пользователя. argon2 требует пакет
+    # argon2-cffi (passlib[argon2]), без него приложение не запустится;
+    # стоимость под железо подбирает app/calibrate_password_hash.py
+    PASSWORD_HASH_SCHEME: Literal["bcrypt", "argon2"] = "bcrypt"
+    BCRYPT_ROUNDS: int = 12
+    ARGON2_TIME_COST: int = 2
+    ARGON2_MEMORY_COST_KIB: int = 19_456
+    ARGON2_PARALLELISM: int = 1
     FRONTEND_HOST: str = "http://localhost:80"
     ENVIRONMENT: Literal["local", "staging", "production"] = "local"
     MAX_IMAGE_SIZE_BYTES: int = 5 * 1024 * 1024  # 5 MB
+    # Ниже этой оценки планировщика count_strategy=estimated считает точно
+    COUNT_ESTIMATE_THRESHOLD: int = 10_000
+    # Кэш структуры курсов: записей в LRU процесса и во встроенном общем бэкенде
+    STRUCTURE_CACHE_MAX_ENTRIES: int = 2048
+    STRUCTURE_CACHE_SHARED_MAX_ENTRIES: int = 20_000
+    # Сколько живёт запись; без общего бэкенда столько другие воркеры видят
+    # структуру до правки. 0 отключает кэш
+    STRUCTURE_CACHE_TTL_SECONDS: float = 60
+    # Кэш пользователей в get_current_user; 0 отключает кэш
+    USER_CACHE_TTL_SECONDS: float = 30
+    USER_CACHE_MAX_ENTRIES: int = 10_000
+    # Проверенные claims JWT (до exp токена); 0 отключает кэш
+    TOKEN_CLAIMS_CACHE_MAX_ENTRIES: int = 10_000
+    # Скомпилированные ключи ответов (app/grading.py) в процессе
+    GRADING_CACHE_MAX_ENTRIES: int = 10_000
+    # Возвращать соединение в пул сразу после обработчика, до сериализации ответа
+    DB_RELEASE_SESSION_EARLY: bool = True
 
     BACKEND_CORS_ORIGINS: Annotated[
         list[AnyUrl] | str, BeforeValidator(parse_cors)
@@ -81,6 +110,76 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # Пул соединений async_engine и реплик
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 30
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE_SECONDS: int = 1800  # -1 — не пересоздавать соединения
+    DB_STATEMENT_TIMEOUT_MS: int = 0  # 0 — без ограничения
+    # Кэш скомпилированного SQL в SQLAlchemy (на движок) и подготовленных
+    # выражений asyncpg (на соединение); 0 отключает подготовленные выражения
+    DB_COMPILED_CACHE_SIZE: int = 1500
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 500
+    # DSN реплик только для чтения (postgresql+asyncpg://...), через запятую
+    POSTGRES_REPLICA_URIS: Annotated[list[str] | str, BeforeValidator(parse_cors)] = []
+    # Сколько секунд после своей записи пользователь читает с primary
+    READ_YOUR_WRITES_SECONDS: float = 5
+
+    # Отложенная запись отметок шагов (см. app/core/progress_queue.py)
+    PROGRESS_WRITE_BEHIND: bool = False
+    # Журнал неподтверждённых отметок; без него они теряются при падении процесса
+    # Каждый процесс пишет в свой PROGRESS_SPOOL_PATH.<id> рядом с этим путём
+    PROGRESS_SPOOL_PATH: str | None = None
+    PROGRESS_SPOOL_FSYNC: bool = True
+    PROGRESS_FLUSH_BATCH_SIZE: int = 500
+    PROGRESS_FLUSH_INTERVAL_SECONDS: float = 1.0
+    PROGRESS_QUEUE_MAX_PENDING: int = 20_000
+    PROGRESS_QUEUE_FULL_TIMEOUT_SECONDS: float = 5
+
+    # Проверка решений CODE-шагов (см. app/judge.py); 0 воркеров отключает её
+    JUDGE_MAX_WORKERS: int = 4
+    JUDGE_QUEUE_MAX_PENDING: int = 2000
+    JUDGE_TIME_LIMIT_SECONDS: float = 2  # на один тест
+    JUDGE_MEMORY_LIMIT_MB: int = 256
+    JUDGE_OUTPUT_LIMIT_BYTES: int = 1024 * 1024
+    # Без изоляции сети воркеры должны работать в контейнере без сети
+    JUDGE_ISOLATE_NETWORK: bool = True
+    JUDGE_RESULT_CACHE_MAX_ENTRIES: int = 10_000
+    JUDGE_JOB_TTL_SECONDS: float = 600
+    # Проверка SQL-шагов (см. app/sql_runner.py): готовых копий на шаблон,
+    # лимит времени на решение вместе с тестами, строк и байт в результате
+    # запроса, размер копии базы и длина решения; потоки проверки и сколько
+    # проверок может ждать, прежде чем новые получат 429
+    SQL_RUNNER_POOL_SIZE: int = 4
+    SQL_RUNNER_TIME_LIMIT_MS: int = 1000
+    SQL_RUNNER_MAX_ROWS: int = 10_000
+    SQL_RUNNER_MAX_RESULT_BYTES: int = 4 * 1024 * 1024
+    SQL_RUNNER_MAX_DB_MB: int = 64
+    SQL_RUNNER_MAX_SQL_LENGTH: int = 20_000
+    SQL_RUNNER_MAX_TEMPLATES: int = 256
+    SQL_RUNNER_WORKERS: int = 4
+    SQL_RUNNER_MAX_PENDING: int = 64
+    # Отзывы refresh токенов (см. app/core/refresh_tokens.py): как часто
+    # подтягивать новые отзывы из БД (0 — проверять БД при каждом обновлении
+    # токена), как часто пересобирать фильтр целиком, его ложные срабатывания
+    REFRESH_TOKEN_REVOCATION_SYNC_SECONDS: float = 5
+    REFRESH_TOKEN_FILTER_REBUILD_SECONDS: float = 600
+    REFRESH_TOKEN_FILTER_ERROR_RATE: float = 0.001
+    # Удаление истёкших строк refresh_token пачками
+    REFRESH_TOKEN_PURGE_INTERVAL_SECONDS: float = 3600
+    REFRESH_TOKEN_PURGE_BATCH_SIZE: int = 5000
+    # Ограничение частоты (см. app/core/rate_limit.py): попыток входа в минуту,
+    # восстановлений пароля и регистраций в час — с одного IP и на один email
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_MAX_KEYS: int = 100_000
+    RATE_LIMIT_LOGIN_PER_IP: int = 30
+    RATE_LIMIT_LOGIN_PER_EMAIL: int = 10
+    RATE_LIMIT_RECOVERY_PER_IP: int = 20
+    RATE_LIMIT_RECOVERY_PER_EMAIL: int = 5
+    RATE_LIMIT_SIGNUP_PER_IP: int = 20
+    RATE_LIMIT_SIGNUP_PER_EMAIL: int = 5
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
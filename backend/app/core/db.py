@@ -1,20 +1,204 @@
+import functools
+import itertools
+import time
+from collections import OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, cast
+
+from sqlalchemy import Engine, event
 from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
 from sqlmodel import Session, create_engine, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app import crud
 from app.core.config import settings
+from app.core.security import get_password_hash
 from app.models import User, UserCreate
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
-async_engine: AsyncEngine = create_async_engine(
+
+@dataclass
+class PoolWaitMetrics:
+    checkouts: int = 0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+    def record(self, wait_seconds: float) -> None:
+        self.checkouts += 1
+        self.total_wait_seconds += wait_seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def reset(self) -> None:
+        self.checkouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, замеряющий время получения соединения (ожидание слота и connect)."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # У primary и у каждой реплики свой пул и свои замеры
+        self.metrics = PoolWaitMetrics()
+
+    def recreate(self) -> "TimedAsyncAdaptedQueuePool":
+        # engine.dispose() заменяет пул новым; замеры переходят к нему
+        pool = cast(TimedAsyncAdaptedQueuePool, super().recreate())
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.metrics.record(time.perf_counter() - started)
+
+
+def create_pooled_async_engine(url: str) -> AsyncEngine:
+    connect_args: dict[str, Any] = {
+        # LRU подготовленных выражений диалекта asyncpg на каждое соединение
+        "prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE,
+    }
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        connect_args["server_settings"] = {
+            "statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)
+        }
+    return create_async_engine(
+        url,
+        poolclass=TimedAsyncAdaptedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        connect_args=connect_args,
+        query_cache_size=settings.DB_COMPILED_CACHE_SIZE,
+    )
+
+
+@functools.cache
+def get_engine() -> Engine:
+    """
+    Синхронный движок для скриптов запуска, init_db и тестов. Приложение
+    работает через async_engine, поэтому движок создаётся при первом обращении.
+    """
+    return create_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI),
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+
+
+def __getattr__(name: str) -> Any:
+    # Совместимость с `from app.core.db import engine`
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async_engine: AsyncEngine = create_pooled_async_engine(
     str(settings.ASYNC_SQLALCHEMY_DATABASE_URI)
 )
+replica_engines: list[AsyncEngine] = [
+    create_pooled_async_engine(url) for url in settings.POSTGRES_REPLICA_URIS
+]
+_replica_cycle = itertools.cycle(replica_engines)
+
 AsyncSessionLocal = async_sessionmaker(
     bind=async_engine, expire_on_commit=False, class_=AsyncSession
 )
 
 
+# Маршрутизация чтений на реплики.
+#
+# Обработчики только для чтения получают сессию из ReadAsyncSessionLocal: её
+# SELECT уходят на одну из реплик, а flush и DML — на primary. Пользователь,
+# сам записавший что-то за последние READ_YOUR_WRITES_SECONDS, читает с
+# primary, чтобы сразу видеть свои изменения несмотря на отставание реплик.
+# Метки записей хранятся в процессе; после записи через другой воркер окно
+# не действует.
+
+# Пользователь текущего запроса (выставляет get_current_user)
+current_user_id: ContextVar[str | None] = ContextVar("current_user_id", default=None)
+# Принудительное чтение с primary (см. primary_reads)
+_force_primary: ContextVar[bool] = ContextVar("force_primary", default=False)
+# user_id -> время последней записи, в порядке записи
+_recent_writes: OrderedDict[str, float] = OrderedDict()
+
+_HAS_WRITES_KEY = "has_writes"
+
+
+@contextmanager
+def primary_reads() -> Iterator[None]:
+    """Читать с primary внутри блока (например, при заполнении общих кэшей)."""
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+def record_user_write(user_id: str) -> None:
+    now = time.monotonic()
+    _recent_writes[user_id] = now
+    _recent_writes.move_to_end(user_id)
+    while _recent_writes:
+        oldest_user_id, written_at = next(iter(_recent_writes.items()))
+        if now - written_at <= settings.READ_YOUR_WRITES_SECONDS:
+            break
+        del _recent_writes[oldest_user_id]
+
+
+def wrote_recently(user_id: str | None) -> bool:
+    if user_id is None:
+        return False
+    written_at = _recent_writes.get(user_id)
+    return (
+        written_at is not None
+        and time.monotonic() - written_at <= settings.READ_YOUR_WRITES_SECONDS
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_session_writes(session: Session, _flush_context: Any) -> None:
+    session.info[_HAS_WRITES_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _record_session_writes(session: Session) -> None:
+    user_id = current_user_id.get()
+    if session.info.pop(_HAS_WRITES_KEY, False) and user_id is not None:
+        record_user_write(user_id)
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper: Any = None, clause: Any = None, **kwargs: Any) -> Engine:
+        if (
+            not replica_engines
+            or self._flushing
+            or getattr(clause, "is_dml", False)
+            or _force_primary.get()
+            or wrote_recently(current_user_id.get())
+        ):
+            return async_engine.sync_engine
+        # Все чтения одной сессии идут на одну реплику
+        if "replica" not in self.info:
+            self.info["replica"] = next(_replica_cycle)
+        return self.info["replica"].sync_engine  # type: ignore[no-any-return]
+
+
+ReadAsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    expire_on_commit=False,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+)
+
+
 # make sure all SQLModel models are imported (app.models) before initializing DB
 # otherwise, SQLModel might fail to initialize relationships properly
 # for more details: https://github.com/fastapi/full-stack-fastapi-template/issues/28
@@ -57,7 +241,7 @@ async def init_db_async() -> None:
             # Use sync helper for hashing then add manually
             db_user = User.model_validate(
                 user_in,
-                update={"hashed_password": crud.get_password_hash(user_in.password)},
+                update={"hashed_password": get_password_hash(user_in.password)},
             )
             session.add(db_user)
             await session.commit()
@@ -0,0 +1,401 @@
+"""
+Отложенная запись отметок о прохождении шагов (write-behind).
+
+В режиме PROGRESS_WRITE_BEHIND отметка не пишется в БД в обработчике запроса:
+она ставится в очередь процесса, и клиент получает ответ сразу. Повторные
+отметки одной пары (user_id, step_id) схлопываются. Очередь сбрасывается в БД,
+когда в ней набирается PROGRESS_FLUSH_BATCH_SIZE отметок или раз в
+PROGRESS_FLUSH_INTERVAL_SECONDS: INSERT ... ON CONFLICT DO NOTHING на каждые
+PROGRESS_FLUSH_BATCH_SIZE строк и один commit на весь сброс. Если в очереди
+(вместе со сбрасываемыми) PROGRESS_QUEUE_MAX_PENDING отметок, новые ждут
+сброса, а через PROGRESS_QUEUE_FULL_TIMEOUT_SECONDS получают ProgressQueueFull.
+
+Если задан PROGRESS_SPOOL_PATH, отметка до подтверждения дописывается в журнал
+(JSON Lines, fsync при PROGRESS_SPOOL_FSYNC). Перед сбросом журнал
+переименовывается в сегмент, сегменты удаляются только после commit. При
+старте каждый процесс (воркер uvicorn) заводит свой журнал
+PROGRESS_SPOOL_PATH.<id> и держит flock на его .lock до остановки; recover()
+забирает журналы и сегменты процессов, чья блокировка свободна (они упали или
+остановились, не записав всё), и повторяет их: вставка идемпотентна, поэтому
+повтор уже записанных отметок безопасен. Журналы живых воркеров не трогаются.
+Без журнала отметки, не дошедшие до БД, теряются при падении процесса.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import re
+from collections.abc import Callable, Iterable, Sequence
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import IO
+from uuid import UUID, uuid4
+
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.models import StepProgress, User
+
+logger = logging.getLogger(__name__)
+
+# (user_id, step_id) -> (id будущей записи, completed_at)
+Pending = dict[tuple[UUID, UUID], tuple[UUID, datetime]]
+
+
+class ProgressQueueFull(Exception):
+    """Очередь не освободилась за отведённое время."""
+
+
+@dataclass
+class ProgressQueueMetrics:
+    enqueued: int = 0
+    coalesced: int = 0  # отметки, уже стоявшие в очереди
+    flushes: int = 0
+    failed_flushes: int = 0
+    inserted: int = 0  # новые строки step_progress
+    recovered: int = 0  # отметки, поднятые из журнала при старте
+
+
+class ProgressWriteBehind:
+    def __init__(
+        self,
+        *,
+        session_factory: Callable[[], AsyncSession],
+        spool_path: str | None,
+        batch_size: int,
+        flush_interval_seconds: float,
+        max_pending: int,
+        full_timeout_seconds: float,
+        fsync: bool = True,
+    ) -> None:
+        self.session_factory = session_factory
+        self.spool_base = Path(spool_path) if spool_path else None
+        # Журнал этого процесса; заводится в recover()
+        self.spool_path: Path | None = None
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_pending = max_pending
+        self.full_timeout_seconds = full_timeout_seconds
+        self.fsync = fsync
+        self._metrics = ProgressQueueMetrics()
+        self._pending: Pending = {}
+        self._in_flight: Pending = {}
+        self._spool_file: IO[str] | None = None
+        self._spool_lock: IO[str] | None = None
+        self._segments: list[Path] = []  # сегменты журнала, ещё не закоммиченные
+        self._task: asyncio.Task[None] | None = None
+        # Примитивы asyncio привязываются к циклу событий, поэтому создаются в start()
+        self._lock: asyncio.Lock
+        self._flush_lock: asyncio.Lock
+        self._wake: asyncio.Event
+        self._space: asyncio.Condition
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def __len__(self) -> int:
+        return len(self._pending) + len(self._in_flight)
+
+    async def start(self) -> None:
+        self._lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._space = asyncio.Condition()
+        try:
+            await self.recover()
+        except Exception:
+            # Поднятые из журнала отметки остались в очереди, их сбросит цикл
+            logger.exception("Failed to flush recovered step progress")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановить фоновый сброс и записать всё, что осталось в очереди."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await self.flush()
+        finally:
+            if self._spool_file is not None:
+                self._spool_file.close()
+                self._spool_file = None
+            if self._spool_lock is not None:
+                # Оставшееся после неудачного сброса заберёт recover() другого процесса
+                assert self.spool_path is not None
+                self._lock_path(self.spool_path).unlink(missing_ok=True)
+                self._spool_lock.close()
+                self._spool_lock = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._wake.wait(), timeout=self.flush_interval_seconds
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush step progress")
+
+    async def enqueue(
+        self, user_id: UUID, step_ids: Sequence[UUID]
+    ) -> tuple[list[tuple[UUID, datetime]], int]:
+        """
+        Поставить отметки в очередь. После возврата отметка подтверждена: при
+        включённом журнале она уже на диске. Возвращает (id, completed_at)
+        будущих записей в порядке step_ids (для шага, уже стоящего в очереди, —
+        той отметки) и число новых отметок.
+        """
+        if len(self) >= self.max_pending:
+            self._wake.set()
+            async with self._space:
+                try:
+                    await asyncio.wait_for(
+                        self._space.wait_for(lambda: len(self) < self.max_pending),
+                        timeout=self.full_timeout_seconds,
+                    )
+                except asyncio.TimeoutError:
+                    raise ProgressQueueFull
+
+        completed_at = datetime.utcnow()
+        async with self._lock:
+            new: Pending = {}
+            for step_id in step_ids:
+                key = (user_id, step_id)
+                if key not in self._pending and key not in self._in_flight:
+                    new.setdefault(key, (uuid4(), completed_at))
+            self._metrics.enqueued += len(new)
+            self._metrics.coalesced += len(step_ids) - len(new)
+            if new and self.spool_path is not None:
+                await self._append_to_spool(new)
+            self._pending.update(new)
+            entries = [
+                self._pending.get(key) or self._in_flight[key]
+                for key in ((user_id, step_id) for step_id in step_ids)
+            ]
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+        return entries, len(new)
+
+    def pending_step_ids(self, user_id: UUID, step_ids: Iterable[UUID]) -> set[UUID]:
+        """Шаги из step_ids, отмеченные пользователем, но ещё не записанные в БД."""
+        if not self._pending and not self._in_flight:
+            return set()
+        return {
+            step_id
+            for step_id in step_ids
+            if (user_id, step_id) in self._pending
+            or (user_id, step_id) in self._in_flight
+        }
+
+    async def _append_to_spool(self, entries: Pending) -> None:
+        assert self.spool_path is not None
+        if self._spool_file is None:
+            self._spool_file = self.spool_path.open("a", encoding="utf-8")
+        self._spool_file.write(
+            "".join(
+                json.dumps(
+                    {
+                        "id": str(progress_id),
+                        "user_id": str(user_id),
+                        "step_id": str(step_id),
+                        "completed_at": completed_at.isoformat(),
+                    }
+                )
+                + "\n"
+                for (user_id, step_id), (progress_id, completed_at) in entries.items()
+            )
+        )
+        self._spool_file.flush()
+        if self.fsync:
+            await asyncio.to_thread(os.fsync, self._spool_file.fileno())
+
+    def _rotate_spool(self) -> None:
+        """Закрыть журнал и перенести его в сегмент; новые отметки пойдут в новый."""
+        assert self.spool_path is not None
+        if self._spool_file is not None:
+            self._spool_file.close()
+            self._spool_file = None
+        if self.spool_path.exists():
+            self._add_segment(self.spool_path)
+
+    def _add_segment(self, path: Path) -> None:
+        assert self.spool_path is not None
+        # Номер различает сегменты, переименованные в одну микросекунду
+        segment = self.spool_path.with_name(
+            f"{self.spool_path.name}.{datetime.utcnow():%Y%m%d%H%M%S%f}"
+            f".{len(self._segments)}.segment"
+        )
+        os.replace(path, segment)
+        self._segments.append(segment)
+
+    @staticmethod
+    def _lock_path(journal: Path) -> Path:
+        return journal.with_name(f"{journal.name}.lock")
+
+    def _claim_spool(self) -> None:
+        """
+        Завести журнал процесса и перенести в его сегменты журналы процессов,
+        чья блокировка свободна. Всё делается под flock на каталоге: иначе
+        разбор мог бы занять .lock запускающегося процесса раньше него самого.
+        """
+        assert self.spool_base is not None
+        base = self.spool_base
+        directory = os.open(base.parent, os.O_RDONLY)
+        try:
+            fcntl.flock(directory, fcntl.LOCK_EX)
+            if self._spool_lock is None:
+                # pid воркеров из разных контейнеров на общем томе могут совпасть
+                self.spool_path = base.with_name(f"{base.name}.{uuid4().hex}")
+                self._spool_lock = self._lock_path(self.spool_path).open("a")
+                fcntl.flock(self._spool_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            pattern = re.compile(
+                rf"{re.escape(base.name)}\.([0-9a-f]{{32}})(\.lock|\..+\.segment)?"
+            )
+            owners = {
+                base.with_name(f"{base.name}.{match[1]}")
+                for path in base.parent.glob(f"{base.name}.*")
+                if (match := pattern.fullmatch(path.name))
+            }
+            assert self.spool_path is not None
+            owners.discard(self.spool_path)
+            for owner in sorted(owners):
+                # Файла блокировки нет, если владелец остановился после неудачного сброса
+                with self._lock_path(owner).open("a") as lock:
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # владелец жив
+                    for path in sorted(owner.parent.glob(f"{owner.name}.*.segment")):
+                        self._add_segment(path)
+                    if owner.exists():
+                        self._add_segment(owner)
+                    self._lock_path(owner).unlink()
+        finally:
+            os.close(directory)
+
+    async def recover(self) -> int:
+        """
+        Поставить в очередь отметки из журналов завершившихся процессов и
+        сбросить их. Вызывается из start(); заводит журнал этого процесса.
+        """
+        if self.spool_base is None:
+            return 0
+        async with self._lock:
+            await asyncio.to_thread(self._claim_spool)
+            self._rotate_spool()
+            for segment in self._segments:
+                for line in segment.read_text(encoding="utf-8").splitlines():
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Недописанная при падении строка: fsync не завершился,
+                        # значит отметка не была подтверждена
+                        continue
+                    key = (UUID(entry["user_id"]), UUID(entry["step_id"]))
+                    if key not in self._pending:
+                        self._pending[key] = (
+                            UUID(entry["id"]),
+                            datetime.fromisoformat(entry["completed_at"]),
+                        )
+                        self._metrics.recovered += 1
+        return await self.flush()
+
+    async def flush(self) -> int:
+        """Записать всё, что стоит в очереди; вернуть число новых строк."""
+        async with self._flush_lock:
+            async with self._lock:
+                if not self._pending and not self._segments:
+                    return 0
+                batch, self._pending = self._pending, {}
+                self._in_flight = batch
+                if self.spool_path is not None:
+                    self._rotate_spool()
+            try:
+                inserted = await self._write(batch)
+            except Exception:
+                self._metrics.failed_flushes += 1
+                # Вернуть отметки в очередь; сегменты удалит следующий сброс
+                async with self._lock:
+                    self._pending = batch | self._pending
+                raise
+            finally:
+                self._in_flight = {}
+                async with self._space:
+                    self._space.notify_all()
+            for segment in self._segments:
+                segment.unlink(missing_ok=True)
+            self._segments = []
+            self._metrics.flushes += 1
+            self._metrics.inserted += inserted
+            return inserted
+
+    async def _write(self, batch: Pending) -> int:
+        if not batch:
+            return 0
+        async with self.session_factory() as session:
+            # Шаг или пользователь могли быть удалены, пока отметка ждала:
+            # такая строка нарушила бы внешний ключ и сорвала весь сброс
+            course_by_step = await crud.get_course_ids_by_steps(
+                session=session, step_ids={step_id for _, step_id in batch}
+            )
+            user_ids = {user_id for user_id, _ in batch}
+            existing_users = set(
+                (
+                    await session.exec(
+                        select(User.id).where(col(User.id).in_(user_ids))
+                    )
+                ).all()
+            )
+            rows = [
+                StepProgress(
+                    id=progress_id,
+                    user_id=user_id,
+                    step_id=step_id,
+                    completed_at=completed_at,
+                )
+                # Один порядок вставки во всех сбросах снижает риск взаимоблокировок
+                for (user_id, step_id), (progress_id, completed_at) in sorted(
+                    batch.items()
+                )
+                if step_id in course_by_step and user_id in existing_users
+            ]
+            created: list[StepProgress] = []
+            for start in range(0, len(rows), self.batch_size):
+                created += await crud.insert_step_progress(
+                    session=session, rows=rows[start : start + self.batch_size]
+                )
+            await crud.record_completions(
+                session=session, created=created, course_by_step=course_by_step
+            )
+            await session.commit()
+        return len(created)
+
+    def metrics(self) -> dict[str, int]:
+        return asdict(self._metrics) | {"pending": len(self)}
+
+
+progress_queue = ProgressWriteBehind(
+    session_factory=AsyncSessionLocal,
+    spool_path=settings.PROGRESS_SPOOL_PATH,
+    batch_size=settings.PROGRESS_FLUSH_BATCH_SIZE,
+    flush_interval_seconds=settings.PROGRESS_FLUSH_INTERVAL_SECONDS,
+    max_pending=settings.PROGRESS_QUEUE_MAX_PENDING,
+    full_timeout_seconds=settings.PROGRESS_QUEUE_FULL_TIMEOUT_SECONDS,
+    fsync=settings.PROGRESS_SPOOL_FSYNC,
+)
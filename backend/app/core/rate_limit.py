@@ -0,0 +1,133 @@
+"""
+Ограничение частоты входа, регистрации и восстановления пароля.
+
+Каждое правило (RateLimit) — token bucket: в ведре capacity жетонов, они
+восполняются равномерно за period_seconds, каждый запрос забирает один.
+Ключ ведра — правило плюс IP клиента или нормализованный email, так что
+перебор паролей с одного адреса и перебор адресов против одной учётной
+записи упираются в разные вёдра. Проверка — O(1) операция над словарём и
+делается в начале обработчика, до хеширования пароля и запросов к БД.
+Отказ — RateLimitExceeded, ответ 429 с Retry-After.
+
+Вёдра хранит RateLimitBackend. InMemoryRateLimitBackend держит их в памяти
+процесса, то есть у каждого воркера свои лимиты; общий бэкенд (например,
+Redis со списанием жетона в Lua-скрипте) подключается через
+rate_limiter.use_backend(). IP берётся из request.client: за прокси uvicorn
+нужно запускать с --proxy-headers и --forwarded-allow-ips.
+"""
+
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Protocol
+
+from fastapi import Request
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    name: str
+    capacity: int
+    period_seconds: float
+
+    @property
+    def refill_per_second(self) -> float:
+        return self.capacity / self.period_seconds
+
+
+class RateLimitBackend(Protocol):
+    """Хранилище вёдер; take атомарно списывает жетон, если он есть."""
+
+    async def take(self, key: str, capacity: int, refill_per_second: float) -> float:
+        """0 — жетон списан, иначе через сколько секунд появится следующий."""
+        ...
+
+
+class InMemoryRateLimitBackend:
+    """Вёдра в памяти процесса; давно не тронутые вытесняются по LRU."""
+
+    def __init__(self, max_keys: int) -> None:
+        # key -> (жетонов, time.monotonic() последнего пересчёта)
+        self._buckets: LRUCache[str, tuple[float, float]] = LRUCache(max_keys)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    async def take(self, key: str, capacity: int, refill_per_second: float) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            # Вытесненное ведро за время простоя всё равно успело бы наполниться
+            tokens = float(capacity)
+        else:
+            tokens, updated_at = bucket
+            tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+        if tokens >= 1:
+            self._buckets.set(key, (tokens - 1, now))
+            return 0
+        self._buckets.set(key, (tokens, now))
+        return (1 - tokens) / refill_per_second
+
+
+class RateLimiter:
+    def __init__(self, backend: RateLimitBackend, *, enabled: bool = True) -> None:
+        self.backend = backend
+        self.enabled = enabled
+        # Списания и отказы по имени правила; запрос проверяет два ведра
+        self.allowed: Counter[str] = Counter()
+        self.rejected: Counter[str] = Counter()
+
+    def use_backend(self, backend: RateLimitBackend) -> None:
+        """Подключить другой бэкенд (например, общий для всех воркеров)."""
+        self.backend = backend
+
+    async def hit(self, rule: RateLimit, key: str) -> None:
+        """Списать жетон из ведра key правила rule или бросить RateLimitExceeded."""
+        if not self.enabled:
+            return
+        retry_after = await self.backend.take(
+            f"{rule.name}:{key}", rule.capacity, rule.refill_per_second
+        )
+        if retry_after:
+            self.rejected[rule.name] += 1
+            raise RateLimitExceeded(retry_after)
+        self.allowed[rule.name] += 1
+
+    async def hit_request(
+        self, request: Request, *, ip_rule: RateLimit, email_rule: RateLimit, email: str
+    ) -> None:
+        """Проверить оба ведра запроса: по IP клиента и по email."""
+        host = request.client.host if request.client else "unknown"
+        await self.hit(ip_rule, host)
+        await self.hit(email_rule, email.strip().lower())
+
+    def metrics(self) -> dict[str, int]:
+        return (
+            {"rejected": self.rejected.total()}
+            | {f"allowed_{name}": count for name, count in self.allowed.items()}
+            | {f"rejected_{name}": count for name, count in self.rejected.items()}
+        )
+
+
+LOGIN_PER_IP = RateLimit("login-ip", settings.RATE_LIMIT_LOGIN_PER_IP, 60)
+LOGIN_PER_EMAIL = RateLimit("login-email", settings.RATE_LIMIT_LOGIN_PER_EMAIL, 60)
+RECOVERY_PER_IP = RateLimit("recovery-ip", settings.RATE_LIMIT_RECOVERY_PER_IP, 3600)
+RECOVERY_PER_EMAIL = RateLimit(
+    "recovery-email", settings.RATE_LIMIT_RECOVERY_PER_EMAIL, 3600
+)
+SIGNUP_PER_IP = RateLimit("signup-ip", settings.RATE_LIMIT_SIGNUP_PER_IP, 3600)
+SIGNUP_PER_EMAIL = RateLimit("signup-email", settings.RATE_LIMIT_SIGNUP_PER_EMAIL, 3600)
+
+rate_limiter = RateLimiter(
+    InMemoryRateLimitBackend(settings.RATE_LIMIT_MAX_KEYS),
+    enabled=settings.RATE_LIMIT_ENABLED,
+)
@@ -0,0 +1,248 @@
+"""
+Отзывы refresh токенов в памяти процесса.
+
+Refresh token не хранится в БД при выдаче: это подписанный JWT с jti и
+семейством fam (id входа). При обновлении токен меняется на новый (ротация),
+а использованный jti записывается в refresh_token; уникальность token_id
+делает запись атомарной, поэтому повторное предъявление того же токена
+обнаруживается и в другом воркере. Повтор означает, что токен утёк: всё
+семейство отзывается строкой с revoked=True.
+
+Чтобы не читать БД на каждое обновление, отозванные семейства держатся в
+памяти: фильтр Блума, собранный из БД, плюс точное множество отзывов,
+появившихся после сборки (свои сразу, чужие — при синхронизации раз в
+REFRESH_TOKEN_REVOCATION_SYNC_SECONDS). Фильтр не даёт ложноотрицательных
+ответов, а при положительном БД проверяется. Отзыв в другом воркере
+становится виден здесь не позже чем через интервал синхронизации; до первой
+загрузки фильтра и при интервале 0 проверяется БД.
+
+Тот же фоновый цикл раз в REFRESH_TOKEN_PURGE_INTERVAL_SECONDS удаляет
+истёкшие строки refresh_token пачками по REFRESH_TOKEN_PURGE_BATCH_SIZE.
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Запас на расхождение часов воркеров и на транзакции, закоммиченные позже,
+# чем выставлен их created_at
+_SYNC_OVERLAP = timedelta(seconds=60)
+_MIN_FILTER_CAPACITY = 1024
+
+
+class BloomFilter:
+    """Множество строк без ложноотрицательных ответов."""
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        capacity = max(capacity, 1)
+        self.size = max(
+            math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2), 64
+        )
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> Iterator[int]:
+        # Двойное хеширование: k позиций из двух 64-битных половин одного хэша
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+@dataclass
+class RevocationMetrics:
+    checks: int = 0
+    db_checks: int = 0  # проверки, которые фильтр отправил в БД
+    rebuilds: int = 0
+    syncs: int = 0
+    failed_syncs: int = 0
+    purged: int = 0
+
+
+class RefreshTokenRevocations:
+    def __init__(
+        self,
+        *,
+        session_factory: Callable[[], AsyncSession],
+        sync_interval_seconds: float,
+        rebuild_interval_seconds: float,
+        error_rate: float,
+        purge_interval_seconds: float,
+        purge_batch_size: int,
+    ) -> None:
+        self.session_factory = session_factory
+        self.sync_interval_seconds = sync_interval_seconds
+        self.rebuild_interval_seconds = rebuild_interval_seconds
+        self.error_rate = error_rate
+        self.purge_interval_seconds = purge_interval_seconds
+        self.purge_batch_size = purge_batch_size
+        self._metrics = RevocationMetrics()
+        self._bloom: BloomFilter | None = None  # None — фильтр не загружен
+        self._bloom_size = 0
+        # Отзывы после сборки фильтра: family_id -> time.monotonic() добавления
+        self._recent: dict[str, float] = {}
+        self._rebuilt_at = 0.0
+        # datetime.utcnow() начала последней синхронизации
+        self._synced_at: datetime | None = None
+        self._purged_at: float | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.sync_interval_seconds > 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def might_be_revoked(self, family_id: str) -> bool:
+        """False — семейство точно не отозвано (по состоянию на синхронизацию)."""
+        self._metrics.checks += 1
+        if self._bloom is None or family_id in self._recent or family_id in self._bloom:
+            self._metrics.db_checks += 1
+            return True
+        return False
+
+    def add(self, family_id: str) -> None:
+        """Учесть отзыв, уже закоммиченный в БД этим процессом."""
+        self._recent[family_id] = time.monotonic()
+
+    async def start(self) -> None:
+        if self.enabled:
+            try:
+                await self.rebuild()
+            except Exception:
+                # Пока фильтр не загружен, каждое обновление проверяет БД
+                logger.exception("Failed to load refresh token revocations")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        interval = (
+            self.sync_interval_seconds if self.enabled else self.purge_interval_seconds
+        )
+        while True:
+            await asyncio.sleep(interval)
+            if self.enabled:
+                try:
+                    if (
+                        self._bloom is None
+                        or time.monotonic() - self._rebuilt_at
+                        >= self.rebuild_interval_seconds
+                    ):
+                        await self.rebuild()
+                    else:
+                        await self.sync()
+                except Exception:
+                    self._metrics.failed_syncs += 1
+                    logger.exception("Failed to sync refresh token revocations")
+            now = time.monotonic()
+            if (
+                self._purged_at is None
+                or now - self._purged_at >= self.purge_interval_seconds
+            ):
+                self._purged_at = now
+                try:
+                    await self.purge()
+                except Exception:
+                    logger.exception("Failed to purge expired refresh tokens")
+
+    async def rebuild(self) -> None:
+        """Собрать фильтр заново из всех действующих отзывов в БД."""
+        started = time.monotonic()
+        synced_at = datetime.utcnow()
+        async with self.session_factory() as session:
+            family_ids = await crud.get_revoked_refresh_token_families(session=session)
+        bloom = BloomFilter(max(len(family_ids), _MIN_FILTER_CAPACITY), self.error_rate)
+        for family_id in family_ids:
+            bloom.add(family_id)
+        self._bloom = bloom
+        self._bloom_size = len(family_ids)
+        # Отзывы, добавленные до начала сборки, уже попали в фильтр из БД
+        self._recent = {
+            family_id: added_at
+            for family_id, added_at in self._recent.items()
+            if added_at >= started
+        }
+        self._rebuilt_at = started
+        self._synced_at = synced_at
+        self._metrics.rebuilds += 1
+
+    async def sync(self) -> None:
+        """Дописать отзывы, появившиеся в БД с прошлой синхронизации."""
+        if self._synced_at is None:
+            await self.rebuild()
+            return
+        synced_at = datetime.utcnow()
+        async with self.session_factory() as session:
+            family_ids = await crud.get_revoked_refresh_token_families(
+                session=session, since=self._synced_at - _SYNC_OVERLAP
+            )
+        now = time.monotonic()
+        for family_id in family_ids:
+            self._recent.setdefault(family_id, now)
+        self._synced_at = synced_at
+        self._metrics.syncs += 1
+
+    async def purge(self) -> int:
+        """Удалить истёкшие строки refresh_token; вернуть их число."""
+        purged = 0
+        while True:
+            async with self.session_factory() as session:
+                deleted = await crud.purge_expired_refresh_tokens(
+                    session=session, batch_size=self.purge_batch_size
+                )
+                await session.commit()
+            purged += deleted
+            self._metrics.purged += deleted
+            if deleted < self.purge_batch_size:
+                return purged
+
+    def metrics(self) -> dict[str, int]:
+        return asdict(self._metrics) | {
+            "filter_entries": self._bloom_size,
+            "recent": len(self._recent),
+        }
+
+
+refresh_token_revocations = RefreshTokenRevocations(
+    session_factory=AsyncSessionLocal,
+    sync_interval_seconds=settings.REFRESH_TOKEN_REVOCATION_SYNC_SECONDS,
+    rebuild_interval_seconds=settings.REFRESH_TOKEN_FILTER_REBUILD_SECONDS,
+    error_rate=settings.REFRESH_TOKEN_FILTER_ERROR_RATE,
+    purge_interval_seconds=settings.REFRESH_TOKEN_PURGE_INTERVAL_SECONDS,
+    purge_batch_size=settings.REFRESH_TOKEN_PURGE_BATCH_SIZE,
+)
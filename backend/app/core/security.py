@@ -1,5 +1,8 @@
+import asyncio
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any
+from typing import Any, Literal, TypeVar
 from uuid import UUID
 
 import jwt
@@ -7,7 +10,51 @@ from passlib.context import CryptContext
 
 from app.core.config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+PasswordHashScheme = Literal["bcrypt", "argon2"]
+
+
+def build_pwd_context(
+    *,
+    scheme: PasswordHashScheme,
+    bcrypt_rounds: int,
+    argon2_time_cost: int,
+    argon2_memory_cost_kib: int,
+    argon2_parallelism: int,
+) -> CryptContext:
+    """
+    Новые хеши — схемой scheme с заданной стоимостью. Хеши остальных схем и
+    хеши с другой стоимостью проверяются, но needs_update для них истинно.
+    MissingBackendError — для scheme не установлен пакет (argon2-cffi для
+    argon2): без него каждый вход падал бы с 500, поэтому приложение с такой
+    настройкой не стартует.
+    """
+    context = CryptContext(
+        schemes=[scheme, *(other for other in ("bcrypt", "argon2") if other != scheme)],
+        default=scheme,
+        deprecated="auto",
+        bcrypt__default_rounds=bcrypt_rounds,
+        bcrypt__min_rounds=bcrypt_rounds,
+        bcrypt__max_rounds=bcrypt_rounds,
+        argon2__type="ID",
+        argon2__default_rounds=argon2_time_cost,
+        argon2__min_rounds=argon2_time_cost,
+        argon2__max_rounds=argon2_time_cost,
+        argon2__memory_cost=argon2_memory_cost_kib,
+        argon2__parallelism=argon2_parallelism,
+    )
+    context.handler(scheme).get_backend()
+    return context
+
+
+pwd_context = build_pwd_context(
+    scheme=settings.PASSWORD_HASH_SCHEME,
+    bcrypt_rounds=settings.BCRYPT_ROUNDS,
+    argon2_time_cost=settings.ARGON2_TIME_COST,
+    argon2_memory_cost_kib=settings.ARGON2_MEMORY_COST_KIB,
+    argon2_parallelism=settings.ARGON2_PARALLELISM,
+)
+
+T = TypeVar("T")
 
 
 ALGORITHM = "HS256"
@@ -20,12 +67,21 @@ def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
     return encoded_jwt
 
 
-def create_refresh_token(subject: str | Any, expires_delta: timedelta, jti: str) -> str:
+def create_refresh_token(
+    subject: str | Any, expires_delta: timedelta, jti: str, family_id: str
+) -> str:
     """
-    Создать refresh token с уникальным идентификатором (jti)
+    Создать refresh token с уникальным идентификатором (jti). Все токены,
+    полученные ротацией из одного входа, несут один family_id (claim fam).
     """
     expire = datetime.utcnow() + expires_delta
-    to_encode = {"exp": expire, "sub": str(subject), "type": "refresh", "jti": jti}
+    to_encode = {
+        "exp": expire,
+        "sub": str(subject),
+        "type": "refresh",
+        "jti": jti,
+        "fam": family_id,
+    }
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -47,5 +103,71 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    """Проверить пароль; если хеш устарел, вернуть и новый хеш по текущей политике."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+class PasswordHashingBusy(Exception):
+    """Очередь хеширования паролей заполнена; запрос стоит повторить позже."""
+
+
+class PasswordHasher:
+    """
+    Хеширование и проверка паролей вне цикла событий. bcrypt и argon2 занимают
+    сотни миллисекунд процессора и на это время отпускают GIL, поэтому хватает
+    потоков: одновременно считается не больше max_workers хешей, остальные
+    ждут в очереди. Если ждущих и считающихся уже max_pending, новая операция
+    сразу получает PasswordHashingBusy (ответ 429), а не растит очередь.
+    """
+
+    def __init__(self, *, max_workers: int, max_pending: int) -> None:
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: ThreadPoolExecutor | None = None
+        self._pending = 0  # меняется только из цикла событий
+
+    def __len__(self) -> int:
+        return self._pending
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        if self._pending >= self.max_pending:
+            raise PasswordHashingBusy
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                self.max_workers, thread_name_prefix="password-hash"
+            )
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+
+password_hasher = PasswordHasher(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.run(verify_password, plain_password, hashed_password)
+
+
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    return await password_hasher.run(
+        verify_and_update_password, plain_password, hashed_password
+    )
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.run(get_password_hash, password)
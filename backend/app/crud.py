@@ -1,18 +1,47 @@
+from collections import Counter
+from collections.abc import Iterable, Mapping, Sequence
+from datetime import datetime, timedelta
 from typing import Any
+from uuid import UUID, uuid4
 
-from sqlmodel import select
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg, insert
+from sqlalchemy.orm import defer
+from sqlmodel import col, delete, func, select, update
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.core.security import get_password_hash, verify_password
-from app.models import User, UserCreate, UserUpdate
+from app import queries
+from app.core.config import settings
+from app.core.security import (
+    get_password_hash_async,
+    verify_and_update_password_async,
+)
+from app.models import (
+    Course,
+    CourseFavoriteLink,
+    CourseOutline,
+    CourseProgress,
+    CourseProgressPublic,
+    CourseStats,
+    CourseStudentLink,
+    Lesson,
+    LessonOutline,
+    Module,
+    ModuleOutline,
+    RefreshToken,
+    Step,
+    StepOutline,
+    StepProgress,
+    User,
+    UserCreate,
+    UserUpdate,
+)
 
 # Async versions
 
 
 async def get_user_by_email(*, session: AsyncSession, email: str) -> User | None:
-    statement = select(User).where(User.email == email)
-    result = await session.exec(statement)  # type: ignore[arg-type]
-    return result.first()
+    result = await session.exec(queries.user_by_email(email))
+    return result.scalars().first()
 
 
 async def authenticate(
@@ -21,14 +50,23 @@ async def authenticate(
     db_user = await get_user_by_email(session=session, email=email)
     if not db_user:
         return None
-    if not verify_password(password, db_user.hashed_password):
+    verified, new_hash = await verify_and_update_password_async(
+        password, db_user.hashed_password
+    )
+    if not verified:
         return None
+    if new_hash:
+        # Хеш старой схемы или стоимости: пароль известен только сейчас
+        db_user.hashed_password = new_hash
+        session.add(db_user)
+        await session.commit()
     return db_user
 
 
 async def create_user(*, session: AsyncSession, user_create: UserCreate) -> User:
+    hashed_password = await get_password_hash_async(user_create.password)
     db_obj = User.model_validate(
-        user_create, update={"hashed_password": get_password_hash(user_create.password)}
+        user_create, update={"hashed_password": hashed_password}
     )
     session.add(db_obj)
     await session.commit()
@@ -43,10 +81,526 @@ async def update_user(
     extra_data = {}
     if "password" in user_data:
         password = user_data["password"]
-        hashed_password = get_password_hash(password)
+        hashed_password = await get_password_hash_async(password)
         extra_data["hashed_password"] = hashed_password
     db_user.sqlmodel_update(user_data, update=extra_data)
     session.add(db_user)
     await session.commit()
     await session.refresh(db_user)
     return db_user
+
+
+# Course statistics
+
+
+async def update_course_stats(
+    *, session: AsyncSession, course_id: UUID, **deltas: int
+) -> None:
+    """
+    Атомарно прибавить deltas к счётчикам course_stats (строка создаётся при
+    первом обращении). Коммит остаётся за вызывающим кодом.
+    """
+    statement = insert(CourseStats).values(course_id=course_id, **deltas)
+    statement = statement.on_conflict_do_update(
+        index_elements=[col(CourseStats.course_id)],
+        set_={
+            field: getattr(CourseStats, field) + statement.excluded[field]
+            for field in deltas
+        },
+    )
+    await session.exec(statement)  # type: ignore[call-overload]
+
+
+async def get_course_id_by_lesson(
+    *, session: AsyncSession, lesson_id: UUID
+) -> UUID | None:
+    statement = (
+        select(Module.course_id)
+        .join(Lesson, col(Lesson.module_id) == col(Module.id))
+        .where(col(Lesson.id) == lesson_id)
+    )
+    return (await session.exec(statement)).first()
+
+
+async def get_course_outline(
+    *, session: AsyncSession, course_id: UUID
+) -> CourseOutline:
+    """
+    Собрать дерево модулей, уроков и шагов курса одним запросом. Content шагов
+    не читается, прогресс пользователя не учитывается: результат одинаков для
+    всех пользователей и зависит только от структуры курса.
+    """
+    statement = (
+        select(
+            Module,
+            Lesson,
+            Step.id,
+            Step.title,
+            Step.step_type,
+            Step.position,
+        )
+        .outerjoin(Lesson, col(Lesson.module_id) == col(Module.id))
+        .outerjoin(Step, col(Step.lesson_id) == col(Lesson.id))
+        .where(col(Module.course_id) == course_id)
+        .order_by(
+            col(Module.position),
+            col(Module.id),
+            col(Lesson.position),
+            col(Lesson.id),
+            col(Step.position),
+            col(Step.id),
+        )
+    )
+    rows = (await session.exec(statement)).all()  # type: ignore[call-overload]
+
+    modules: dict[UUID, ModuleOutline] = {}
+    lessons: dict[UUID, LessonOutline] = {}
+    for module, lesson, step_id, step_title, step_type, step_position in rows:
+        module_outline = modules.get(module.id)
+        if module_outline is None:
+            module_outline = ModuleOutline(**module.model_dump())
+            modules[module.id] = module_outline
+        if lesson is None:
+            continue
+        lesson_outline = lessons.get(lesson.id)
+        if lesson_outline is None:
+            lesson_outline = LessonOutline(**lesson.model_dump())
+            lessons[lesson.id] = lesson_outline
+            module_outline.lessons.append(lesson_outline)
+        if step_id is None:
+            continue
+        lesson_outline.steps.append(
+            StepOutline(
+                id=step_id,
+                title=step_title,
+                step_type=step_type,
+                position=step_position,
+            )
+        )
+    return CourseOutline(course_id=course_id, modules=list(modules.values()))
+
+
+async def get_completed_step_ids(
+    *, session: AsyncSession, user_id: UUID, course_id: UUID
+) -> set[UUID]:
+    """Шаги курса, пройденные пользователем."""
+    statement = queries.course_completed_step_ids(user_id, course_id)
+    return set((await session.exec(statement)).scalars().all())
+
+
+async def complete_steps(
+    *, session: AsyncSession, user_id: UUID, step_ids: Sequence[UUID]
+) -> list[StepProgress]:
+    """
+    Отметить шаги пройденными одним INSERT ... ON CONFLICT DO NOTHING.
+    Возвращает только созданные записи: уже пройденные шаги (в том числе
+    отмеченные параллельным запросом) пропускаются без ошибки. Коммит
+    остаётся за вызывающим кодом.
+    """
+    completed_at = datetime.utcnow()
+    return await insert_step_progress(
+        session=session,
+        rows=[
+            StepProgress(user_id=user_id, step_id=step_id, completed_at=completed_at)
+            for step_id in dict.fromkeys(step_ids)
+        ],
+    )
+
+
+async def insert_step_progress(
+    *, session: AsyncSession, rows: Sequence[StepProgress]
+) -> list[StepProgress]:
+    """
+    Вставить отметки (возможно, разных пользователей) одним запросом,
+    пропуская уже существующие пары (user_id, step_id). Объекты rows в сессию
+    не добавляются; возвращаются созданные записи.
+    """
+    if not rows:
+        return []
+    statement = (
+        insert(StepProgress)
+        .values(
+            [
+                {
+                    "id": row.id,
+                    "user_id": row.user_id,
+                    "step_id": row.step_id,
+                    "completed_at": row.completed_at,
+                }
+                for row in rows
+            ]
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "step_id"])
+        .returning(StepProgress)
+    )
+    result = await session.exec(statement)  # type: ignore[call-overload]
+    return list(result.scalars().all())
+
+
+async def get_course_ids_by_steps(
+    *, session: AsyncSession, step_ids: Iterable[UUID]
+) -> dict[UUID, UUID]:
+    """step_id -> course_id; удалённых шагов в результате нет."""
+    statement = (
+        select(Step.id, Module.course_id)
+        .join(Lesson, col(Lesson.id) == col(Step.lesson_id))
+        .join(Module, col(Module.id) == col(Lesson.module_id))
+        .where(col(Step.id).in_(list(step_ids)))
+    )
+    return dict((await session.exec(statement)).all())
+
+
+async def record_completions(
+    *,
+    session: AsyncSession,
+    created: Sequence[StepProgress],
+    course_by_step: Mapping[UUID, UUID],
+) -> None:
+    """
+    Учесть новые отметки в агрегатах: completions_count курса и course_progress
+    ученика (число пройденных шагов, последний шаг). Коммит остаётся за
+    вызывающим кодом.
+    """
+    if not created:
+        return
+    completions = Counter(course_by_step[row.step_id] for row in created)
+    for course_id, count in completions.items():
+        await update_course_stats(
+            session=session, course_id=course_id, completions_count=count
+        )
+
+    progress: dict[tuple[UUID, UUID], dict[str, Any]] = {}
+    for row in created:
+        course_id = course_by_step[row.step_id]
+        entry = progress.setdefault(
+            (row.user_id, course_id),
+            {"user_id": row.user_id, "course_id": course_id, "completed_steps": 0},
+        )
+        entry["completed_steps"] += 1
+        if entry.get("last_activity_at") is None or (
+            row.completed_at >= entry["last_activity_at"]
+        ):
+            entry["last_step_id"] = row.step_id
+            entry["last_activity_at"] = row.completed_at
+    statement = insert(CourseProgress).values(
+        [progress[key] for key in sorted(progress)]
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[col(CourseProgress.user_id), col(CourseProgress.course_id)],
+        set_={
+            "completed_steps": col(CourseProgress.completed_steps)
+            + statement.excluded.completed_steps,
+            "last_step_id": statement.excluded.last_step_id,
+            "last_activity_at": statement.excluded.last_activity_at,
+        },
+    )
+    await session.exec(statement)  # type: ignore[call-overload]
+
+
+def _completed_steps_count(user_id: Any, course_id: Any) -> Any:
+    """Подзапрос: сколько шагов курса пройдено пользователем."""
+    return (
+        select(func.count())
+        .select_from(StepProgress)
+        .join(Step, col(Step.id) == col(StepProgress.step_id))
+        .join(Lesson, col(Lesson.id) == col(Step.lesson_id))
+        .join(Module, col(Module.id) == col(Lesson.module_id))
+        .where(col(StepProgress.user_id) == user_id, col(Module.course_id) == course_id)
+        .scalar_subquery()
+    )
+
+
+async def delete_steps_progress(
+    *, session: AsyncSession, course_id: UUID, step_ids: Sequence[UUID]
+) -> None:
+    """
+    Удалить отметки о прохождении шагов, которые сейчас будут удалены, и
+    пересчитать course_progress затронутых учеников и completions_count
+    курса. Вызывается до удаления шагов; коммит остаётся за вызывающим кодом.
+    """
+    if not step_ids:
+        return
+    statement = (
+        delete(StepProgress)
+        .where(col(StepProgress.step_id).in_(step_ids))
+        .returning(col(StepProgress.user_id))
+    )
+    user_ids = (await session.exec(statement)).scalars().all()  # type: ignore[call-overload]
+    if not user_ids:
+        return
+    await session.exec(  # type: ignore[call-overload]
+        update(CourseProgress)
+        .where(
+            col(CourseProgress.course_id) == course_id,
+            col(CourseProgress.user_id).in_(set(user_ids)),
+        )
+        .values(
+            completed_steps=_completed_steps_count(
+                CourseProgress.user_id, CourseProgress.course_id
+            )
+        )
+    )
+    await update_course_stats(
+        session=session, course_id=course_id, completions_count=-len(user_ids)
+    )
+
+
+async def get_courses_progress(
+    *, session: AsyncSession, user_id: UUID, course_ids: Sequence[UUID]
+) -> dict[UUID, CourseProgressPublic]:
+    """Прогресс пользователя по курсам одним запросом по первичным ключам."""
+    if not course_ids:
+        return {}
+    result = await session.exec(queries.courses_progress(user_id, course_ids))
+    progress = {}
+    for course_id, total, completed, last_step_id, last_activity_at in result:
+        completed = completed or 0
+        progress[course_id] = CourseProgressPublic(
+            completed_steps=completed,
+            total_steps=total,
+            percent=round(min(completed / total, 1) * 100, 1) if total else 0,
+            last_step_id=last_step_id,
+            last_activity_at=last_activity_at,
+        )
+    return progress
+
+
+async def get_lesson_author_id(
+    *, session: AsyncSession, lesson_id: UUID
+) -> UUID | None:
+    """Автор курса, в который входит урок; None — урока нет."""
+    statement = (
+        select(Course.author_id)
+        .join(Module, col(Module.course_id) == col(Course.id))
+        .join(Lesson, col(Lesson.module_id) == col(Module.id))
+        .where(col(Lesson.id) == lesson_id)
+    )
+    return (await session.exec(statement)).first()
+
+
+async def find_author_steps(
+    *,
+    session: AsyncSession,
+    author_id: UUID,
+    contains: dict[str, Any],
+    limit: int = 100,
+) -> Sequence[Step]:
+    """
+    Шаги курсов автора, content которых содержит contains (content @> contains,
+    индекс ix_step_content). Например, {"language": "python"} или
+    {"images": [url]}. Content в результате не загружается.
+    """
+    statement = (
+        select(Step)
+        .options(defer(Step.content, raiseload=True))  # type: ignore[arg-type]
+        .join(Lesson, col(Lesson.id) == col(Step.lesson_id))
+        .join(Module, col(Module.id) == col(Lesson.module_id))
+        .join(Course, col(Course.id) == col(Module.course_id))
+        .where(
+            col(Course.author_id) == author_id,
+            col(Step.content).contains(contains),
+        )
+        .order_by(col(Step.id))
+        .limit(limit)
+    )
+    return (await session.exec(statement)).all()
+
+
+def _course_stats_columns(course_id: Any) -> dict[str, Any]:
+    """Подзапросы, считающие статистику курса с нуля."""
+    return {
+        "students_count": select(func.count())
+        .select_from(CourseStudentLink)
+        .where(col(CourseStudentLink.course_id) == course_id)
+        .scalar_subquery(),
+        "favorites_count": select(func.count())
+        .select_from(CourseFavoriteLink)
+        .where(col(CourseFavoriteLink.course_id) == course_id)
+        .scalar_subquery(),
+        "modules_count": select(func.count())
+        .select_from(Module)
+        .where(col(Module.course_id) == course_id)
+        .scalar_subquery(),
+        "lessons_count": select(func.count())
+        .select_from(Lesson)
+        .join(Module, col(Module.id) == col(Lesson.module_id))
+        .where(col(Module.course_id) == course_id)
+        .scalar_subquery(),
+        "steps_count": select(func.count())
+        .select_from(Step)
+        .join(Lesson, col(Lesson.id) == col(Step.lesson_id))
+        .join(Module, col(Module.id) == col(Lesson.module_id))
+        .where(col(Module.course_id) == course_id)
+        .scalar_subquery(),
+        "completions_count": select(func.count())
+        .select_from(StepProgress)
+        .join(Step, col(Step.id) == col(StepProgress.step_id))
+        .join(Lesson, col(Lesson.id) == col(Step.lesson_id))
+        .join(Module, col(Module.id) == col(Lesson.module_id))
+        .where(col(Module.course_id) == course_id)
+        .scalar_subquery(),
+    }
+
+
+async def refresh_course_structure_stats(
+    *, session: AsyncSession, course_id: UUID
+) -> None:
+    """
+    Пересчитать счётчики структуры курса (модули, уроки, шаги). Используется
+    после каскадных удалений, когда дельту заранее не узнать.
+    """
+    columns = _course_stats_columns(course_id)
+    structure = {
+        field: columns[field]
+        for field in ("modules_count", "lessons_count", "steps_count")
+    }
+    statement = insert(CourseStats).values(course_id=course_id, **structure)
+    statement = statement.on_conflict_do_update(
+        index_elements=[col(CourseStats.course_id)],
+        set_={field: statement.excluded[field] for field in structure},
+    )
+    await session.exec(statement)  # type: ignore[call-overload]
+
+
+async def rebuild_course_stats(*, session: AsyncSession) -> None:
+    """Полностью пересобрать таблицу course_stats по исходным данным."""
+    columns = _course_stats_columns(Course.id)
+    await session.exec(delete(CourseStats))  # type: ignore[call-overload]
+    statement = insert(CourseStats).from_select(
+        ["course_id", *columns], select(col(Course.id), *columns.values())
+    )
+    await session.exec(statement)  # type: ignore[call-overload]
+    await session.commit()
+
+
+async def rebuild_course_progress(*, session: AsyncSession) -> None:
+    """Полностью пересобрать таблицу course_progress по step_progress."""
+    await session.exec(delete(CourseProgress))  # type: ignore[call-overload]
+    aggregates = (
+        select(
+            col(StepProgress.user_id),
+            col(Module.course_id),
+            func.count(),
+            array_agg(
+                aggregate_order_by(
+                    col(StepProgress.step_id), col(StepProgress.completed_at).desc()
+                )
+            )[1],
+            func.max(StepProgress.completed_at),
+        )
+        .join(Step, col(Step.id) == col(StepProgress.step_id))
+        .join(Lesson, col(Lesson.id) == col(Step.lesson_id))
+        .join(Module, col(Module.id) == col(Lesson.module_id))
+        .group_by(col(StepProgress.user_id), col(Module.course_id))
+    )
+    statement = insert(CourseProgress).from_select(
+        [
+            "user_id",
+            "course_id",
+            "completed_steps",
+            "last_step_id",
+            "last_activity_at",
+        ],
+        aggregates,
+    )
+    await session.exec(statement)  # type: ignore[call-overload]
+    await session.commit()
+
+
+async def use_refresh_token(
+    *,
+    session: AsyncSession,
+    user_id: UUID,
+    token_id: str,
+    family_id: str,
+    expires_at: datetime,
+) -> bool:
+    """
+    Отметить refresh token использованным. False — токен уже использовали
+    (уникальность token_id делает проверку атомарной между воркерами).
+    """
+    statement = (
+        insert(RefreshToken)
+        .values(
+            id=uuid4(),
+            user_id=user_id,
+            token_id=token_id,
+            family_id=family_id,
+            expires_at=expires_at,
+            created_at=datetime.utcnow(),
+            revoked=False,
+        )
+        .on_conflict_do_nothing(index_elements=["token_id"])
+        .returning(col(RefreshToken.id))
+    )
+    result = await session.exec(statement)  # type: ignore[call-overload]
+    return result.first() is not None
+
+
+async def revoke_refresh_token_family(
+    *, session: AsyncSession, user_id: UUID, family_id: str
+) -> None:
+    """
+    Отозвать все refresh токены семейства. Любой его токен выдан не позже
+    текущего момента, поэтому запись нужна не дольше REFRESH_TOKEN_EXPIRE_DAYS.
+    """
+    now = datetime.utcnow()
+    statement = insert(RefreshToken).values(
+        id=uuid4(),
+        user_id=user_id,
+        token_id=family_id,
+        family_id=family_id,
+        expires_at=now + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+        created_at=now,
+        revoked=True,
+    )
+    # У токенов, выданных до ротации, family_id совпадает с jti, и строка
+    # использованного токена уже может быть. created_at обновляется, чтобы
+    # отзыв увидела инкрементальная синхронизация фильтра
+    statement = statement.on_conflict_do_update(
+        index_elements=[col(RefreshToken.token_id)],
+        set_={
+            field: statement.excluded[field]
+            for field in ("revoked", "expires_at", "created_at")
+        },
+    )
+    await session.exec(statement)  # type: ignore[call-overload]
+
+
+async def is_refresh_token_family_revoked(
+    *, session: AsyncSession, family_id: str
+) -> bool:
+    statement = select(RefreshToken.id).where(
+        RefreshToken.token_id == family_id, col(RefreshToken.revoked)
+    )
+    return (await session.exec(statement)).first() is not None
+
+
+async def get_revoked_refresh_token_families(
+    *, session: AsyncSession, since: datetime | None = None
+) -> list[str]:
+    """Действующие отзывы семейств; since — только записанные не раньше."""
+    statement = select(RefreshToken.token_id).where(
+        col(RefreshToken.revoked), RefreshToken.expires_at > datetime.utcnow()
+    )
+    if since is not None:
+        statement = statement.where(RefreshToken.created_at >= since)
+    return list((await session.exec(statement)).all())
+
+
+async def purge_expired_refresh_tokens(
+    *, session: AsyncSession, batch_size: int
+) -> int:
+    """
+    Удалить до batch_size истёкших строк refresh_token; вернуть их число.
+    Строки, которые удаляет параллельная очистка другого воркера, пропускаются.
+    """
+    expired = (
+        select(RefreshToken.id)
+        .where(RefreshToken.expires_at < datetime.utcnow())
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    statement = delete(RefreshToken).where(col(RefreshToken.id).in_(expired))
+    result = await session.exec(statement)  # type: ignore[call-overload]
+    return int(result.rowcount)
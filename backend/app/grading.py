@@ -0,0 +1,179 @@
+"""
+Проверка ответов на шаги с известным ключом (QUIZ, MATCHING, SORTING, TABLE,
+FILL_BLANKS, STRING, NUMBER).
+
+Ключ ответа из content один раз компилируется в компактный Checker: строки
+заранее нормализованы, варианты собраны в множества, числовой ответ — в
+диапазон с учётом погрешности. Checker кэшируется по (step_id, Step.version),
+поэтому проверка ответа — операция в памяти без разбора content. Правка шага
+увеличивает version, и старый Checker больше не запрашивается.
+
+Ответ клиента (поле answer) для каждого типа:
+    QUIZ        — индексы выбранных вариантов (list[int]) или один индекс
+    MATCHING    — {left: right} для всех пар
+    SORTING     — индексы элементов в выбранном порядке
+    TABLE       — строки таблицы со значениями ячеек (list[list[str]])
+    FILL_BLANKS — значения пропусков в порядке blanks
+    STRING      — строка
+    NUMBER      — число или строка с числом ("3,14" тоже допускается)
+"""
+
+from collections.abc import Callable
+from typing import Any
+from uuid import UUID
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.models import StepType
+from app.schemas.step_content import (
+    FillBlanksStepContent,
+    MatchingStepContent,
+    NumberStepContent,
+    QuizStepContent,
+    SortingStepContent,
+    StringStepContent,
+    TableStepContent,
+    step_content_adapter,
+)
+
+Checker = Callable[[Any], bool]
+
+
+class InvalidAnswer(ValueError):
+    """Ответ не подходит по форме к типу шага."""
+
+
+def normalize(value: Any, *, case_sensitive: bool = False) -> str:
+    """Схлопнуть пробелы и, если регистр не важен, привести к одному регистру."""
+    if not isinstance(value, str):
+        raise InvalidAnswer("Expected a string")
+    value = " ".join(value.split())
+    return value if case_sensitive else value.casefold()
+
+
+def _int_list(answer: Any) -> list[int]:
+    if not isinstance(answer, list) or not all(
+        isinstance(item, int) and not isinstance(item, bool) for item in answer
+    ):
+        raise InvalidAnswer("Expected a list of integers")
+    return answer
+
+
+def _compile_quiz(content: QuizStepContent) -> Checker:
+    correct = frozenset(
+        i for i, option in enumerate(content.options) if option.is_correct
+    )
+
+    def check(answer: Any) -> bool:
+        if isinstance(answer, int) and not isinstance(answer, bool):
+            answer = [answer]
+        return set(_int_list(answer)) == correct
+
+    return check
+
+
+def _compile_matching(content: MatchingStepContent) -> Checker:
+    correct = {normalize(pair.left): normalize(pair.right) for pair in content.pairs}
+
+    def check(answer: Any) -> bool:
+        if not isinstance(answer, dict):
+            raise InvalidAnswer("Expected an object {left: right}")
+        given = {normalize(left): normalize(right) for left, right in answer.items()}
+        return given == correct
+
+    return check
+
+
+def _compile_sorting(content: SortingStepContent) -> Checker:
+    correct = list(content.correct_order)
+
+    def check(answer: Any) -> bool:
+        return _int_list(answer) == correct
+
+    return check
+
+
+def _compile_table(content: TableStepContent) -> Checker:
+    correct = [[normalize(cell) for cell in row] for row in content.correct_answers]
+
+    def check(answer: Any) -> bool:
+        if not isinstance(answer, list) or not all(
+            isinstance(row, list) for row in answer
+        ):
+            raise InvalidAnswer("Expected a list of rows")
+        return [[normalize(cell) for cell in row] for row in answer] == correct
+
+    return check
+
+
+def _compile_fill_blanks(content: FillBlanksStepContent) -> Checker:
+    correct = [
+        (
+            normalize(blank.answer, case_sensitive=blank.case_sensitive),
+            blank.case_sensitive,
+        )
+        for blank in content.blanks
+    ]
+
+    def check(answer: Any) -> bool:
+        if not isinstance(answer, list) or len(answer) != len(correct):
+            raise InvalidAnswer(f"Expected a list of {len(correct)} strings")
+        return all(
+            normalize(value, case_sensitive=case_sensitive) == expected
+            for value, (expected, case_sensitive) in zip(answer, correct, strict=True)
+        )
+
+    return check
+
+
+def _compile_string(content: StringStepContent) -> Checker:
+    case_sensitive = content.case_sensitive
+    correct = normalize(content.answer, case_sensitive=case_sensitive)
+
+    def check(answer: Any) -> bool:
+        return normalize(answer, case_sensitive=case_sensitive) == correct
+
+    return check
+
+
+def _compile_number(content: NumberStepContent) -> Checker:
+    low = content.answer - abs(content.tolerance)
+    high = content.answer + abs(content.tolerance)
+
+    def check(answer: Any) -> bool:
+        if isinstance(answer, str):
+            try:
+                answer = float(answer.strip().replace(",", "."))
+            except ValueError:
+                raise InvalidAnswer("Expected a number")
+        if not isinstance(answer, int | float) or isinstance(answer, bool):
+            raise InvalidAnswer("Expected a number")
+        return low <= answer <= high
+
+    return check
+
+
+COMPILERS: dict[StepType, Callable[[Any], Checker]] = {
+    StepType.QUIZ: _compile_quiz,
+    StepType.MATCHING: _compile_matching,
+    StepType.SORTING: _compile_sorting,
+    StepType.TABLE: _compile_table,
+    StepType.FILL_BLANKS: _compile_fill_blanks,
+    StepType.STRING: _compile_string,
+    StepType.NUMBER: _compile_number,
+}
+
+
+def is_auto_graded(step_type: StepType) -> bool:
+    return step_type in COMPILERS
+
+
+def compile_checker(step_type: StepType, content: dict[str, Any]) -> Checker:
+    """Собрать Checker по content шага; content проверяется схемой типа."""
+    parsed = step_content_adapter(step_type).validate_python(content)
+    return COMPILERS[step_type](parsed)
+
+
+checker_cache: LRUCache[tuple[UUID, int], Checker] = LRUCache(
+    settings.GRADING_CACHE_MAX_ENTRIES
+)
@@ -0,0 +1,536 @@
+"""
+Проверка решений CODE-шагов на тестах шага.
+
+Решение запускается в отдельном процессе интерпретатора (python -I -S, без
+site-packages и переменных окружения). Процесс стартует через TRAMPOLINE —
+отдельный интерпретатор, который выставляет ограничения (процессорное время
+RLIMIT_CPU, адресное пространство RLIMIT_AS, запись в файлы RLIMIT_FSIZE=0,
+число дескрипторов), переносится в новые пространства имён пользователей и
+сети (без сетевых интерфейсов) и заменяет себя интерпретатором с BOOTSTRAP.
+Если пространство имён создать не удалось, запуск считается сбоем проверки:
+решение не выполняется без изоляции сети. Там, где непривилегированные
+пространства имён недоступны (например, в контейнере Docker с профилем
+seccomp по умолчанию), воркеры нужно запускать в контейнере без сети и
+выключать изоляцию явно: JUDGE_ISOLATE_NETWORK=false.
+
+Внутри процесса audit-хук запрещает сокеты, запуск процессов, ctypes,
+изменение файлов, а чтение файлов и просмотр каталогов разрешает только в
+стандартной библиотеке (sys.path), так что решение не прочитает ни .env, ни
+системные файлы. Об ошибке выполнения сообщается только имя исключения.
+Это защита от случайных и простых злонамеренных решений, а не полноценная
+песочница.
+
+Все тесты решения идут в одном процессе по очереди: каждый вывод сравнивается
+с ожидаемым сразу, и на первом расхождении процесс убивается (остальные тесты
+не запускаются). Ожидаемые ответы в процесс не передаются.
+
+Решения ставятся в очередь CodeJudge, JUDGE_MAX_WORKERS воркеров разбирают её,
+так что одновременно работает не больше JUDGE_MAX_WORKERS процессов. Клиент
+получает id задачи и опрашивает её статус. Результат кэшируется по
+(step_id, Step.version, sha256 кода): повторная отправка того же кода
+отвечается сразу, одинаковые решения в очереди выполняются один раз. Задачи
+и кэш живут в памяти процесса, опрашивать статус нужно у того же воркера
+uvicorn (или держать один воркер приложения).
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import sys
+import time
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from uuid import UUID, uuid4
+
+from app.core.cache import LRUCache, TTLCache
+from app.core.config import settings
+from app.models import CodeRunStatus, CodeVerdict
+from app.schemas.step_content import CodeTestCase
+
+logger = logging.getLogger(__name__)
+
+# (step_id, Step.version, sha256 кода)
+ResultKey = tuple[UUID, int, str]
+
+# Выполняется в песочнице: сообщает о запуске строкой STARTED, читает
+# {"code", "inputs"} из stdin и на каждый вход пишет строку JSON {"output"} или
+# {"error", "message"} в исходный stdout
+BOOTSTRAP = r"""
+import io, json, os, sys
+
+out = os.fdopen(os.dup(1), "w")
+null = os.open(os.devnull, os.O_WRONLY)
+os.dup2(null, 1)
+os.dup2(null, 2)
+
+
+def emit(frame):
+    out.write(json.dumps(frame) + "\n")
+    out.flush()
+
+
+emit({"started": True})
+payload = json.loads(sys.stdin.read())
+
+
+def make_guard(str=str, bytes=bytes, int=int, type=type, Error=PermissionError):
+    # Хук берёт всё нужное из замыкания: решение может подменить builtins и
+    # атрибуты модулей, но не ячейки функции, до которой ему не добраться
+    write_flags = os.O_WRONLY | os.O_RDWR | os.O_CREAT | os.O_APPEND | os.O_TRUNC
+    blocked = (
+        "socket.", "subprocess.", "os.system", "os.exec", "os.posix_spawn",
+        "os.spawn", "os.fork", "os.kill", "os.killpg", "ctypes.", "pty.",
+        "shutil.", "os.remove", "os.rename", "os.rmdir", "os.mkdir",
+        "os.chdir", "os.chmod", "os.chown", "os.link", "os.symlink",
+        "os.truncate", "os.utime", "gc.", "cpython.PyInterpreterState_New",
+    )
+    # Запускают процессы и интерпретаторы мимо audit-событий
+    blocked_imports = ("_posixsubprocess", "_xxsubinterpreters")
+    # Читать можно только стандартную библиотеку: при -I -S в sys.path нет
+    # ничего другого
+    roots = tuple(sys.path)
+    prefixes = tuple(root + "/" for root in roots)
+
+    def readable(path):
+        if type(path) is int:
+            return True  # уже открытый дескриптор
+        if type(path) is bytes:
+            path = path.decode("utf-8", "surrogateescape")
+        # Только str и bytes: у PathLike __fspath__ может вернуть другое при
+        # настоящем открытии
+        if type(path) is not str:
+            return False
+        # Текущий каталог — «/» (os.chdir запрещён)
+        parts = []
+        for part in path.split("/"):
+            if part == "..":
+                if parts:
+                    parts.pop()
+            elif part and part != ".":
+                parts.append(part)
+        path = "/" + "/".join(parts)
+        return path in roots or path.startswith(prefixes)
+
+    def guard(event, args):
+        if event.startswith(blocked) or (
+            event == "import" and args[0] in blocked_imports
+        ):
+            raise Error(event + " is not allowed")
+        if event == "open":
+            mode, flags = args[1], args[2]
+            if (
+                type(mode) is str and mode.strip("rbt")
+                or type(flags) is int and flags & write_flags
+                or not readable(args[0])
+            ):
+                raise Error(event + " is not allowed")
+        elif event in ("os.listdir", "os.scandir") and not readable(args[0]):
+            raise Error(event + " is not allowed")
+
+    return guard
+
+
+try:
+    code = compile(payload["code"], "<submission>", "exec")
+except (SyntaxError, ValueError) as e:
+    emit({"error": "compile_error", "message": f"{type(e).__name__}: {e}"})
+    sys.exit()
+
+sys.addaudithook(make_guard())
+for stdin in payload["inputs"]:
+    sys.stdin = io.StringIO(stdin)
+    sys.stdout = io.StringIO()
+    try:
+        try:
+            exec(code, {"__name__": "__main__", "__builtins__": __builtins__})
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                raise
+    except MemoryError:
+        emit({"error": "memory_limit", "message": "MemoryError"})
+    except BaseException as e:
+        # Только имя: в тексте исключения решение могло бы вынести данные
+        emit({"error": "runtime_error", "message": type(e).__name__})
+    else:
+        emit({"output": sys.stdout.getvalue()})
+"""
+
+_CLONE_NEWUSER = 0x10000000
+_CLONE_NEWNET = 0x40000000
+# Код выхода TRAMPOLINE, если не удалось создать пространства имён
+_ISOLATION_FAILED = 125
+
+# Запускается вместо preexec_fn (в многопоточном процессе между fork и exec
+# нельзя выполнять Python-код): однопоточный интерпретатор выставляет лимиты,
+# переходит в новые пространства имён и заменяет себя интерпретатором с
+# BOOTSTRAP. argv: секунды процессора, байты памяти, изолировать ли сеть (0/1),
+# код BOOTSTRAP
+TRAMPOLINE = rf"""
+import ctypes, os, resource, sys
+
+cpu, memory, isolate = map(int, sys.argv[1:4])
+if isolate:
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.unshare({_CLONE_NEWUSER | _CLONE_NEWNET:#x}) != 0:
+        os._exit({_ISOLATION_FAILED})
+resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+resource.setrlimit(resource.RLIMIT_NOFILE, (64, 64))
+resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+os.execv(sys.executable, [sys.executable, "-I", "-S", "-c", sys.argv[4]])
+"""
+
+# Первая строка BOOTSTRAP, до запуска решения
+STARTED = b'{"started": true}\n'
+# Вердикты, которые процесс песочницы сообщает сам: кадр -> вердикт
+SANDBOX_ERRORS: dict[str, CodeVerdict] = {
+    "compile_error": "compile_error",
+    "runtime_error": "runtime_error",
+    "memory_limit": "memory_limit",
+}
+
+
+class JudgeQueueFull(Exception):
+    """В очереди уже JUDGE_QUEUE_MAX_PENDING решений."""
+
+
+@dataclass
+class JudgeResult:
+    verdict: CodeVerdict
+    passed_tests: int
+    total_tests: int
+    failed_test: int | None = None
+    message: str | None = None
+    time_ms: int = 0
+
+
+@dataclass
+class JudgeJob:
+    id: UUID
+    user_id: UUID
+    step_id: UUID
+    key: ResultKey
+    code: str = field(repr=False)
+    test_cases: Sequence[CodeTestCase] = field(repr=False)
+    on_accepted: Callable[[], Awaitable[None]] | None = field(default=None, repr=False)
+    status: CodeRunStatus = "queued"
+    result: JudgeResult | None = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+
+
+@dataclass
+class JudgeMetrics:
+    submitted: int = 0
+    cache_hits: int = 0  # ответ из кэша без запуска
+    deduplicated: int = 0  # дождались такого же решения, выполнявшегося рядом
+    executed: int = 0  # запуски процессов
+    failed: int = 0  # сбои самой проверки
+
+
+def normalize_output(output: str) -> str:
+    """Убрать пробелы в конце строк и пустые строки в конце вывода."""
+    return "\n".join(line.rstrip() for line in output.rstrip().splitlines())
+
+
+def _parse_frame(line: bytes) -> dict[str, str] | None:
+    # Решение может писать в канал кадров напрямую (os.write), поэтому кадр
+    # проверяется: подделать вердикт нельзя, подделать вывод — то же, что его
+    # напечатать
+    try:
+        frame = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(frame, dict):
+        return None
+    if isinstance(frame.get("output"), str):
+        return {"output": frame["output"]}
+    if frame.get("error") in SANDBOX_ERRORS:
+        message = str(frame.get("message"))[:1000]
+        # Об ошибке выполнения — только имя исключения, и кадр, подделанный
+        # решением, тоже не вынесет ничего другого
+        if frame["error"] != "compile_error" and not (
+            len(message) <= 100 and message.isidentifier()
+        ):
+            message = "Error"
+        return {"error": frame["error"], "message": message}
+    return None
+
+
+async def run_submission(
+    code: str,
+    test_cases: Sequence[CodeTestCase],
+    *,
+    time_limit_seconds: float,
+    memory_limit_mb: int,
+    output_limit_bytes: int,
+    isolate_network: bool,
+) -> JudgeResult:
+    """
+    Прогнать код на тестах в песочнице, остановившись на первой ошибке.
+    RuntimeError — не удалось изолировать сеть процесса.
+    """
+    total = len(test_cases)
+    payload = json.dumps(
+        {"code": code, "inputs": [test_case.input for test_case in test_cases]}
+    ).encode()
+    started = time.perf_counter()
+
+    def result(
+        verdict: CodeVerdict, passed: int, message: str | None = None
+    ) -> JudgeResult:
+        return JudgeResult(
+            verdict=verdict,
+            passed_tests=passed,
+            total_tests=total,
+            failed_test=None if verdict == "accepted" else passed,
+            message=message,
+            time_ms=round((time.perf_counter() - started) * 1000),
+        )
+
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-I",
+        "-S",
+        "-c",
+        TRAMPOLINE,
+        str(math.ceil(time_limit_seconds * max(total, 1)) + 1),
+        str(memory_limit_mb * 1024 * 1024),
+        str(int(isolate_network)),
+        BOOTSTRAP,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+        env={},
+        cwd="/",
+        # Кадр JSON длиннее лимита — вывод теста слишком большой
+        limit=output_limit_bytes * 2 + 1024,
+    )
+    assert process.stdin is not None and process.stdout is not None
+    try:
+        try:
+            process.stdin.write(payload)
+            await process.stdin.drain()
+            process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # Процесс завершился, не дочитав решение; причину покажет код выхода
+            pass
+
+        # До STARTED решение ещё не запускалось, поэтому код выхода
+        # _ISOLATION_FAILED здесь не подделать
+        try:
+            line = await asyncio.wait_for(
+                process.stdout.readline(), timeout=time_limit_seconds
+            )
+        except asyncio.TimeoutError:
+            return result("time_limit", 0)
+        if line != STARTED:
+            await process.wait()
+            if process.returncode == _ISOLATION_FAILED:
+                raise RuntimeError("Failed to isolate the judge process network")
+            return result("runtime_error", 0, "Process exited")
+
+        for passed, test_case in enumerate(test_cases):
+            try:
+                line = await asyncio.wait_for(
+                    process.stdout.readline(), timeout=time_limit_seconds
+                )
+            except asyncio.TimeoutError:
+                return result("time_limit", passed)
+            except ValueError:
+                return result("output_limit", passed)
+            if not line:
+                # Процесс умер: SIGXCPU по RLIMIT_CPU или os._exit в решении
+                await process.wait()
+                if process.returncode in (-24, -9):
+                    return result("time_limit", passed)
+                return result("runtime_error", passed, "Process exited")
+            frame = _parse_frame(line)
+            if frame is None:
+                return result("runtime_error", passed, "Invalid output")
+            if "error" in frame:
+                verdict = SANDBOX_ERRORS[frame["error"]]
+                return result(verdict, passed, frame.get("message"))
+            if len(frame["output"]) > output_limit_bytes:
+                return result("output_limit", passed)
+            if normalize_output(frame["output"]) != normalize_output(
+                test_case.expected_output
+            ):
+                return result("wrong_answer", passed)
+        return result("accepted", total)
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+class CodeJudge:
+    def __init__(
+        self,
+        *,
+        max_workers: int,
+        max_pending: int,
+        time_limit_seconds: float,
+        memory_limit_mb: int,
+        output_limit_bytes: int,
+        isolate_network: bool,
+        result_cache_max_entries: int,
+        job_ttl_seconds: float,
+    ) -> None:
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.time_limit_seconds = time_limit_seconds
+        self.memory_limit_mb = memory_limit_mb
+        self.output_limit_bytes = output_limit_bytes
+        self.isolate_network = isolate_network
+        self.results: LRUCache[ResultKey, JudgeResult] = LRUCache(
+            result_cache_max_entries
+        )
+        self.jobs: TTLCache[UUID, JudgeJob] = TTLCache(
+            max(max_pending * 2, result_cache_max_entries), job_ttl_seconds
+        )
+        self._metrics = JudgeMetrics()
+        self._running: dict[ResultKey, asyncio.Future[JudgeResult | None]] = {}
+        self._workers: list[asyncio.Task[None]] = []
+        # Очередь привязывается к циклу событий, поэтому создаётся в start()
+        self._queue: asyncio.Queue[JudgeJob]
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def __len__(self) -> int:
+        return self._queue.qsize() if self.running else 0
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(self.max_pending)
+        self._workers = [
+            asyncio.create_task(self._work()) for _ in range(self.max_workers)
+        ]
+
+    async def stop(self) -> None:
+        """Остановить воркеры; незаконченные задачи остаются в статусе queued."""
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def submit(
+        self,
+        *,
+        user_id: UUID,
+        step_id: UUID,
+        version: int,
+        code: str,
+        test_cases: Sequence[CodeTestCase],
+        on_accepted: Callable[[], Awaitable[None]] | None = None,
+    ) -> JudgeJob:
+        """
+        Поставить решение в очередь. on_accepted вызывается, когда решение
+        прошло все тесты (в том числе сразу, если результат уже в кэше).
+        """
+        key = (step_id, version, hashlib.sha256(code.encode()).hexdigest())
+        job = JudgeJob(
+            id=uuid4(),
+            user_id=user_id,
+            step_id=step_id,
+            key=key,
+            code=code,
+            test_cases=test_cases,
+            on_accepted=on_accepted,
+        )
+        self._metrics.submitted += 1
+        cached = self.results.get(key)
+        if cached is not None:
+            self._metrics.cache_hits += 1
+            await self._finish(job, cached)
+            return job
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JudgeQueueFull
+        self.jobs.set(job.id, job)
+        return job
+
+    def get_job(self, job_id: UUID) -> JudgeJob | None:
+        return self.jobs.get(job_id)
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                job.status = "running"
+                result = await self._result(job)
+                if result is None:
+                    job.status = "failed"
+                    self.jobs.set(job.id, job)
+                else:
+                    await self._finish(job, result)
+            finally:
+                self._queue.task_done()
+
+    async def _result(self, job: JudgeJob) -> JudgeResult | None:
+        result = self.results.get(job.key)
+        if result is not None:
+            self._metrics.cache_hits += 1
+            return result
+        running = self._running.get(job.key)
+        if running is not None:
+            self._metrics.deduplicated += 1
+            return await asyncio.shield(running)
+
+        future: asyncio.Future[JudgeResult | None] = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._running[job.key] = future
+        result = None
+        try:
+            self._metrics.executed += 1
+            result = await run_submission(
+                job.code,
+                job.test_cases,
+                time_limit_seconds=self.time_limit_seconds,
+                memory_limit_mb=self.memory_limit_mb,
+                output_limit_bytes=self.output_limit_bytes,
+                isolate_network=self.isolate_network,
+            )
+            # Превышение времени зависит от нагрузки на машину, его не кэшируем
+            if result.verdict != "time_limit":
+                self.results.set(job.key, result)
+        except Exception:
+            self._metrics.failed += 1
+            logger.exception("Failed to judge submission for step %s", job.step_id)
+        finally:
+            del self._running[job.key]
+            future.set_result(result)
+        return result
+
+    async def _finish(self, job: JudgeJob, result: JudgeResult) -> None:
+        # Сначала отметка о прохождении: клиент, увидевший done, должен
+        # увидеть и пройденный шаг
+        if result.verdict == "accepted" and job.on_accepted is not None:
+            try:
+                await job.on_accepted()
+            except Exception:
+                logger.exception("Failed to record accepted submission %s", job.id)
+        job.result = result
+        job.status = "done"
+        self.jobs.set(job.id, job)
+
+    def metrics(self) -> dict[str, int]:
+        return asdict(self._metrics) | {"pending": len(self)}
+
+
+code_judge = CodeJudge(
+    max_workers=settings.JUDGE_MAX_WORKERS,
+    max_pending=settings.JUDGE_QUEUE_MAX_PENDING,
+    time_limit_seconds=settings.JUDGE_TIME_LIMIT_SECONDS,
+    memory_limit_mb=settings.JUDGE_MEMORY_LIMIT_MB,
+    output_limit_bytes=settings.JUDGE_OUTPUT_LIMIT_BYTES,
+    isolate_network=settings.JUDGE_ISOLATE_NETWORK,
+    result_cache_max_entries=settings.JUDGE_RESULT_CACHE_MAX_ENTRIES,
+    job_ttl_seconds=settings.JUDGE_JOB_TTL_SECONDS,
+)
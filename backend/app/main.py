@@ -1,5 +1,10 @@
+import math
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 import sentry_sdk
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.cors import CORSMiddleware
@@ -7,6 +12,11 @@ from starlette.middleware.cors import CORSMiddleware
 from app.admin import setup_admin
 from app.api.main import api_router
 from app.core.config import settings
+from app.core.progress_queue import progress_queue
+from app.core.rate_limit import RateLimitExceeded
+from app.core.refresh_tokens import refresh_token_revocations
+from app.core.security import PasswordHashingBusy
+from app.judge import code_judge
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -16,12 +26,55 @@ def custom_generate_unique_id(route: APIRoute) -> str:
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:  # noqa: ARG001
+    if settings.PROGRESS_WRITE_BEHIND:
+        await progress_queue.start()
+    if settings.JUDGE_MAX_WORKERS > 0:
+        await code_judge.start()
+    await refresh_token_revocations.start()
+    try:
+        yield
+    finally:
+        await refresh_token_revocations.stop()
+        await code_judge.stop()
+        await progress_queue.stop()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
+    lifespan=lifespan,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
 )
 
+
+@app.exception_handler(PasswordHashingBusy)
+async def password_hashing_busy_handler(
+    request: Request,  # noqa: ARG001
+    exc: PasswordHashingBusy,  # noqa: ARG001
+) -> JSONResponse:
+    # Очередь bcrypt полна: лишние входы отбрасываются сразу, а не ждут минутами
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many password operations, try again later"},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(
+    request: Request,  # noqa: ARG001
+    exc: RateLimitExceeded,
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many requests, try again later"},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+
 # Set all CORS enabled origins
 if settings.all_cors_origins:
     app.add_middleware(
@@ -1,10 +1,11 @@
 from datetime import datetime
 from enum import IntEnum
-from typing import Any
+from typing import Any, Literal
 from uuid import UUID, uuid4
 
 from pydantic import EmailStr
-from sqlalchemy import Column, JSON, UniqueConstraint
+from sqlalchemy import Column, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -121,9 +122,22 @@ class UserPublic(UserBase):
     youtube_url: str | None = None
 
 
-class UsersPublic(SQLModel):
+# Способ подсчёта общего количества строк в ответах со списками
+CountStrategy = Literal["exact", "estimated", "none"]
+
+
+# Общие поля ответов со списками. count_strategy сообщает, как получен count
+# (None при count_strategy="none"), next_cursor передаётся обратно
+# в параметре cursor для следующей страницы.
+class ListPublic(SQLModel):
+    count: int | None = None
+    count_strategy: CountStrategy = "exact"
+    has_more: bool = False
+    next_cursor: str | None = None
+
+
+class UsersPublic(ListPublic):
     data: list[UserPublic]
-    count: int
 
 
 # Generic message
@@ -143,16 +157,21 @@ class TokenPayload(SQLModel):
     sub: str | None = None
     type: str | None = None  # "access" или "refresh"
     jti: str | None = None  # JWT ID для refresh токенов
+    fam: str | None = None  # семейство refresh токена (id входа)
 
 
-# Refresh token in database
+# Refresh token in database. Выданные токены в БД не пишутся: строка
+# появляется, когда токен использован при ротации (revoked=False), или
+# отзывает всё семейство (revoked=True, token_id равен family_id). Строки
+# нужны только до expires_at, потом их удаляет фоновая очистка.
 class RefreshToken(SQLModel, table=True):
     __tablename__ = "refresh_token"
     id: UUID = Field(default_factory=uuid4, primary_key=True)
     user_id: UUID = Field(foreign_key="users.id", ondelete="CASCADE")
     token_id: str = Field(unique=True, index=True)  # jti из JWT
-    expires_at: datetime
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    family_id: str
+    expires_at: datetime = Field(index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
     revoked: bool = Field(default=False)
 
     def __str__(self) -> str:
@@ -168,9 +187,8 @@ class LanguagePublic(LanguageBase):
     id: int
 
 
-class LanguagesPublic(SQLModel):
+class LanguagesPublic(ListPublic):
     data: list[LanguagePublic]
-    count: int
 
 
 class SetLanguage(SQLModel):
@@ -226,9 +244,8 @@ class CategoryPublic(CategoryBase):
     id: UUID
 
 
-class CategoriesPublic(SQLModel):
+class CategoriesPublic(ListPublic):
     data: list[CategoryPublic]
-    count: int
 
 
 class SubcategoryPublic(SubcategoryBase):
@@ -298,6 +315,18 @@ class CourseBase(SQLModel):
 
 
 class Course(CourseBase, table=True):
+    # search_vector заполняется триггером в БД и не загружается ORM
+    __mapper_args__ = {"exclude_properties": ["search_vector"]}
+    __table_args__ = (
+        Index("ix_course_search_vector", "search_vector", postgresql_using="gin"),
+        Index(
+            "ix_course_title_trgm",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ),
+        Index("ix_course_datetime_create_id", "datetime_create", "id"),
+    )
     id: UUID = Field(default_factory=uuid4, primary_key=True)
     datetime_create: datetime = Field(default_factory=datetime.utcnow)
     datetime_update: datetime = Field(default_factory=datetime.utcnow)
@@ -319,10 +348,50 @@ class Course(CourseBase, table=True):
     category: Category | None = Relationship()
     subcategory: Subcategory | None = Relationship()
 
+    # Полнотекстовый индекс (title > short_description > description > автор)
+    search_vector: Any = Field(default=None, sa_column=Column(TSVECTOR))
+
     def __str__(self) -> str:
         return self.title
 
 
+# Денормализованная статистика курса, поддерживается инкрементально
+class CourseStats(SQLModel, table=True):
+    __tablename__ = "course_stats"
+    course_id: UUID = Field(
+        foreign_key="course.id", primary_key=True, ondelete="CASCADE"
+    )
+    students_count: int = Field(default=0)
+    favorites_count: int = Field(default=0)
+    modules_count: int = Field(default=0)
+    lessons_count: int = Field(default=0)
+    steps_count: int = Field(default=0)
+    completions_count: int = Field(default=0)
+
+
+# Прогресс ученика по курсу, поддерживается инкрементально; всего шагов в
+# курсе — course_stats.steps_count
+class CourseProgress(SQLModel, table=True):
+    __tablename__ = "course_progress"
+    user_id: UUID = Field(foreign_key="users.id", primary_key=True, ondelete="CASCADE")
+    course_id: UUID = Field(
+        foreign_key="course.id", primary_key=True, ondelete="CASCADE", index=True
+    )
+    completed_steps: int = Field(default=0)
+    last_step_id: UUID | None = Field(
+        default=None, foreign_key="step.id", ondelete="SET NULL"
+    )
+    last_activity_at: datetime | None = None
+
+
+class CourseProgressPublic(SQLModel):
+    completed_steps: int = 0
+    total_steps: int = 0
+    percent: float = 0
+    last_step_id: UUID | None = None
+    last_activity_at: datetime | None = None
+
+
 class CourseDescriptionBlockBase(SQLModel):
     title: str = Field(min_length=1, max_length=255)
     text: str = Field(min_length=1, max_length=4000)
@@ -409,12 +478,24 @@ class StepBase(SQLModel):
 
 
 class Step(StepBase, table=True):
+    # jsonb_path_ops обслуживает поиск по вхождению (content @> ...): шаги по
+    # языку, по ссылке на картинку и т. п.
+    __table_args__ = (
+        Index(
+            "ix_step_content",
+            "content",
+            postgresql_using="gin",
+            postgresql_ops={"content": "jsonb_path_ops"},
+        ),
+    )
     id: UUID = Field(default_factory=uuid4, primary_key=True)
     lesson_id: UUID = Field(foreign_key="lesson.id", ondelete="CASCADE")
     lesson: Lesson | None = Relationship()
 
-    # JSON поле для специфичного контента каждого типа
-    content: dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON))
+    # Контент, специфичный для типа шага; схемы — app/schemas/step_content.py
+    content: dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSONB))
+    # Растёт при смене content или step_type; ключ кэша проверки ответов
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
 
     def __str__(self) -> str:
         return self.title or f"Step {self.position}"
@@ -527,11 +608,27 @@ class CoursePublic(CourseBase):
     is_favorite: bool = False
     students_count: int = 0
     is_enrolled: bool = False
+    # Заполняется только в списке курсов ученика (/courses/progress)
+    progress: CourseProgressPublic | None = None
 
 
-class CoursesPublic(SQLModel):
+class CoursesPublic(ListPublic):
     data: list[CoursePublic]
-    count: int
+
+
+class CourseSuggestion(SQLModel):
+    id: UUID
+    title: str
+
+
+class AuthorSuggestion(SQLModel):
+    id: UUID
+    name: str
+
+
+class CourseSuggestionsPublic(SQLModel):
+    courses: list[CourseSuggestion]
+    authors: list[AuthorSuggestion]
 
 
 # Public schemas for Modules
@@ -596,10 +693,30 @@ class StepUpdate(SQLModel):
 class StepPublic(StepBase):
     id: UUID
     lesson_id: UUID
-    content: dict[str, Any] = Field(default_factory=dict)
+    # None — content не запрашивался (см. include_content в списке шагов урока)
+    content: dict[str, Any] | None = Field(default_factory=dict)
     is_completed: bool = False  # Пройден ли шаг текущим пользователем
 
 
+# Outline курса: дерево модулей, уроков и шагов без тяжёлого content
+class StepOutline(StepBase):
+    id: UUID
+    is_completed: bool = False
+
+
+class LessonOutline(LessonPublic):
+    steps: list[StepOutline] = []
+
+
+class ModuleOutline(ModulePublic):
+    lessons: list[LessonOutline] = []
+
+
+class CourseOutline(SQLModel):
+    course_id: UUID
+    modules: list[ModuleOutline] = []
+
+
 # Step Progress (отслеживание прогресса прохождения шагов)
 class StepProgress(SQLModel, table=True):
     __tablename__ = "step_progress"
@@ -616,3 +733,56 @@ class StepProgressPublic(SQLModel):
     user_id: UUID
     step_id: UUID
     completed_at: datetime
+
+
+class StepsComplete(SQLModel):
+    # Ограничение держит многострочный INSERT в пределах лимита параметров asyncpg
+    step_ids: list[UUID] = Field(min_length=1, max_length=1000)
+
+
+class StepSubmission(SQLModel):
+    # Форма ответа зависит от типа шага, см. app/grading.py
+    answer: Any
+
+
+class StepSubmissionResult(SQLModel):
+    is_correct: bool
+    is_completed: bool  # пройден ли шаг после этой попытки
+    # Для SQL-шагов: номер (с нуля) первого не пройденного теста и ошибка SQL
+    failed_test: int | None = None
+    message: str | None = None
+
+
+CodeRunStatus = Literal["queued", "running", "done", "failed"]
+CodeVerdict = Literal[
+    "accepted",
+    "wrong_answer",
+    "compile_error",
+    "runtime_error",
+    "time_limit",
+    "memory_limit",
+    "output_limit",
+]
+
+
+class CodeSubmission(SQLModel):
+    code: str = Field(min_length=1, max_length=64_000)
+
+
+class CodeRunPublic(SQLModel):
+    id: UUID
+    status: CodeRunStatus
+    verdict: CodeVerdict | None = None  # None, пока проверка не закончена
+    passed_tests: int = 0
+    total_tests: int
+    # Номер (с нуля) первого не пройденного теста; его вход и ответ не раскрываются
+    failed_test: int | None = None
+    message: str | None = None  # последняя строка ошибки или причина сбоя
+    time_ms: int | None = None
+
+
+class StepsCompletedPublic(SQLModel):
+    step_ids: list[UUID]  # шаги урока из запроса, пройденные после вызова
+    # Сколько из них отмечено этим вызовом (в режиме write-behind — поставлено
+    # в очередь)
+    created_count: int
@@ -0,0 +1,134 @@
+"""
+Реестр горячих запросов.
+
+Запросы с самых частых путей (обогащение списков курсов, прогресс по шагам,
+поиск пользователя по email) собираются через lambda_stmt. SQLAlchemy
+строит конструкцию и её ключ кэша компиляции один раз на лямбду, а при
+следующих вызовах только подставляет значения из замыкания как параметры.
+Обычный select() на каждом запросе заново собирается и обходится целиком
+для вычисления ключа кэша.
+
+Результат выполнения — строки, а не скаляры: sqlmodel разворачивает в
+скаляры только SelectOfScalar, поэтому вызывающий код берёт .scalars().
+
+Запросы регистрируются по имени в HOT_QUERIES, под этими именами их видно в
+tests/benchmarks/bench_hot_queries.py.
+"""
+
+from collections.abc import Callable, Sequence
+from typing import TypeVar
+from uuid import UUID
+
+import sqlalchemy
+from sqlalchemy import StatementLambdaElement, lambda_stmt
+from sqlmodel import col, select
+
+from app.models import (
+    CourseFavoriteLink,
+    CourseProgress,
+    CourseStats,
+    CourseStudentLink,
+    Lesson,
+    Module,
+    Step,
+    StepProgress,
+    User,
+)
+
+HOT_QUERIES: dict[str, Callable[..., StatementLambdaElement]] = {}
+
+F = TypeVar("F", bound=Callable[..., StatementLambdaElement])
+
+
+def hot_query(name: str) -> Callable[[F], F]:
+    def register(build: F) -> F:
+        HOT_QUERIES[name] = build
+        return build
+
+    return register
+
+
+@hot_query("user_by_email")
+def user_by_email(email: str) -> StatementLambdaElement:
+    return lambda_stmt(lambda: select(User).where(col(User.email) == email))
+
+
+@hot_query("favorite_course_ids")
+def favorite_course_ids(
+    user_id: UUID, course_ids: Sequence[UUID]
+) -> StatementLambdaElement:
+    return lambda_stmt(
+        lambda: select(CourseFavoriteLink.course_id).where(
+            col(CourseFavoriteLink.user_id) == user_id,
+            col(CourseFavoriteLink.course_id).in_(course_ids),
+        )
+    )
+
+
+@hot_query("enrolled_course_ids")
+def enrolled_course_ids(
+    user_id: UUID, course_ids: Sequence[UUID]
+) -> StatementLambdaElement:
+    return lambda_stmt(
+        lambda: select(CourseStudentLink.course_id).where(
+            col(CourseStudentLink.user_id) == user_id,
+            col(CourseStudentLink.course_id).in_(course_ids),
+        )
+    )
+
+
+@hot_query("students_counts")
+def students_counts(course_ids: Sequence[UUID]) -> StatementLambdaElement:
+    return lambda_stmt(
+        lambda: select(CourseStats.course_id, CourseStats.students_count).where(
+            col(CourseStats.course_id).in_(course_ids)
+        )
+    )
+
+
+@hot_query("completed_step_ids")
+def completed_step_ids(
+    user_id: UUID, step_ids: Sequence[UUID]
+) -> StatementLambdaElement:
+    return lambda_stmt(
+        lambda: select(StepProgress.step_id).where(
+            col(StepProgress.user_id) == user_id,
+            col(StepProgress.step_id).in_(step_ids),
+        )
+    )
+
+
+@hot_query("course_completed_step_ids")
+def course_completed_step_ids(user_id: UUID, course_id: UUID) -> StatementLambdaElement:
+    return lambda_stmt(
+        lambda: select(StepProgress.step_id)
+        .join(Step, col(Step.id) == col(StepProgress.step_id))
+        .join(Lesson, col(Lesson.id) == col(Step.lesson_id))
+        .join(Module, col(Module.id) == col(Lesson.module_id))
+        .where(
+            col(StepProgress.user_id) == user_id,
+            col(Module.course_id) == course_id,
+        )
+    )
+
+
+@hot_query("courses_progress")
+def courses_progress(
+    user_id: UUID, course_ids: Sequence[UUID]
+) -> StatementLambdaElement:
+    return lambda_stmt(
+        # У select из sqlmodel перегрузки только до четырёх столбцов
+        lambda: sqlalchemy.select(
+            col(CourseStats.course_id),
+            col(CourseStats.steps_count),
+            col(CourseProgress.completed_steps),
+            col(CourseProgress.last_step_id),
+            col(CourseProgress.last_activity_at),
+        )
+        .outerjoin(
+            CourseProgress,
+            (col(CourseProgress.course_id) == col(CourseStats.course_id))
+            & (col(CourseProgress.user_id) == user_id),
+        )
+        .where(col(CourseStats.course_id).in_(course_ids))
+    )
@@ -0,0 +1,24 @@
+import asyncio
+import logging
+
+from app import crud
+from app.core.db import AsyncSessionLocal
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def rebuild() -> None:
+    async with AsyncSessionLocal() as session:
+        await crud.rebuild_course_stats(session=session)
+        await crud.rebuild_course_progress(session=session)
+
+
+def main() -> None:
+    logger.info("Rebuilding course stats")
+    asyncio.run(rebuild())
+    logger.info("Course stats rebuilt")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,13 @@ Pydantic схемы для валидации content различных тип
 Используются для строгой типизации JSON поля content в модели Step.
 """
 
-from pydantic import BaseModel, Field
+from collections.abc import Callable
+from functools import cache
+from typing import Any
+
+from pydantic import BaseModel, Field, TypeAdapter
+
+from app.models import StepType
 
 
 # Текстовый шаг
@@ -141,3 +147,104 @@ class DatasetStepContent(BaseModel):
     dataset_url: str
     test_cases: list[dict] = Field(default_factory=list)
     language: str = "python"  # python, r, julia
+
+
+STEP_CONTENT_MODELS: dict[StepType, type[BaseModel]] = {
+    StepType.TEXT: TextStepContent,
+    StepType.VIDEO: VideoStepContent,
+    StepType.CODE: CodeStepContent,
+    StepType.QUIZ: QuizStepContent,
+    StepType.MATCHING: MatchingStepContent,
+    StepType.SORTING: SortingStepContent,
+    StepType.TABLE: TableStepContent,
+    StepType.FILL_BLANKS: FillBlanksStepContent,
+    StepType.STRING: StringStepContent,
+    StepType.NUMBER: NumberStepContent,
+    StepType.MATH: MathStepContent,
+    StepType.FREE_ANSWER: FreeAnswerStepContent,
+    StepType.SQL: SQLStepContent,
+    StepType.HTML_CSS: HTMLCSSStepContent,
+    StepType.DATASET: DatasetStepContent,
+}
+
+
+@cache
+def step_content_adapter(step_type: StepType) -> TypeAdapter[Any]:
+    """Собранный валидатор content для типа шага (строится один раз на тип)."""
+    return TypeAdapter(STEP_CONTENT_MODELS[step_type])
+
+
+def validate_step_content(
+    step_type: StepType, content: dict[str, Any]
+) -> dict[str, Any]:
+    """
+    Проверить content по схеме типа шага и вернуть его в нормализованном виде
+    (со значениями по умолчанию, без лишних ключей). Пустой content — шаг,
+    который автор ещё не заполнил, — не проверяется. Ошибки — pydantic
+    ValidationError.
+    """
+    if not content:
+        return {}
+    adapter = step_content_adapter(step_type)
+    return adapter.dump_python(adapter.validate_python(content), mode="json")  # type: ignore[no-any-return]
+
+
+# Редакция content для ученика: ключ ответа (правильные варианты, ответы,
+# ожидаемые результаты тестов) остаётся на сервере, его видит только автор
+# курса. Ответы проверяет POST /lessons/{lesson_id}/steps/{step_id}/submit.
+Redactor = Callable[[dict[str, Any]], dict[str, Any]]
+
+
+def _without(*keys: str) -> Redactor:
+    def redact(content: dict[str, Any]) -> dict[str, Any]:
+        return {key: value for key, value in content.items() if key not in keys}
+
+    return redact
+
+
+def _redact_quiz(content: dict[str, Any]) -> dict[str, Any]:
+    options = [
+        {key: value for key, value in option.items() if key != "is_correct"}
+        for option in content.get("options", [])
+    ]
+    return _without("explanation")(content) | {"options": options}
+
+
+def _redact_matching(content: dict[str, Any]) -> dict[str, Any]:
+    # Правые части отсортированы: их порядок не выдаёт, что с чем сопоставлено
+    pairs = content.get("pairs", [])
+    return _without("pairs")(content) | {
+        "left": [pair["left"] for pair in pairs],
+        "right": sorted(pair["right"] for pair in pairs),
+    }
+
+
+def _redact_fill_blanks(content: dict[str, Any]) -> dict[str, Any]:
+    blanks = [
+        {key: value for key, value in blank.items() if key != "answer"}
+        for blank in content.get("blanks", [])
+    ]
+    return content | {"blanks": blanks}
+
+
+STEP_CONTENT_REDACTORS: dict[StepType, Redactor] = {
+    StepType.CODE: _without("test_cases"),
+    StepType.QUIZ: _redact_quiz,
+    StepType.MATCHING: _redact_matching,
+    StepType.SORTING: _without("correct_order"),
+    StepType.TABLE: _without("correct_answers"),
+    StepType.FILL_BLANKS: _redact_fill_blanks,
+    StepType.STRING: _without("answer"),
+    StepType.NUMBER: _without("answer"),
+    StepType.MATH: _without("answer"),
+    StepType.SQL: _without("test_queries"),
+    StepType.DATASET: _without("test_cases"),
+}
+
+
+def redact_step_content(step_type: StepType, content: dict[str, Any]) -> dict[str, Any]:
+    """Content шага без ключа ответа — так его видит ученик."""
+    redactor = STEP_CONTENT_REDACTORS.get(step_type)
+    if redactor is None or not content:
+        return content
+    return redactor(content)
@@ -0,0 +1,75 @@
+"""
+Поиск по каталогу курсов.
+
+Course.search_vector поддерживается триггерами в PostgreSQL (см. миграцию
+add_course_search_vector): title имеет вес A, short_description — B,
+description — C, имя автора — D. Текст индексируется сразу в русской и
+английской конфигурациях, чтобы стемминг работал для языков из Language.
+
+Подсказки при наборе (/courses/suggest) используют триграммные GIN-индексы
+pg_trgm по Course.title и по полному имени пользователя.
+"""
+
+from typing import Any, Literal
+
+from sqlalchemy import ColumnElement, Float, func, literal, literal_column, or_
+from sqlmodel import col
+
+from app.models import Course, User
+
+# Language.code -> конфигурация текстового поиска PostgreSQL
+SEARCH_CONFIGS: dict[str, str] = {"ru": "russian", "en": "english"}
+
+SearchMode = Literal["fts", "ilike"]
+
+course_search_vector: ColumnElement[Any] = Course.__table__.c.search_vector  # type: ignore[attr-defined]
+
+
+def course_search_query(q: str) -> ColumnElement[Any]:
+    """tsquery, объединяющий разбор строки во всех конфигурациях через OR."""
+    queries = [
+        func.websearch_to_tsquery(literal_column(f"'{config}'"), q)
+        for config in SEARCH_CONFIGS.values()
+    ]
+    tsquery: ColumnElement[Any] = queries[0]
+    for query in queries[1:]:
+        tsquery = tsquery.op("||")(query)
+    return tsquery
+
+
+def course_search_match(tsquery: ColumnElement[Any]) -> ColumnElement[bool]:
+    return course_search_vector.op("@@")(tsquery)
+
+
+def course_search_rank(tsquery: ColumnElement[Any]) -> ColumnElement[float]:
+    return func.ts_rank_cd(course_search_vector, tsquery, type_=Float)
+
+
+def course_ilike_match(q: str) -> ColumnElement[bool]:
+    """Старый путь поиска через ILIKE; требует join с User по author_id."""
+    pattern = f"%{q}%"
+    return or_(
+        col(Course.title).ilike(pattern),
+        col(Course.description).ilike(pattern),
+        col(User.first_name).ilike(pattern),
+        col(User.last_name).ilike(pattern),
+    )
+
+
+# Выражение должно совпадать с индексом ix_users_full_name_trgm, поэтому
+# константы встраиваются в SQL, а не передаются параметрами.
+user_full_name: ColumnElement[str] = (
+    func.coalesce(col(User.first_name), literal_column("''"))
+    .op("||")(literal_column("' '"))
+    .op("||")(func.coalesce(col(User.last_name), literal_column("''")))
+)
+
+
+def trigram_match(column: ColumnElement[Any], q: str) -> ColumnElement[bool]:
+    """Совпадение по префиксу или нечёткое совпадение слова (опечатки)."""
+    prefix = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return or_(column.ilike(f"{prefix}%"), literal(q).op("<%")(column))
+
+
+def trigram_rank(column: ColumnElement[Any], q: str) -> ColumnElement[float]:
+    return func.word_similarity(q, column)
@@ -0,0 +1,406 @@
+"""
+Проверка решений SQL-шагов на изолированной базе.
+
+Для каждой версии шага один раз собирается шаблон: база SQLite в памяти, в
+которой выполнены database_schema и initial_data шага. Решение не повторяет
+DDL и INSERT: оно получает копию шаблона, снятую через backup API (копирование
+страниц). Для каждого шаблона заранее держится SQL_RUNNER_POOL_SIZE готовых
+копий, пул пополняется в фоне после каждой проверки. Копия после проверки
+выбрасывается, так что решения не видят изменений друг друга.
+
+Проверка: в копии выполняются запросы решения (можно несколько через «;»),
+затем по очереди test_queries шага; результат каждого сравнивается с
+expected_result без учёта порядка строк (сравниваются хэши отсортированных
+нормализованных строк). Тест с пустым query проверяет строки, которые вернул
+последний запрос самого решения. Проверка прерывается через
+SQL_RUNNER_TIME_LIMIT_MS; ATTACH, PRAGMA и загрузка расширений запрещены.
+Схема и данные автора собирают шаблон под теми же ограничениями времени,
+размера базы и запрещённых команд; параллельные запросы к ещё не собранному
+шаблону ждут одну сборку.
+
+Память ограничена: копия не растёт больше SQL_RUNNER_MAX_DB_MB (PRAGMA
+max_page_count), решение длиннее SQL_RUNNER_MAX_SQL_LENGTH символов не
+выполняется, результат запроса — не больше SQL_RUNNER_MAX_ROWS строк и
+SQL_RUNNER_MAX_RESULT_BYTES байт строк и BLOB (на столько же ограничено и
+одно значение). Проверки идут в собственном пуле из SQL_RUNNER_WORKERS
+потоков; если ждущих и выполняющихся уже SQL_RUNNER_MAX_PENDING, новая
+проверка сразу получает SQLRunnerBusy (ответ 429), а не растит очередь.
+
+Схема и данные шага пишутся на SQL, понятном SQLite.
+"""
+
+import asyncio
+import functools
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections.abc import Awaitable, Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, TypeVar
+from uuid import UUID
+
+from pydantic import ValidationError
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.schemas.step_content import SQLStepContent
+
+T = TypeVar("T")
+
+# (step_id, Step.version)
+TemplateKey = tuple[UUID, int]
+
+_DENIED_ACTIONS = frozenset(
+    {sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH, sqlite3.SQLITE_PRAGMA}
+)
+
+
+class InvalidSQLStep(Exception):
+    """Схему, данные или тесты шага не удалось подготовить."""
+
+
+class SQLRunnerBusy(Exception):
+    """Проверок в работе и в очереди уже SQL_RUNNER_MAX_PENDING."""
+
+
+@dataclass
+class SQLRunResult:
+    is_correct: bool
+    # Номер (с нуля) первого не пройденного теста
+    failed_test: int | None = None
+    message: str | None = None  # ошибка SQLite в запросе решения
+    time_ms: float = 0
+
+
+def _authorize(action: int, *_args: Any) -> int:
+    if action in _DENIED_ACTIONS:
+        return sqlite3.SQLITE_DENY
+    return sqlite3.SQLITE_OK
+
+
+def _normalize_value(value: Any) -> Any:
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else round(value, 9)
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+def result_digest(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> str:
+    """Хэш результата, не зависящий от порядка строк и столбцов."""
+    order = sorted(range(len(columns)), key=lambda i: columns[i].lower())
+    header = [columns[i].lower() for i in order]
+    lines = sorted(
+        json.dumps([_normalize_value(row[i]) for i in order], default=str)
+        for row in rows
+    )
+    return hashlib.sha256(json.dumps([header, lines]).encode()).hexdigest()
+
+
+def expected_digest(expected_result: list[dict[str, Any]]) -> str | None:
+    """Хэш ожидаемого результата; None — ожидается пустой результат."""
+    if not expected_result:
+        return None
+    columns = list(expected_result[0])
+    rows = [[row.get(column) for column in columns] for row in expected_result]
+    return result_digest(columns, rows)
+
+
+def split_statements(sql: str) -> list[str]:
+    """Разбить скрипт на запросы, не разрезая строковые литералы и триггеры."""
+    statements: list[str] = []
+    current = ""
+    for part in sql.split(";"):
+        current += part + ";"
+        if sqlite3.complete_statement(current):
+            if current.strip(" \t\r\n;"):
+                statements.append(current)
+            current = ""
+    if current.strip(" \t\r\n;"):
+        statements.append(current)
+    return statements
+
+
+class _Template:
+    def __init__(
+        self,
+        content: SQLStepContent,
+        *,
+        time_limit_ms: int,
+        max_db_bytes: int,
+        max_value_bytes: int,
+    ) -> None:
+        self.db = sqlite3.connect(
+            ":memory:", check_same_thread=False, isolation_level=None
+        )
+        page_size = self.db.execute("PRAGMA page_size").fetchone()[0]
+        self.max_pages = max(max_db_bytes // page_size, 1)
+        self.max_value_bytes = max_value_bytes
+        # Схему и данные пишет автор шага: пределы те же, что у решения
+        self.db.execute(f"PRAGMA max_page_count = {self.max_pages}")
+        self.db.setlimit(sqlite3.SQLITE_LIMIT_LENGTH, max_value_bytes)
+        self.db.set_authorizer(_authorize)
+        deadline = time.monotonic() + time_limit_ms / 1000
+        self.db.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+        try:
+            self.db.executescript(content.database_schema)
+            if content.initial_data:
+                self.db.executescript(content.initial_data)
+        except sqlite3.Error as e:
+            self.db.close()
+            if "interrupted" in str(e):
+                raise InvalidSQLStep(
+                    f"Schema and data took longer than {time_limit_ms} ms"
+                )
+            raise InvalidSQLStep(str(e))
+        self.db.set_progress_handler(None, 0)
+        self.tests = [
+            (test.query, expected_digest(test.expected_result))
+            for test in content.test_queries
+        ]
+        self.lock = threading.Lock()
+        self.ready: list[sqlite3.Connection] = []
+        self._filling = 0  # копии, которые сейчас снимает refill
+
+    def clone(self) -> sqlite3.Connection:
+        db = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        with self.lock:
+            self.db.backup(db)
+        # До авторизатора: решению PRAGMA запрещены. Меньше текущего размера
+        # SQLite лимит не опускает, так что данные шаблона всегда помещаются
+        db.execute(f"PRAGMA max_page_count = {self.max_pages}")
+        db.setlimit(sqlite3.SQLITE_LIMIT_LENGTH, self.max_value_bytes)
+        db.set_authorizer(_authorize)
+        return db
+
+    def acquire(self) -> sqlite3.Connection:
+        with self.lock:
+            if self.ready:
+                return self.ready.pop()
+        return self.clone()
+
+    def refill(self, size: int) -> None:
+        while True:
+            # Место в пуле занимается под замком: параллельные refill не
+            # снимут лишних копий
+            with self.lock:
+                if len(self.ready) + self._filling >= size:
+                    return
+                self._filling += 1
+            try:
+                db = self.clone()
+            finally:
+                with self.lock:
+                    self._filling -= 1
+            with self.lock:
+                self.ready.append(db)
+
+
+def _fetch(
+    db: sqlite3.Connection, sql: str, max_rows: int, max_bytes: int
+) -> tuple[list[str], list[Any]] | None:
+    """Выполнить запрос; вернуть столбцы и строки, если запрос их возвращает."""
+    cursor = db.execute(sql)
+    if cursor.description is None:
+        return None
+    rows: list[Any] = []
+    size = 0
+    # Построчно: лимит срабатывает до того, как результат окажется в памяти
+    for row in cursor:
+        rows.append(row)
+        if len(rows) > max_rows:
+            raise sqlite3.OperationalError(f"Result has more than {max_rows} rows")
+        size += sum(len(value) for value in row if isinstance(value, str | bytes))
+        if size > max_bytes:
+            raise sqlite3.OperationalError(f"Result is larger than {max_bytes} bytes")
+    return [column[0] for column in cursor.description], rows
+
+
+def _run(
+    template: _Template,
+    sql: str,
+    *,
+    time_limit_ms: int,
+    max_rows: int,
+    max_result_bytes: int,
+    max_sql_length: int,
+) -> SQLRunResult:
+    started = time.perf_counter()
+    if len(sql) > max_sql_length:
+        return SQLRunResult(
+            is_correct=False,
+            failed_test=0,
+            message=f"Query is longer than {max_sql_length} characters",
+        )
+    deadline = time.monotonic() + time_limit_ms / 1000
+    db = template.acquire()
+    db.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+
+    def result(is_correct: bool, **kwargs: Any) -> SQLRunResult:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        return SQLRunResult(is_correct=is_correct, time_ms=elapsed_ms, **kwargs)
+
+    try:
+        answer = None
+        try:
+            for statement in split_statements(sql):
+                answer = _fetch(db, statement, max_rows, max_result_bytes) or answer
+        except sqlite3.Error as e:
+            message = "Time limit exceeded" if "interrupted" in str(e) else str(e)
+            return result(False, failed_test=0, message=message)
+
+        for index, (query, expected) in enumerate(template.tests):
+            try:
+                got = (
+                    _fetch(db, query, max_rows, max_result_bytes)
+                    if query.strip()
+                    else answer
+                )
+            except sqlite3.Error:
+                # Решение сломало схему, на которую опирается тест
+                return result(False, failed_test=index)
+            if got is None:
+                passed = False
+            elif expected is None:
+                passed = not got[1]
+            else:
+                passed = result_digest(*got) == expected
+            if not passed:
+                return result(False, failed_test=index)
+        return result(True)
+    finally:
+        db.close()
+
+
+class SQLRunner:
+    def __init__(
+        self,
+        *,
+        pool_size: int,
+        time_limit_ms: int,
+        max_rows: int,
+        max_templates: int,
+        max_workers: int,
+        max_pending: int,
+        max_db_bytes: int,
+        max_result_bytes: int,
+        max_sql_length: int,
+    ) -> None:
+        self.pool_size = pool_size
+        self.time_limit_ms = time_limit_ms
+        self.max_rows = max_rows
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_db_bytes = max_db_bytes
+        self.max_result_bytes = max_result_bytes
+        self.max_sql_length = max_sql_length
+        self.templates: LRUCache[TemplateKey, _Template] = LRUCache(max_templates)
+        self._refills: set[asyncio.Task[None]] = set()
+        self._building: dict[TemplateKey, asyncio.Task[_Template]] = {}
+        self._executor: ThreadPoolExecutor | None = None
+        self._pending = 0  # меняется только из цикла событий
+
+    def __len__(self) -> int:
+        return self._pending
+
+    async def _call(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                self.max_workers, thread_name_prefix="sql-runner"
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def _template(
+        self, key: TemplateKey, load_content: Callable[[], Awaitable[dict[str, Any]]]
+    ) -> _Template:
+        template = self.templates.get(key)
+        if template is not None:
+            return template
+        building = self._building.get(key)
+        if building is None:
+            # Содержимое грузится в сессии этого запроса, до общей сборки
+            try:
+                content = SQLStepContent.model_validate(await load_content())
+            except ValidationError as e:
+                raise InvalidSQLStep(str(e))
+            if not content.test_queries:
+                raise InvalidSQLStep("Step has no test queries")
+            # Пока грузилось содержимое, шаблон мог собрать другой запрос
+            template = self.templates.get(key)
+            if template is not None:
+                return template
+            building = self._building.get(key)
+            if building is None:
+                building = asyncio.create_task(self._build(key, content))
+                self._building[key] = building
+        # Отключившийся клиент не отменяет сборку, которую ждут другие запросы
+        return await asyncio.shield(building)
+
+    async def _build(self, key: TemplateKey, content: SQLStepContent) -> _Template:
+        try:
+            template = await self._call(
+                _Template,
+                content,
+                time_limit_ms=self.time_limit_ms,
+                max_db_bytes=self.max_db_bytes,
+                max_value_bytes=self.max_result_bytes,
+            )
+            await self._call(template.refill, self.pool_size)
+            self.templates.set(key, template)
+            return template
+        finally:
+            del self._building[key]
+
+    async def run(
+        self,
+        *,
+        step_id: UUID,
+        version: int,
+        load_content: Callable[[], Awaitable[dict[str, Any]]],
+        sql: str,
+    ) -> SQLRunResult:
+        """
+        Проверить решение шага. load_content вызывается, только если шаблона
+        этой версии шага ещё нет. SQLRunnerBusy — очередь проверок полна.
+        """
+        if self._pending >= self.max_pending:
+            raise SQLRunnerBusy
+        self._pending += 1
+        try:
+            template = await self._template((step_id, version), load_content)
+            result = await self._call(
+                _run,
+                template,
+                sql,
+                time_limit_ms=self.time_limit_ms,
+                max_rows=self.max_rows,
+                max_result_bytes=self.max_result_bytes,
+                max_sql_length=self.max_sql_length,
+            )
+        finally:
+            self._pending -= 1
+        refill = asyncio.create_task(self._call(template.refill, self.pool_size))
+        self._refills.add(refill)
+        refill.add_done_callback(self._refills.discard)
+        return result
+
+
+sql_runner = SQLRunner(
+    pool_size=settings.SQL_RUNNER_POOL_SIZE,
+    time_limit_ms=settings.SQL_RUNNER_TIME_LIMIT_MS,
+    max_rows=settings.SQL_RUNNER_MAX_ROWS,
+    max_templates=settings.SQL_RUNNER_MAX_TEMPLATES,
+    max_workers=settings.SQL_RUNNER_WORKERS,
+    max_pending=settings.SQL_RUNNER_MAX_PENDING,
+    max_db_bytes=settings.SQL_RUNNER_MAX_DB_MB * 1024 * 1024,
+    max_result_bytes=settings.SQL_RUNNER_MAX_RESULT_BYTES,
+    max_sql_length=settings.SQL_RUNNER_MAX_SQL_LENGTH,
+)
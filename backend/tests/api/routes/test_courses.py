@@ -0,0 +1,663 @@
+import time
+from typing import Any
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.core.db import wrote_recently
+from app.models import CourseStats, StepProgress, User
+from tests.utils.course import create_course_tree, create_random_course
+from tests.utils.utils import count_queries, random_lower_string
+
+
+def _get_test_user(db: Session) -> User:
+    user = db.exec(select(User).where(User.email == settings.EMAIL_TEST_USER)).first()
+    assert user
+    return user
+
+
+def test_read_author_courses_enriched(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = _get_test_user(db)
+    course = create_random_course(db, author_id=user.id)
+    for action in ("favorite", "enroll"):
+        r = client.post(
+            f"{settings.API_V1_STR}/courses/{course.id}/{action}",
+            headers=normal_user_token_headers,
+        )
+        assert r.status_code == 200
+
+    r = client.get(
+        f"{settings.API_V1_STR}/courses/author",
+        headers=normal_user_token_headers,
+        params={"limit": 1000},
+    )
+    assert r.status_code == 200
+    data = {c["id"]: c for c in r.json()["data"]}
+    enriched = data[str(course.id)]
+    assert enriched["is_favorite"] is True
+    assert enriched["students_count"] == 1
+    assert enriched["is_enrolled"] is False
+
+
+def test_course_stats_follow_enrollment(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = _get_test_user(db)
+    course = create_random_course(db, author_id=user.id)
+    url = f"{settings.API_V1_STR}/courses/{course.id}"
+
+    client.post(f"{url}/enroll", headers=normal_user_token_headers)
+    client.post(f"{url}/enroll", headers=normal_user_token_headers)
+    client.post(f"{url}/favorite", headers=normal_user_token_headers)
+    r = client.get(url, headers=normal_user_token_headers)
+    assert r.json()["students_count"] == 1
+
+    client.delete(f"{url}/enroll", headers=normal_user_token_headers)
+    client.delete(f"{url}/favorite", headers=normal_user_token_headers)
+    r = client.get(url, headers=normal_user_token_headers)
+    assert r.json()["students_count"] == 0
+
+    stats = db.get(CourseStats, course.id)
+    assert stats
+    db.refresh(stats)
+    assert stats.students_count == 0
+    assert stats.favorites_count == 0
+
+
+def test_read_courses_full_text_search(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = _get_test_user(db)
+    keyword = random_lower_string()
+    in_title = create_random_course(db, author_id=user.id)
+    in_title.title = f"{keyword} course"
+    in_description = create_random_course(db, author_id=user.id)
+    in_description.description = f"Learn about {keyword} here"
+    db.add(in_title)
+    db.add(in_description)
+    db.commit()
+
+    for search_mode in ("fts", "ilike"):
+        r = client.get(
+            f"{settings.API_V1_STR}/courses/",
+            headers=normal_user_token_headers,
+            params={"q": keyword, "search_mode": search_mode},
+        )
+        assert r.status_code == 200
+        ids = [c["id"] for c in r.json()["data"]]
+        assert set(ids) == {str(in_title.id), str(in_description.id)}
+        if search_mode == "fts":
+            # Совпадение в заголовке весит больше, чем в описании
+            assert ids == [str(in_title.id), str(in_description.id)]
+
+
+def test_suggest_courses(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = _get_test_user(db)
+    keyword = random_lower_string()[:16]
+    course = create_random_course(db, author_id=user.id)
+    course.title = f"{keyword} advanced"
+    draft = create_random_course(db, author_id=user.id, is_published=False)
+    draft.title = f"{keyword} draft"
+    db.add(course)
+    db.add(draft)
+    db.commit()
+
+    # Опечатка в последнем символе всё ещё находит курс
+    typo = keyword[:-1] + ("a" if keyword[-1] != "a" else "b")
+    for query in (keyword[:5], typo):
+        r = client.get(
+            f"{settings.API_V1_STR}/courses/suggest",
+            headers=normal_user_token_headers,
+            params={"q": query},
+        )
+        assert r.status_code == 200
+        titles = [c["title"] for c in r.json()["courses"]]
+        assert course.title in titles
+        assert draft.title not in titles
+
+    r = client.get(
+        f"{settings.API_V1_STR}/courses/suggest",
+        headers=normal_user_token_headers,
+        params={"q": keyword, "limit": 1000},
+    )
+    assert r.status_code == 422
+
+
+def test_read_author_courses_cursor_pagination(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = _get_test_user(db)
+    for _ in range(5):
+        create_random_course(db, author_id=user.id)
+    url = f"{settings.API_V1_STR}/courses/author"
+
+    r = client.get(url, headers=normal_user_token_headers, params={"limit": 1000})
+    expected = [c["id"] for c in r.json()["data"]]
+
+    seen: list[str] = []
+    cursor = ""
+    while cursor is not None:
+        r = client.get(
+            url,
+            headers=normal_user_token_headers,
+            params={"limit": 2, "cursor": cursor},
+        )
+        assert r.status_code == 200
+        page = r.json()
+        assert page["count"] is None
+        seen.extend(c["id"] for c in page["data"])
+        assert page["has_more"] is (page["next_cursor"] is not None)
+        cursor = page["next_cursor"]
+
+    assert seen == expected
+
+    r = client.get(
+        url, headers=normal_user_token_headers, params={"cursor": "not-a-cursor"}
+    )
+    assert r.status_code == 400
+
+
+def test_read_courses_query_count_is_constant(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = _get_test_user(db)
+    for _ in range(10):
+        create_random_course(db, author_id=user.id)
+
+    query_counts = {}
+    for path in ("/courses/", "/courses/author"):
+        for limit in (1, 10):
+            with count_queries() as statements:
+                r = client.get(
+                    f"{settings.API_V1_STR}{path}",
+                    headers=normal_user_token_headers,
+                    params={"limit": limit},
+                )
+            assert r.status_code == 200
+            assert len(r.json()["data"]) == limit
+            query_counts[(path, limit)] = len(statements)
+
+    assert query_counts[("/courses/", 1)] == query_counts[("/courses/", 10)]
+    assert query_counts[("/courses/author", 1)] == query_counts[("/courses/author", 10)]
+
+
+def test_read_course_outline(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = _get_test_user(db)
+    course = create_random_course(db, author_id=user.id)
+    steps = create_course_tree(db, course_id=course.id, modules=2, lessons=2, steps=3)
+    db.add(StepProgress(user_id=user.id, step_id=steps[0].id))
+    db.commit()
+
+    url = f"{settings.API_V1_STR}/courses/{course.id}/outline"
+    with count_queries() as statements:
+        r = client.get(url, headers=normal_user_token_headers)
+    assert r.status_code == 200
+    outline = r.json()
+    assert [m["position"] for m in outline["modules"]] == [0, 1]
+    lesson_steps = outline["modules"][0]["lessons"][0]["steps"]
+    assert [s["position"] for s in lesson_steps] == [0, 1, 2]
+    assert "content" not in lesson_steps[0]
+    completed = [
+        s["id"]
+        for m in outline["modules"]
+        for lesson in m["lessons"]
+        for s in lesson["steps"]
+        if s["is_completed"]
+    ]
+    assert completed == [str(steps[0].id)]
+
+    small_course = create_random_course(db, author_id=user.id)
+    create_course_tree(db, course_id=small_course.id, modules=1, lessons=1, steps=1)
+    with count_queries() as small_statements:
+        r = client.get(
+            f"{settings.API_V1_STR}/courses/{small_course.id}/outline",
+            headers=normal_user_token_headers,
+        )
+    assert r.status_code == 200
+    assert len(statements) == len(small_statements)
+
+
+def test_course_outline_cache_invalidated_by_author_edits(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    superuser_token_headers: dict[str, str],
+    db: Session,
+) -> None:
+    user = _get_test_user(db)
+    course = create_random_course(db, author_id=user.id)
+    steps = create_course_tree(db, course_id=course.id, modules=1, lessons=1, steps=1)
+    url = f"{settings.API_V1_STR}/courses/{course.id}/outline"
+
+    r = client.get(url, headers=normal_user_token_headers)
+    assert r.status_code == 200
+    with count_queries() as statements:
+        r = client.get(url, headers=normal_user_token_headers)
+    assert r.status_code == 200
+    # Из БД читается только прогресс пользователя
+    assert len(statements) == 1
+
+    r = client.post(
+        f"{settings.API_V1_STR}/lessons/{steps[0].lesson_id}/steps/",
+        headers=normal_user_token_headers,
+        json={"title": "New step", "position": 1},
+    )
+    assert r.status_code == 200
+    r = client.get(url, headers=normal_user_token_headers)
+    lesson_steps = r.json()["modules"][0]["lessons"][0]["steps"]
+    assert [s["title"] for s in lesson_steps] == ["Step 0", "New step"]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/cache-metrics/", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    assert r.json()["hits"] > 0
+    assert r.json()["invalidations"] > 0
+
+
+def test_enroll_opens_read_your_writes_window(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = _get_test_user(db)
+    course = create_random_course(db, author_id=user.id)
+    r = client.post(
+        f"{settings.API_V1_STR}/courses/{course.id}/enroll",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 200
+    # Следующие чтения пользователя идут на primary, а не на реплику
+    assert wrote_recently(str(user.id))
+
+
+def test_complete_steps_in_bulk(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = _get_test_user(db)
+    course = create_random_course(db, author_id=user.id)
+    steps = create_course_tree(db, course_id=course.id, modules=1, lessons=1, steps=3)
+    lesson_url = f"{settings.API_V1_STR}/lessons/{steps[0].lesson_id}/steps"
+
+    r = client.post(
+        f"{lesson_url}/{steps[0].id}/complete", headers=normal_user_token_headers
+    )
+    assert r.status_code == 200
+    first_progress_id = r.json()["id"]
+    r = client.post(
+        f"{lesson_url}/{steps[0].id}/complete", headers=normal_user_token_headers
+    )
+    assert r.status_code == 200
+    assert r.json()["id"] == first_progress_id
+
+    other_course = create_random_course(db, author_id=user.id)
+    foreign_step = create_course_tree(
+        db, course_id=other_course.id, modules=1, lessons=1, steps=1
+    )[0]
+    r = client.post(
+        f"{lesson_url}/complete",
+        headers=normal_user_token_headers,
+        json={"step_ids": [str(s.id) for s in (*steps, foreign_step)]},
+    )
+    assert r.status_code == 200
+    assert sorted(r.json()["step_ids"]) == sorted(str(s.id) for s in steps)
+    assert r.json()["created_count"] == 2
+
+    completed = db.exec(
+        select(StepProgress).where(StepProgress.user_id == user.id)
+    ).all()
+    assert {p.step_id for p in completed} >= {s.id for s in steps}
+    assert foreign_step.id not in {p.step_id for p in completed}
+    stats = db.get(CourseStats, course.id)
+    assert stats
+    db.refresh(stats)
+    assert stats.completions_count == 3
+
+
+def test_my_courses_include_progress(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = _get_test_user(db)
+    course = create_random_course(db, author_id=user.id)
+    steps = create_course_tree(db, course_id=course.id, modules=1, lessons=2, steps=2)
+    # Шаги созданы в обход API, поэтому счётчики курса заполняем сами
+    db.add(CourseStats(course_id=course.id, steps_count=len(steps)))
+    db.commit()
+    client.post(
+        f"{settings.API_V1_STR}/courses/{course.id}/enroll",
+        headers=normal_user_token_headers,
+    )
+    lesson_url = f"{settings.API_V1_STR}/lessons/{steps[0].lesson_id}/steps"
+    r = client.post(
+        f"{lesson_url}/complete",
+        headers=normal_user_token_headers,
+        json={"step_ids": [str(steps[0].id), str(steps[1].id)]},
+    )
+    assert r.status_code == 200
+
+    def course_progress() -> dict[str, Any]:
+        r = client.get(
+            f"{settings.API_V1_STR}/courses/progress",
+            headers=normal_user_token_headers,
+            params={"limit": 1000},
+        )
+        assert r.status_code == 200
+        data = {c["id"]: c for c in r.json()["data"]}
+        return data[str(course.id)]["progress"]  # type: ignore[no-any-return]
+
+    progress = course_progress()
+    assert progress["completed_steps"] == 2
+    assert progress["total_steps"] == 4
+    assert progress["percent"] == 50
+    assert progress["last_step_id"] in {str(steps[0].id), str(steps[1].id)}
+
+    r = client.delete(f"{lesson_url}/{steps[1].id}", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    progress = course_progress()
+    assert progress["completed_steps"] == 1
+    assert progress["total_steps"] == 3
+
+
+def test_lesson_steps_projection_and_content_etag(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = _get_test_user(db)
+    course = create_random_course(db, author_id=user.id)
+    steps = create_course_tree(db, course_id=course.id, modules=1, lessons=1, steps=2)
+    lesson_url = f"{settings.API_V1_STR}/lessons/{steps[0].lesson_id}/steps"
+
+    r = client.get(
+        f"{lesson_url}/",
+        headers=normal_user_token_headers,
+        params={"include_content": False},
+    )
+    assert r.status_code == 200
+    assert [s["id"] for s in r.json()] == [str(s.id) for s in steps]
+    assert all(s["content"] is None for s in r.json())
+
+    r = client.get(
+        f"{lesson_url}/{steps[0].id}/content", headers=normal_user_token_headers
+    )
+    assert r.status_code == 200
+    assert r.json() == steps[0].content
+    etag = r.headers["etag"]
+
+    r = client.get(
+        f"{lesson_url}/{steps[0].id}/content",
+        headers={**normal_user_token_headers, "If-None-Match": etag},
+    )
+    assert r.status_code == 304
+
+    r = client.put(
+        f"{lesson_url}/{steps[0].id}",
+        headers=normal_user_token_headers,
+        json={"content": {"text": "changed"}},
+    )
+    assert r.status_code == 200
+    r = client.get(
+        f"{lesson_url}/{steps[0].id}/content",
+        headers={**normal_user_token_headers, "If-None-Match": etag},
+    )
+    assert r.status_code == 200
+    assert r.json() == {"text": "changed"}
+    assert r.headers["etag"] != etag
+
+
+def test_step_content_validated_and_searchable(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = _get_test_user(db)
+    course = create_random_course(db, author_id=user.id)
+    steps = create_course_tree(db, course_id=course.id, modules=1, lessons=1, steps=1)
+    lesson_url = f"{settings.API_V1_STR}/lessons/{steps[0].lesson_id}/steps"
+    language = random_lower_string()
+
+    r = client.post(
+        f"{lesson_url}/",
+        headers=normal_user_token_headers,
+        json={"title": "Quiz", "step_type": 3, "content": {"question": "?"}},
+    )
+    assert r.status_code == 422
+
+    r = client.post(
+        f"{lesson_url}/",
+        headers=normal_user_token_headers,
+        json={"title": "Code", "step_type": 2, "content": {"task": "Sum"}},
+    )
+    assert r.status_code == 200
+    code_step = r.json()
+    assert code_step["content"]["language"] == "python"
+
+    r = client.put(
+        f"{lesson_url}/{code_step['id']}",
+        headers=normal_user_token_headers,
+        json={"content": {"task": "Sum", "language": language}},
+    )
+    assert r.status_code == 200
+
+    r = client.get(
+        f"{settings.API_V1_STR}/content/steps",
+        headers=normal_user_token_headers,
+        params={"language": language},
+    )
+    assert r.status_code == 200
+    assert [s["id"] for s in r.json()] == [code_step["id"]]
+
+
+def test_submit_step_answer(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = _get_test_user(db)
+    course = create_random_course(db, author_id=user.id)
+    steps = create_course_tree(db, course_id=course.id, modules=1, lessons=1, steps=1)
+    lesson_url = f"{settings.API_V1_STR}/lessons/{steps[0].lesson_id}/steps"
+
+    r = client.post(
+        f"{lesson_url}/",
+        headers=normal_user_token_headers,
+        json={
+            "title": "Number",
+            "step_type": 9,
+            "content": {"question": "2 + 2?", "answer": 4, "tolerance": 0},
+        },
+    )
+    assert r.status_code == 200
+    submit_url = f"{lesson_url}/{r.json()['id']}/submit"
+
+    r = client.post(submit_url, headers=normal_user_token_headers, json={"answer": 5})
+    assert r.status_code == 200
+    assert r.json() == {"is_correct": False, "is_completed": False}
+
+    r = client.post(submit_url, headers=normal_user_token_headers, json={"answer": [4]})
+    assert r.status_code == 422
+
+    r = client.post(
+        submit_url, headers=normal_user_token_headers, json={"answer": "4,0"}
+    )
+    assert r.status_code == 200
+    assert r.json() == {"is_correct": True, "is_completed": True}
+
+    r = client.post(
+        f"{lesson_url}/{steps[0].id}/submit",
+        headers=normal_user_token_headers,
+        json={"answer": "text"},
+    )
+    assert r.status_code == 400
+
+
+def test_learner_never_sees_answer_key(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    superuser_token_headers: dict[str, str],
+    db: Session,
+) -> None:
+    user = _get_test_user(db)
+    course = create_random_course(db, author_id=user.id)
+    steps = create_course_tree(db, course_id=course.id, modules=1, lessons=1, steps=1)
+    lesson_url = f"{settings.API_V1_STR}/lessons/{steps[0].lesson_id}/steps"
+    content = {
+        "question": "2 + 2?",
+        "options": [{"text": "4", "is_correct": True}, {"text": "5"}],
+        "explanation": "4",
+    }
+    r = client.post(
+        f"{lesson_url}/",
+        headers=normal_user_token_headers,
+        json={"title": "Quiz", "step_type": 3, "content": content},
+    )
+    assert r.status_code == 200
+    step_id = r.json()["id"]
+
+    # Суперпользователь здесь не автор курса, т.е. видит шаг как ученик
+    learner_views = [
+        r.json()["content"]
+        for r in (
+            client.get(f"{lesson_url}/{step_id}", headers=superuser_token_headers),
+            client.get(
+                f"{lesson_url}/{step_id}/content", headers=superuser_token_headers
+            ),
+        )
+    ] + [
+        step["content"]
+        for step in client.get(f"{lesson_url}/", headers=superuser_token_headers).json()
+        if step["id"] == step_id
+    ]
+    assert len(learner_views) == 3
+    for view in learner_views:
+        assert view == {"question": "2 + 2?", "options": [{"text": "4"}, {"text": "5"}]}
+
+    r = client.get(f"{lesson_url}/{step_id}/content", headers=normal_user_token_headers)
+    assert r.json()["options"][0]["is_correct"] is True
+    assert r.json()["explanation"] == "4"
+
+
+def test_code_step_runs(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = _get_test_user(db)
+    course = create_random_course(db, author_id=user.id)
+    steps = create_course_tree(db, course_id=course.id, modules=1, lessons=1, steps=1)
+    lesson_url = f"{settings.API_V1_STR}/lessons/{steps[0].lesson_id}/steps"
+
+    r = client.post(
+        f"{lesson_url}/",
+        headers=normal_user_token_headers,
+        json={
+            "title": "Sum",
+            "step_type": 2,
+            "content": {
+                "task": "Sum",
+                "test_cases": [
+                    {"input": "1 2", "expected_output": "3"},
+                    {"input": "2 2", "expected_output": "4"},
+                ],
+            },
+        },
+    )
+    assert r.status_code == 200
+    step_url = f"{lesson_url}/{r.json()['id']}"
+
+    def run(code: str) -> dict[str, Any]:
+        r = client.post(
+            f"{step_url}/runs", headers=normal_user_token_headers, json={"code": code}
+        )
+        assert r.status_code == 202
+        run = r.json()
+        deadline = time.monotonic() + 30
+        while run["status"] in ("queued", "running"):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+            r = client.get(
+                f"{step_url}/runs/{run['id']}", headers=normal_user_token_headers
+            )
+            assert r.status_code == 200
+            run = r.json()
+        return run
+
+    run_wrong = run("a, b = map(int, input().split())\nprint(a * b)")
+    assert run_wrong["verdict"] == "wrong_answer"
+    assert run_wrong["failed_test"] == 0
+
+    code = "a, b = map(int, input().split())\nprint(a + b)"
+    run_ok = run(code)
+    assert run_ok["verdict"] == "accepted"
+    assert run_ok["passed_tests"] == 2
+
+    r = client.post(
+        f"{step_url}/runs", headers=normal_user_token_headers, json={"code": code}
+    )
+    assert r.json()["status"] == "done"
+
+    r = client.get(f"{lesson_url}/", headers=normal_user_token_headers)
+    assert [s["is_completed"] for s in r.json() if s["title"] == "Sum"] == [True]
+
+
+def test_submit_sql_step(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = _get_test_user(db)
+    course = create_random_course(db, author_id=user.id)
+    steps = create_course_tree(db, course_id=course.id, modules=1, lessons=1, steps=1)
+    lesson_url = f"{settings.API_V1_STR}/lessons/{steps[0].lesson_id}/steps"
+
+    r = client.post(
+        f"{lesson_url}/",
+        headers=normal_user_token_headers,
+        json={
+            "title": "SQL",
+            "step_type": 12,
+            "content": {
+                "task": "Total salary by department",
+                "database_schema": "create table emp (name text, dept text, pay int);",
+                "initial_data": "insert into emp values ('a', 'x', 1), ('b', 'x', 2), "
+                "('c', 'y', 3);",
+                "test_queries": [
+                    {
+                        "query": "",
+                        "expected_result": [
+                            {"dept": "x", "total": 3},
+                            {"dept": "y", "total": 3},
+                        ],
+                    },
+                    {
+                        "query": "select count(*) as n from emp",
+                        "expected_result": [{"n": 3}],
+                    },
+                ],
+            },
+        },
+    )
+    assert r.status_code == 200
+    submit_url = f"{lesson_url}/{r.json()['id']}/submit"
+
+    r = client.post(
+        submit_url,
+        headers=normal_user_token_headers,
+        json={"answer": "delete from emp; select 'x' as dept, 3 as total"},
+    )
+    assert r.status_code == 200
+    assert r.json()["is_correct"] is False
+    assert r.json()["failed_test"] == 0
+
+    r = client.post(
+        submit_url,
+        headers=normal_user_token_headers,
+        json={"answer": "select * from t"},
+    )
+    assert r.json()["message"] == "no such table: t"
+
+    r = client.post(
+        submit_url,
+        headers=normal_user_token_headers,
+        json={
+            "answer": "select dept, sum(pay) as total from emp "
+            "group by dept order by dept desc"
+        },
+    )
+    assert r.status_code == 200
+    assert r.json()["is_correct"] is True
+    assert r.json()["is_completed"] is True
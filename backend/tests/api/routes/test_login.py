@@ -4,6 +4,7 @@ from fastapi.testclient import TestClient
 from sqlmodel import Session
 
 from app.core.config import settings
+from app.core.rate_limit import InMemoryRateLimitBackend, rate_limiter
 from app.core.security import verify_password
 from app.crud import create_user
 from app.models import UserCreate
@@ -116,3 +117,91 @@ def test_reset_password_invalid_token(
     assert "detail" in response
     assert r.status_code == 400
     assert response["detail"] == "Invalid token"
+
+
+def _login_tokens(client: TestClient) -> dict[str, str]:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 200
+    return r.json()  # type: ignore[no-any-return]
+
+
+def test_refresh_token_rotation_and_reuse(client: TestClient) -> None:
+    refresh_token = _login_tokens(client)["refresh_token"]
+
+    r = client.post(
+        f"{settings.API_V1_STR}/login/refresh-token",
+        params={"refresh_token": refresh_token},
+    )
+    assert r.status_code == 200
+    rotated = r.json()["refresh_token"]
+    assert rotated != refresh_token
+
+    # Повтор старого токена отзывает и новый, полученный из того же входа
+    r = client.post(
+        f"{settings.API_V1_STR}/login/refresh-token",
+        params={"refresh_token": refresh_token},
+    )
+    assert r.status_code == 401
+    assert r.json()["detail"] == "Refresh token reuse detected"
+    r = client.post(
+        f"{settings.API_V1_STR}/login/refresh-token",
+        params={"refresh_token": rotated},
+    )
+    assert r.status_code == 401
+    assert r.json()["detail"] == "Refresh token revoked"
+
+    # Другой вход того же пользователя не затронут
+    r = client.post(
+        f"{settings.API_V1_STR}/login/refresh-token",
+        params={"refresh_token": _login_tokens(client)["refresh_token"]},
+    )
+    assert r.status_code == 200
+
+
+def test_revoke_refresh_token(client: TestClient) -> None:
+    tokens = _login_tokens(client)
+    r = client.post(
+        f"{settings.API_V1_STR}/login/refresh-token",
+        params={"refresh_token": tokens["refresh_token"]},
+    )
+    rotated = r.json()["refresh_token"]
+
+    r = client.post(
+        f"{settings.API_V1_STR}/login/revoke-token",
+        headers={"Authorization": f"Bearer {tokens['access_token']}"},
+        params={"refresh_token": rotated},
+    )
+    assert r.status_code == 200
+    r = client.post(
+        f"{settings.API_V1_STR}/login/refresh-token",
+        params={"refresh_token": rotated},
+    )
+    assert r.status_code == 401
+
+
+def test_login_rate_limited_by_email(client: TestClient) -> None:
+    backend = rate_limiter.backend
+    rate_limiter.use_backend(InMemoryRateLimitBackend(max_keys=100))
+    rate_limiter.enabled = True
+    try:
+        login_data = {"username": random_email(), "password": "incorrect"}
+        for _ in range(settings.RATE_LIMIT_LOGIN_PER_EMAIL):
+            r = client.post(
+                f"{settings.API_V1_STR}/login/access-token", data=login_data
+            )
+            assert r.status_code == 400
+        r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+        assert r.status_code == 429
+        assert int(r.headers["Retry-After"]) >= 1
+
+        # Другой email с того же адреса ещё проходит
+        login_data["username"] = random_email()
+        r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+        assert r.status_code == 400
+    finally:
+        rate_limiter.enabled = False
+        rate_limiter.use_backend(backend)
@@ -8,6 +8,7 @@ from app import crud
 from app.core.config import settings
 from app.core.security import verify_password
 from app.models import User, UserCreate
+from tests.utils.user import user_authentication_headers
 from tests.utils.utils import random_email, random_lower_string
 
 
@@ -168,6 +169,45 @@ def test_retrieve_users(
         assert "email" in item
 
 
+def test_retrieve_users_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    url = f"{settings.API_V1_STR}/users/"
+    r = client.get(url, headers=superuser_token_headers, params={"cursor": "", "limit": 1})
+    first_page = r.json()
+    assert r.status_code == 200
+    assert first_page["count"] is None
+    assert first_page["has_more"] is True
+
+    r = client.get(
+        url,
+        headers=superuser_token_headers,
+        params={"cursor": first_page["next_cursor"], "limit": 1},
+    )
+    second_page = r.json()
+    assert r.status_code == 200
+    assert second_page["data"][0]["id"] > first_page["data"][0]["id"]
+
+
+def test_retrieve_users_count_strategy(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    url = f"{settings.API_V1_STR}/users/"
+    r = client.get(url, headers=superuser_token_headers, params={"count_strategy": "none"})
+    assert r.status_code == 200
+    assert r.json()["count"] is None
+    assert r.json()["count_strategy"] == "none"
+
+    # На маленькой таблице оценка не используется: считаем точно
+    r = client.get(
+        url, headers=superuser_token_headers, params={"count_strategy": "estimated"}
+    )
+    exact = client.get(url, headers=superuser_token_headers).json()
+    assert r.status_code == 200
+    assert r.json()["count_strategy"] == "exact"
+    assert r.json()["count"] == exact["count"]
+
+
 def test_update_user_me(
     client: TestClient, normal_user_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -346,6 +386,38 @@ def test_update_user(
     assert user_db.full_name == "Updated_full_name"
 
 
+def test_deactivated_user_is_rejected_despite_user_cache(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    username = random_email()
+    password = random_lower_string()
+    r = client.post(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        json={"email": username, "password": password},
+    )
+    assert r.status_code == 200
+    user_id = r.json()["id"]
+    headers = user_authentication_headers(
+        client=client, email=username, password=password
+    )
+    # Первый запрос кладёт пользователя в кэш, второй обслуживается из него
+    for _ in range(2):
+        r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+        assert r.status_code == 200
+
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/{user_id}",
+        headers=superuser_token_headers,
+        json={"is_active": False},
+    )
+    assert r.status_code == 200
+
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Inactive user"
+
+
 def test_update_user_not_exists(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -0,0 +1,20 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+
+
+def test_db_metrics(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+) -> None:
+    url = f"{settings.API_V1_STR}/utils/db-metrics/"
+    r = client.get(url, headers=normal_user_token_headers)
+    assert r.status_code == 403
+
+    r = client.get(url, headers=superuser_token_headers)
+    assert r.status_code == 200
+    metrics = r.json()
+    assert metrics["primary"]["checkouts"] > 0
+    assert metrics["primary"]["max_wait_seconds"] >= 0
+    assert len(metrics) == 1 + len(settings.POSTGRES_REPLICA_URIS)
@@ -0,0 +1,120 @@
+"""
+Сравнение полнотекстового поиска (search_mode=fts) и ILIKE на каталоге
+из 10k, 100k и 1M курсов.
+
+Запуск (нужна база с применёнными миграциями):
+
+    python -m tests.benchmarks.bench_course_search [10000 100000 1000000]
+
+Данные создаются внутри транзакции, которая откатывается в конце.
+"""
+
+import sys
+import time
+from collections.abc import Callable
+from uuid import uuid4
+
+from sqlalchemy import Connection, text
+from sqlmodel import col, select
+
+from app.core.db import engine
+from app.models import Course, User
+from app.search import (
+    course_ilike_match,
+    course_search_match,
+    course_search_query,
+    course_search_rank,
+)
+
+QUERIES = ["python", "основы программирования", "data analysis", "иванов"]
+REPEATS = 5
+PAGE_SIZE = 20
+
+WORDS = [
+    "python", "программирование", "основы", "data", "analysis", "machine",
+    "learning", "веб", "разработка", "алгоритмы", "структуры", "данных",
+    "sql", "базы", "математика", "статистика", "design", "frontend",
+]
+
+
+def seed(connection: Connection, size: int) -> None:
+    author_id = uuid4()
+    connection.execute(
+        text(
+            "INSERT INTO users (id, email, hashed_password, is_active, is_superuser,"
+            " first_name, last_name, is_staff, is_teacher, is_profile_private,"
+            " city, date_joined)"
+            " VALUES (:id, :email, 'x', true, false, 'Иван', 'Иванов', false, true,"
+            " false, 'Bishkek', now())"
+        ),
+        {"id": author_id, "email": f"{author_id}@bench.local"},
+    )
+    connection.execute(
+        text(
+            "INSERT INTO course (id, title, short_description, description,"
+            " hours_week, hours_total, has_certificate, difficulty_level,"
+            " is_published, datetime_create, datetime_update, author_id, language_id)"
+            " SELECT gen_random_uuid(),"
+            "  (:words)[1 + i % 18] || ' ' || (:words)[1 + (i / 18) % 18] || ' ' || i,"
+            "  repeat((:words)[1 + (i / 7) % 18] || ' ', 20),"
+            "  repeat((:words)[1 + (i / 3) % 18] || ' ' || (:words)[1 + i % 11] || ' ', 100),"
+            "  NULL, NULL, false, 1, true, now(), now(), :author_id, 1"
+            " FROM generate_series(1, :size) AS i"
+        ),
+        {"words": WORDS, "size": size, "author_id": author_id},
+    )
+    connection.execute(text("ANALYZE course"))
+
+
+def fts_statement(q: str):  # type: ignore[no-untyped-def]
+    tsquery = course_search_query(q)
+    return (
+        select(Course)
+        .where(col(Course.is_published) == True)  # noqa: E712
+        .where(course_search_match(tsquery))
+        .order_by(course_search_rank(tsquery).desc(), col(Course.id))
+        .limit(PAGE_SIZE)
+    )
+
+
+def ilike_statement(q: str):  # type: ignore[no-untyped-def]
+    return (
+        select(Course)
+        .join(User, col(User.id) == col(Course.author_id))
+        .where(col(Course.is_published) == True)  # noqa: E712
+        .where(course_ilike_match(q))
+        .limit(PAGE_SIZE)
+    )
+
+
+def measure(connection: Connection, build: Callable) -> float:  # type: ignore[type-arg]
+    timings = []
+    for q in QUERIES:
+        statement = build(q)
+        for _ in range(REPEATS):
+            started = time.perf_counter()
+            connection.execute(statement).all()
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    for size in sizes:
+        with engine.connect() as connection:
+            transaction = connection.begin()
+            try:
+                seed(connection, size)
+                fts_ms = measure(connection, fts_statement)
+                ilike_ms = measure(connection, ilike_statement)
+            finally:
+                transaction.rollback()
+        print(  # noqa: T201
+            f"{size:>9} courses: fts median {fts_ms:8.2f} ms, "
+            f"ilike median {ilike_ms:8.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
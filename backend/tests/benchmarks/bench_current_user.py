@@ -0,0 +1,74 @@
+"""
+Пропускная способность /users/me и /courses/{id} с кэшем пользователей
+в get_current_user и без него.
+
+Запуск (нужна база с применёнными миграциями и созданным суперпользователем):
+
+    python -m tests.benchmarks.bench_current_user [число запросов]
+
+Запросы идут последовательно через TestClient, поэтому цифры показывают
+стоимость обработки запроса на сервере, а не сетевую задержку. Созданный
+для замера курс удаляется в конце.
+"""
+
+import sys
+import time
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app.core.cache import user_cache
+from app.core.config import settings
+from app.core.db import engine
+from app.main import app
+from app.models import Course, User
+from tests.utils.utils import get_superuser_token_headers
+
+
+def measure(
+    client: TestClient, url: str, headers: dict[str, str], requests: int
+) -> float:
+    client.get(url, headers=headers)  # прогрев
+    started = time.perf_counter()
+    for _ in range(requests):
+        r = client.get(url, headers=headers)
+        assert r.status_code == 200, r.text
+    return requests / (time.perf_counter() - started)
+
+
+def main() -> None:
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with Session(engine) as db:
+        superuser = db.exec(
+            select(User).where(User.email == settings.FIRST_SUPERUSER)
+        ).one()
+        course = Course(title="bench", author_id=superuser.id, is_published=True)
+        db.add(course)
+        db.commit()
+        db.refresh(course)
+
+        try:
+            with TestClient(app) as client:
+                headers = get_superuser_token_headers(client)
+                urls = [
+                    f"{settings.API_V1_STR}/users/me",
+                    f"{settings.API_V1_STR}/courses/{course.id}",
+                ]
+                ttl = user_cache.ttl_seconds
+                for url in urls:
+                    user_cache.ttl_seconds = 0
+                    user_cache.clear()
+                    without_cache = measure(client, url, headers, requests)
+                    user_cache.ttl_seconds = ttl
+                    with_cache = measure(client, url, headers, requests)
+                    print(  # noqa: T201
+                        f"{url:<60} без кэша {without_cache:8.1f} rps, "
+                        f"с кэшем {with_cache:8.1f} rps"
+                    )
+        finally:
+            db.delete(course)
+            db.commit()
+
+
+if __name__ == "__main__":
+    main()
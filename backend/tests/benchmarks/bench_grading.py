@@ -0,0 +1,109 @@
+"""
+Проверка ответов app.grading: компиляция ключа один раз против разбора
+content на каждую попытку.
+
+Для каждого типа шага замеряется проверка верного ответа готовым Checker из
+кэша и полный путь без кэша (валидация content схемой и компиляция). База не
+нужна:
+
+    python -m tests.benchmarks.bench_grading [итераций]
+"""
+
+import sys
+import time
+from collections.abc import Callable
+from typing import Any
+
+from app import grading
+from app.models import StepType
+
+# content шага и верный ответ на него
+CASES: dict[StepType, tuple[dict[str, Any], Any]] = {
+    StepType.QUIZ: (
+        {
+            "question": "Какие числа чётные?",
+            "options": [
+                {"text": "1"},
+                {"text": "2", "is_correct": True},
+                {"text": "3"},
+                {"text": "4", "is_correct": True},
+            ],
+            "multiple": True,
+        },
+        [3, 1],
+    ),
+    StepType.MATCHING: (
+        {
+            "task": "Сопоставьте столицы",
+            "pairs": [
+                {"left": "Франция", "right": "Париж"},
+                {"left": "Италия", "right": "Рим"},
+                {"left": "Испания", "right": "Мадрид"},
+            ],
+        },
+        {"испания": "мадрид", "Франция": "Париж", "Италия": "РИМ"},
+    ),
+    StepType.SORTING: (
+        {
+            "task": "По возрастанию",
+            "items": ["3", "1", "2"],
+            "correct_order": [1, 2, 0],
+        },
+        [1, 2, 0],
+    ),
+    StepType.TABLE: (
+        {
+            "task": "Заполните таблицу",
+            "headers": ["x", "x²"],
+            "rows_count": 3,
+            "correct_answers": [["1", "1"], ["2", "4"], ["3", "9"]],
+        },
+        [["1", "1"], ["2", "4"], ["3", " 9 "]],
+    ),
+    StepType.FILL_BLANKS: (
+        {
+            "text": "{0} — столица {1}",
+            "blanks": [
+                {"position": 0, "answer": "Москва", "case_sensitive": True},
+                {"position": 1, "answer": "России"},
+            ],
+        },
+        ["Москва", "россии"],
+    ),
+    StepType.STRING: (
+        {"question": "Язык этого файла?", "answer": "Python"},
+        "  python ",
+    ),
+    StepType.NUMBER: (
+        {"question": "Число пи", "answer": 3.1416, "tolerance": 0.001},
+        "3,14159",
+    ),
+}
+
+
+def measure(check: Callable[[], bool], iterations: int) -> float:
+    assert check()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        check()
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    for step_type, (content, answer) in CASES.items():
+        checker = grading.compile_checker(step_type, content)
+        cached_us = measure(lambda: checker(answer), iterations)  # noqa: B023
+        uncached_us = measure(
+            lambda: grading.compile_checker(step_type, content)(answer),  # noqa: B023
+            iterations // 10,
+        )
+        print(  # noqa: T201
+            f"{step_type.name:<12} cached {cached_us:6.2f} us "
+            f"({1_000_000 / cached_us:>9,.0f}/s), "
+            f"compile+check {uncached_us:6.2f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
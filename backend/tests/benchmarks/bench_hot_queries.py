@@ -0,0 +1,116 @@
+"""
+Накладные расходы Python на горячие запросы: сборка select() на каждый вызов
+против lambda_stmt из app.queries.
+
+Замеряется то, что происходит до отправки SQL в драйвер: построение
+конструкции, вычисление ключа кэша и поиск в кэше компиляции (как в
+Connection._execute_clauseelement). База не нужна:
+
+    python -m tests.benchmarks.bench_hot_queries [итераций]
+"""
+
+import sys
+import time
+from collections.abc import Callable
+from typing import Any
+from uuid import uuid4
+
+from sqlalchemy import Executable
+from sqlalchemy.dialects.postgresql.asyncpg import PGDialect_asyncpg
+from sqlmodel import col, select
+
+from app import queries
+from app.models import (
+    CourseFavoriteLink,
+    CourseProgress,
+    CourseStats,
+    CourseStudentLink,
+    Lesson,
+    Module,
+    Step,
+    StepProgress,
+    User,
+)
+
+USER_ID = uuid4()
+IDS = [uuid4() for _ in range(20)]
+
+# Те же запросы в виде обычного select(), как они строились до реестра
+CLASSIC: dict[str, Callable[[], Executable]] = {
+    "user_by_email": lambda: select(User).where(col(User.email) == "a@example.com"),
+    "favorite_course_ids": lambda: select(CourseFavoriteLink.course_id).where(
+        col(CourseFavoriteLink.user_id) == USER_ID,
+        col(CourseFavoriteLink.course_id).in_(IDS),
+    ),
+    "enrolled_course_ids": lambda: select(CourseStudentLink.course_id).where(
+        col(CourseStudentLink.user_id) == USER_ID,
+        col(CourseStudentLink.course_id).in_(IDS),
+    ),
+    "students_counts": lambda: select(
+        CourseStats.course_id, CourseStats.students_count
+    ).where(col(CourseStats.course_id).in_(IDS)),
+    "completed_step_ids": lambda: select(StepProgress.step_id).where(
+        col(StepProgress.user_id) == USER_ID,
+        col(StepProgress.step_id).in_(IDS),
+    ),
+    "course_completed_step_ids": lambda: select(StepProgress.step_id)
+    .join(Step, col(Step.id) == col(StepProgress.step_id))
+    .join(Lesson, col(Lesson.id) == col(Step.lesson_id))
+    .join(Module, col(Module.id) == col(Lesson.module_id))
+    .where(col(StepProgress.user_id) == USER_ID, col(Module.course_id) == IDS[0]),
+    "courses_progress": lambda: select(
+        CourseStats.course_id,
+        CourseStats.steps_count,
+        CourseProgress.completed_steps,
+        CourseProgress.last_step_id,
+        CourseProgress.last_activity_at,
+    )
+    .outerjoin(
+        CourseProgress,
+        (col(CourseProgress.course_id) == col(CourseStats.course_id))
+        & (col(CourseProgress.user_id) == USER_ID),
+    )
+    .where(col(CourseStats.course_id).in_(IDS)),
+}
+
+ARGS: dict[str, tuple[Any, ...]] = {
+    "user_by_email": ("a@example.com",),
+    "favorite_course_ids": (USER_ID, IDS),
+    "enrolled_course_ids": (USER_ID, IDS),
+    "students_counts": (IDS,),
+    "completed_step_ids": (USER_ID, IDS),
+    "course_completed_step_ids": (USER_ID, IDS[0]),
+    "courses_progress": (USER_ID, IDS),
+}
+
+
+def measure(build: Callable[[], Executable], iterations: int) -> float:
+    dialect = PGDialect_asyncpg()
+    compiled_cache: dict[Any, Any] = {}
+
+    def prepare() -> None:
+        build()._compile_w_cache(  # type: ignore[attr-defined]
+            dialect, compiled_cache=compiled_cache, column_keys=[]
+        )
+
+    prepare()  # первый вызов компилирует и кладёт результат в кэш
+    started = time.perf_counter()
+    for _ in range(iterations):
+        prepare()
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    for name, build_hot in sorted(queries.HOT_QUERIES.items()):
+        args = ARGS[name]
+        classic_us = measure(CLASSIC[name], iterations)
+        hot_us = measure(lambda: build_hot(*args), iterations)  # noqa: B023
+        print(  # noqa: T201
+            f"{name:<28} select() {classic_us:7.1f} us, "
+            f"lambda_stmt {hot_us:7.1f} us, x{classic_us / hot_us:4.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
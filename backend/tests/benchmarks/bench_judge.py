@@ -0,0 +1,78 @@
+"""
+Пропускная способность app.judge.CodeJudge: одновременная отправка множества
+решений CODE-шага.
+
+Первый проход — разные решения (каждое запускается в песочнице), второй — те
+же решения повторно (ответ из кэша без запуска). База не нужна:
+
+    python -m tests.benchmarks.bench_judge [решений] [воркеров]
+"""
+
+import asyncio
+import os
+import sys
+import time
+from uuid import UUID, uuid4
+
+from app.judge import CodeJudge, JudgeJob
+from app.schemas.step_content import CodeTestCase
+
+TEST_CASES = [
+    CodeTestCase(input=f"{a} {b}\n", expected_output=f"{a + b}\n")
+    for a, b in [(1, 2), (10, 20), (-5, 5), (123, 877)]
+]
+CODE = "a, b = map(int, input().split())\nprint(a + b)  # {}\n"
+
+
+async def run_batch(judge: CodeJudge, codes: list[str], step_id: UUID) -> float:
+    started = time.perf_counter()
+    jobs: list[JudgeJob] = await asyncio.gather(
+        *(
+            judge.submit(
+                user_id=uuid4(),
+                step_id=step_id,
+                version=1,
+                code=code,
+                test_cases=TEST_CASES,
+            )
+            for code in codes
+        )
+    )
+    while any(job.status in ("queued", "running") for job in jobs):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    assert all(job.result and job.result.verdict == "accepted" for job in jobs)
+    return elapsed
+
+
+async def main() -> None:
+    submissions = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 4
+    judge = CodeJudge(
+        max_workers=workers,
+        max_pending=submissions,
+        time_limit_seconds=5,
+        memory_limit_mb=256,
+        output_limit_bytes=64 * 1024,
+        isolate_network=True,
+        result_cache_max_entries=submissions,
+        job_ttl_seconds=600,
+    )
+    await judge.start()
+    step_id = uuid4()
+    codes = [CODE.format(i) for i in range(submissions)]
+    try:
+        for name in ("unique", "resubmit"):
+            elapsed = await run_batch(judge, codes, step_id)
+            print(  # noqa: T201
+                f"{name:<9} {submissions} submissions x {len(TEST_CASES)} tests, "
+                f"{workers} workers: {elapsed:6.2f} s, "
+                f"{submissions / elapsed:8.1f} submissions/s"
+            )
+    finally:
+        await judge.stop()
+    print(judge.metrics())  # noqa: T201
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
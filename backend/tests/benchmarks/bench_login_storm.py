@@ -0,0 +1,104 @@
+"""
+Задержка постороннего эндпоинта во время шквала входов: bcrypt в цикле
+событий против app.core.security.password_hasher.
+
+Поднимается отдельное приложение с тремя маршрутами: вход с проверкой пароля
+прямо в обработчике, вход через verify_password_async и лёгкий /ping. Пока
+clients клиентов без пауз входят, другой клиент раз в 10 мс вызывает /ping.
+База не нужна:
+
+    python -m tests.benchmarks.bench_login_storm [секунд] [clients]
+"""
+
+import asyncio
+import logging
+import statistics
+import sys
+import time
+from collections import Counter
+
+import httpx
+from fastapi import FastAPI
+
+from app.core.security import (
+    PasswordHashingBusy,
+    get_password_hash,
+    verify_password,
+    verify_password_async,
+)
+from app.main import password_hashing_busy_handler
+
+PASSWORD = "correct horse battery staple"
+HASHED = get_password_hash(PASSWORD)
+
+app = FastAPI()
+app.add_exception_handler(
+    PasswordHashingBusy,
+    password_hashing_busy_handler,  # type: ignore[arg-type]
+)
+
+
+@app.post("/login-blocking")
+async def login_blocking() -> bool:
+    return verify_password(PASSWORD, HASHED)
+
+
+@app.post("/login")
+async def login() -> bool:
+    return await verify_password_async(PASSWORD, HASHED)
+
+
+@app.get("/ping")
+async def ping() -> str:
+    return "pong"
+
+
+async def storm(path: str, seconds: float, clients: int) -> None:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+        deadline = time.monotonic() + seconds
+        statuses: Counter[int] = Counter()
+        latencies: list[float] = []
+
+        async def login_loop() -> None:
+            while time.monotonic() < deadline:
+                status_code = (await c.post(path)).status_code
+                statuses[status_code] += 1
+                # Клиент, получивший 429, выжидает, как просит Retry-After
+                await asyncio.sleep(0.1 if status_code == 429 else 0)
+
+        async def ping_loop() -> None:
+            # Задержка считается от момента, когда пинг должен был уйти по
+            # расписанию: так учитывается и время, пока цикл событий стоял
+            scheduled = started
+            while not logins.done():
+                await asyncio.sleep(max(scheduled - time.perf_counter(), 0))
+                await c.get("/ping")
+                finished = time.perf_counter()
+                latencies.append((finished - scheduled) * 1000)
+                scheduled = max(scheduled + 0.01, finished)
+
+        started = time.perf_counter()
+        pings = asyncio.create_task(ping_loop())
+        logins = asyncio.gather(*(login_loop() for _ in range(clients)))
+        await asyncio.gather(pings, logins)
+
+    latencies.sort()
+    p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+    print(  # noqa: T201
+        f"{path:<16} /ping p50 {statistics.median(latencies):7.1f} ms, "
+        f"p99 {p99:7.1f} ms, max {latencies[-1]:7.1f} ms ({len(latencies)} pings); "
+        f"logins {dict(statuses)}"
+    )
+
+
+async def main() -> None:
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    await storm("/login-blocking", seconds, clients)
+    await storm("/login", seconds, clients)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
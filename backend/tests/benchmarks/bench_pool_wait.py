@@ -0,0 +1,69 @@
+"""
+Ожидание соединения из пула при конкурентных запросах с ранним возвратом
+соединения (DB_RELEASE_SESSION_EARLY) и без него.
+
+Запуск (нужна база с применёнными миграциями и созданным суперпользователем):
+
+    python -m tests.benchmarks.bench_pool_wait [конкурентность] [запросов]
+
+Запросы идут через ASGI-транспорт httpx в одном процессе, поэтому пул
+общий для всех запросов, как у одного воркера uvicorn.
+"""
+
+import asyncio
+import sys
+import time
+
+import httpx
+
+from app.core.config import settings
+from app.core.db import async_engine
+from app.main import app
+
+URL = f"{settings.API_V1_STR}/courses/?limit=100"
+
+
+async def run(concurrency: int, requests: int) -> tuple[float, float, float]:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        r = await client.post(
+            f"{settings.API_V1_STR}/login/access-token",
+            data={
+                "username": settings.FIRST_SUPERUSER,
+                "password": settings.FIRST_SUPERUSER_PASSWORD,
+            },
+        )
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one() -> None:
+            async with semaphore:
+                r = await client.get(URL, headers=headers)
+                assert r.status_code == 200, r.text
+
+        await one()  # прогрев
+        metrics = async_engine.pool.metrics  # type: ignore[attr-defined]
+        metrics.reset()
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+    # Соединения asyncpg привязаны к циклу событий, а каждый прогон идёт в своём
+    await async_engine.dispose()
+    mean_wait = metrics.total_wait_seconds / max(metrics.checkouts, 1)
+    return requests / elapsed, mean_wait * 1000, metrics.max_wait_seconds * 1000
+
+
+def main() -> None:
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    for release_early in (False, True):
+        settings.DB_RELEASE_SESSION_EARLY = release_early
+        rps, mean_ms, max_ms = asyncio.run(run(concurrency, requests))
+        print(  # noqa: T201
+            f"release_early={release_early!s:<5} {rps:8.1f} rps, "
+            f"pool wait mean {mean_ms:7.2f} ms, max {max_ms:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Задержка проверки SQL-шага app.sql_runner: копия готового шаблона из пула
+против повторного выполнения схемы и INSERT шага на каждое решение.
+
+Шаг — две таблицы на несколько тысяч строк и два теста. Замеряется
+установившийся режим (шаблон уже собран, пул прогрет). База не нужна:
+
+    python -m tests.benchmarks.bench_sql_runner [решений] [строк]
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+from typing import Any
+from uuid import uuid4
+
+from app.schemas.step_content import SQLStepContent
+from app.sql_runner import SQLRunner, _Template, _run
+
+SCHEMA = """
+create table department (id integer primary key, name text not null);
+create table employee (
+    id integer primary key,
+    name text not null,
+    department_id integer references department (id),
+    salary real not null
+);
+create index ix_employee_department on employee (department_id);
+"""
+ANSWER = """
+select d.name as department, count(*) as employees, sum(e.salary) as total
+from employee e join department d on d.id = e.department_id
+group by d.name
+"""
+
+MAX_BYTES = 64 * 1024 * 1024
+
+
+def make_content(rows: int) -> dict[str, Any]:
+    departments = [f"dept-{i}" for i in range(10)]
+    data = "".join(
+        f"insert into department values ({i}, '{name}');\n"
+        for i, name in enumerate(departments)
+    ) + "".join(
+        f"insert into employee values ({i}, 'emp-{i}', {i % 10}, {1000 + i});\n"
+        for i in range(rows)
+    )
+    expected = [
+        {
+            "department": name,
+            "employees": len(range(d, rows, 10)),
+            "total": sum(1000 + i for i in range(d, rows, 10)),
+        }
+        for d, name in enumerate(departments)
+    ]
+    return {
+        "task": "Сотрудники и фонд оплаты по отделам",
+        "database_schema": SCHEMA,
+        "initial_data": data,
+        "test_queries": [
+            {"query": "", "expected_result": expected},
+            {
+                "query": "select count(*) as n from employee",
+                "expected_result": [{"n": rows}],
+            },
+        ],
+    }
+
+
+def report(name: str, latencies_ms: list[float]) -> None:
+    latencies_ms.sort()
+    p95 = latencies_ms[int(len(latencies_ms) * 0.95) - 1]
+    print(  # noqa: T201
+        f"{name:<8} p50 {statistics.median(latencies_ms):7.2f} ms, "
+        f"p95 {p95:7.2f} ms, max {latencies_ms[-1]:7.2f} ms"
+    )
+
+
+async def main() -> None:
+    submissions = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    content = make_content(rows)
+    runner = SQLRunner(
+        pool_size=4,
+        time_limit_ms=5000,
+        max_rows=10_000,
+        max_templates=8,
+        max_workers=4,
+        max_pending=64,
+        max_db_bytes=MAX_BYTES,
+        max_result_bytes=MAX_BYTES,
+        max_sql_length=10_000,
+    )
+    step_id = uuid4()
+
+    async def load_content() -> dict[str, Any]:
+        return content
+
+    latencies: list[float] = []
+    for _ in range(submissions):
+        started = time.perf_counter()
+        result = await runner.run(
+            step_id=step_id, version=1, load_content=load_content, sql=ANSWER
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert result.is_correct
+        # Дать фоновому пополнению пула закончиться, как между запросами
+        await asyncio.sleep(0.002)
+    report("pooled", latencies[10:])
+
+    parsed = SQLStepContent.model_validate(content)
+    latencies = []
+    for _ in range(max(submissions // 10, 20)):
+        started = time.perf_counter()
+        template = _Template(
+            parsed,
+            time_limit_ms=5000,
+            max_db_bytes=MAX_BYTES,
+            max_value_bytes=MAX_BYTES,
+        )
+        result = _run(
+            template,
+            ANSWER,
+            time_limit_ms=5000,
+            max_rows=10_000,
+            max_result_bytes=MAX_BYTES,
+            max_sql_length=10_000,
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert result.is_correct
+    report("replay", latencies)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,51 @@
+"""
+Накладные расходы проверки access token на запрос: jwt.decode и
+TokenPayload на каждый запрос против app.core.cache.TokenClaimsCache.
+
+Запросы приходят от users пользователей по кругу, у каждого свой токен.
+База не нужна:
+
+    python -m tests.benchmarks.bench_token_claims [запросов] [users]
+"""
+
+import sys
+import time
+from datetime import timedelta
+from uuid import uuid4
+
+import jwt
+
+from app.core import security
+from app.core.cache import TokenClaimsCache
+from app.core.config import settings
+from app.models import TokenPayload
+
+
+def decode_uncached(token: str) -> TokenPayload:
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[security.ALGORITHM])
+    return TokenPayload(**payload)
+
+
+def main() -> None:
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    tokens = [
+        security.create_access_token(uuid4(), expires_delta=timedelta(minutes=30))
+        for _ in range(users)
+    ]
+    cache = TokenClaimsCache(max_entries=10_000)
+
+    for name, decode in (("uncached", decode_uncached), ("cached", cache.decode)):
+        started = time.perf_counter()
+        for i in range(requests):
+            decode(tokens[i % users])
+        elapsed = time.perf_counter() - started
+        print(  # noqa: T201
+            f"{name:<9} {elapsed / requests * 1e6:6.2f} us per request, "
+            f"{requests / elapsed:10.0f} requests/s"
+        )
+    print(f"cache hits {cache.hits}, misses {cache.misses}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
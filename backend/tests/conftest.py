@@ -6,6 +6,7 @@ from sqlmodel import Session, delete
 
 from app.core.config import settings
 from app.core.db import engine, init_db
+from app.core.rate_limit import rate_limiter
 from app.main import app
 from app.models import User
 from tests.utils.user import authentication_token_from_email
@@ -22,6 +23,15 @@ def db() -> Generator[Session, None, None]:
         session.commit()
 
 
+@pytest.fixture(scope="session", autouse=True)
+def disable_rate_limits() -> Generator[None, None, None]:
+    # Все запросы тестов приходят с одного адреса; отдельные тесты включают
+    # ограничение сами
+    rate_limiter.enabled = False
+    yield
+    rate_limiter.enabled = True
+
+
 @pytest.fixture(scope="module")
 def client() -> Generator[TestClient, None, None]:
     with TestClient(app) as c:
@@ -0,0 +1,55 @@
+import asyncio
+from datetime import timedelta
+from uuid import uuid4
+
+import pytest
+from jwt.exceptions import ExpiredSignatureError, InvalidSignatureError
+from pydantic import TypeAdapter
+
+from app.core import cache as cache_module
+from app.core.cache import CourseStructureCache, InMemoryCacheBackend, TokenClaimsCache
+from app.core.security import create_access_token
+
+
+def test_token_claims_cache_serves_valid_tokens_only() -> None:
+    cache = TokenClaimsCache(max_entries=2)
+    token = create_access_token("user-1", expires_delta=timedelta(minutes=5))
+
+    assert cache.decode(token).sub == "user-1"
+    assert cache.decode(token).sub == "user-1"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    with pytest.raises(InvalidSignatureError):
+        cache.decode(token[:-2] + ("AA" if token[-2:] != "AA" else "BB"))
+    expired = create_access_token("user-2", expires_delta=timedelta(seconds=-1))
+    with pytest.raises(ExpiredSignatureError):
+        cache.decode(expired)
+    assert len(cache) == 1
+
+
+def test_structure_cache_of_other_worker_expires(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    # Два воркера со своими InMemoryCacheBackend
+    workers = [
+        CourseStructureCache(InMemoryCacheBackend(10, 60), 10, 60) for _ in range(2)
+    ]
+    course_id = uuid4()
+    title = ["old"]
+
+    async def load() -> str:
+        return title[0]
+
+    def read(worker: CourseStructureCache) -> str:
+        return asyncio.run(
+            worker.get_or_load(course_id, "title", TypeAdapter(str), load)
+        )
+
+    assert [read(worker) for worker in workers] == ["old", "old"]
+    title[0] = "new"
+    asyncio.run(workers[0].invalidate(course_id))
+    assert [read(worker) for worker in workers] == ["new", "old"]
+    now[0] += 61
+    assert read(workers[1]) == "new"
@@ -0,0 +1,58 @@
+import asyncio
+from pathlib import Path
+
+from app.judge import JudgeResult, run_submission
+from app.schemas.step_content import CodeTestCase
+
+TEST_CASES = [CodeTestCase(input="1 2\n", expected_output="3\n")]
+ENV_FILE = Path(__file__).resolve().parents[3] / ".env"
+
+
+def judge(code: str) -> JudgeResult:
+    # Изоляция сети зависит от машины; здесь проверяется audit-хук
+    return asyncio.run(
+        run_submission(
+            code,
+            TEST_CASES,
+            time_limit_seconds=5,
+            memory_limit_mb=256,
+            output_limit_bytes=1024,
+            isolate_network=False,
+        )
+    )
+
+
+def test_accepted_with_stdlib_imports() -> None:
+    result = judge(
+        "import collections, json, math, re\n"
+        "a, b = map(int, input().split())\n"
+        "print(a + b)\n"
+    )
+    assert result.verdict == "accepted"
+
+
+def test_file_read_is_rejected() -> None:
+    for path in ("/etc/passwd", str(ENV_FILE), "../../etc/passwd"):
+        result = judge(f"print(open({path!r}).read())")
+        assert result.verdict == "runtime_error"
+        assert result.message == "PermissionError"
+    result = judge("import os\nprint(os.listdir('/'))")
+    assert result.message == "PermissionError"
+
+
+def test_socket_connect_is_rejected() -> None:
+    result = judge("import socket\nsocket.create_connection(('127.0.0.1', 9))")
+    assert result.verdict == "runtime_error"
+    assert result.message == "PermissionError"
+
+
+def test_runtime_error_reports_exception_type_only() -> None:
+    result = judge("raise ValueError('secret')")
+    assert result.verdict == "runtime_error"
+    assert result.message == "ValueError"
+    # Кадр, записанный решением в канал напрямую, не вынесет текст
+    result = judge(
+        "import os\n"
+        "os.write(3, b'{\"error\": \"runtime_error\", \"message\": \"a secret\"}\\n')\n"
+    )
+    assert result.message == "Error"
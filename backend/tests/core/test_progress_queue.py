@@ -0,0 +1,106 @@
+import asyncio
+import gc
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import TypeVar
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.progress_queue import ProgressWriteBehind
+from app.models import StepProgress
+from tests.utils.course import create_course_tree, create_random_course
+from tests.utils.user import create_random_user_sync
+
+T = TypeVar("T")
+
+
+def run_process(main: Callable[[ProgressWriteBehind], Awaitable[T]], spool: Path) -> T:
+    """
+    Выполнить main в отдельном цикле событий с собственным движком, как в
+    новом процессе. Очередь не останавливается: фоновая задача отменяется
+    вместе с циклом, и несброшенные отметки остаются только в журнале.
+    """
+
+    async def wrapper() -> T:
+        engine = create_async_engine(str(settings.ASYNC_SQLALCHEMY_DATABASE_URI))
+        queue = ProgressWriteBehind(
+            session_factory=async_sessionmaker(
+                engine, expire_on_commit=False, class_=AsyncSession
+            ),
+            spool_path=str(spool),
+            batch_size=1000,
+            flush_interval_seconds=3600,
+            max_pending=1000,
+            full_timeout_seconds=1,
+        )
+        try:
+            return await main(queue)
+        finally:
+            await engine.dispose()
+
+    try:
+        return asyncio.run(wrapper())
+    finally:
+        # Как при выходе процесса: закрыть его файлы и снять блокировку журнала
+        gc.collect()
+
+
+def _completed(db: Session, user_id: UUID) -> set[UUID]:
+    db.expire_all()
+    statement = select(StepProgress.step_id).where(StepProgress.user_id == user_id)
+    return set(db.exec(statement).all())
+
+
+def test_acknowledged_progress_survives_crash(db: Session, tmp_path: Path) -> None:
+    user = create_random_user_sync(db)
+    course = create_random_course(db, author_id=user.id)
+    step_ids = [
+        step.id
+        for step in create_course_tree(
+            db, course_id=course.id, modules=1, lessons=1, steps=4
+        )
+    ]
+    spool = tmp_path / "progress.jsonl"
+
+    async def before_crash(queue: ProgressWriteBehind) -> None:
+        await queue.start()
+        await queue.enqueue(user.id, step_ids[:2])
+        await queue.flush()
+        # Подтверждены, но не записаны в БД к моменту падения
+        await queue.enqueue(user.id, step_ids[1:])
+
+    run_process(before_crash, spool)
+    assert _completed(db, user.id) == set(step_ids[:2])
+
+    async def after_restart(queue: ProgressWriteBehind) -> None:
+        await queue.start()
+        assert len(queue) == 0
+        await queue.stop()
+
+    run_process(after_restart, spool)
+    assert _completed(db, user.id) == set(step_ids)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_enqueue_coalesces_repeated_completions(db: Session, tmp_path: Path) -> None:
+    user = create_random_user_sync(db)
+    course = create_random_course(db, author_id=user.id)
+    step = create_course_tree(db, course_id=course.id, modules=1, lessons=1, steps=1)[0]
+
+    async def main(queue: ProgressWriteBehind) -> None:
+        await queue.start()
+        (first,), created = await queue.enqueue(user.id, [step.id])
+        assert created == 1
+        entries, created = await queue.enqueue(user.id, [step.id, step.id])
+        assert created == 0
+        assert entries == [first, first]
+        assert queue.pending_step_ids(user.id, [step.id]) == {step.id}
+        await queue.stop()
+        assert queue.metrics()["inserted"] == 1
+
+    run_process(main, tmp_path / "progress.jsonl")
+    assert _completed(db, user.id) == {step.id}
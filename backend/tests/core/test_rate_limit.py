@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.rate_limit import (
+    InMemoryRateLimitBackend,
+    RateLimit,
+    RateLimiter,
+    RateLimitExceeded,
+)
+
+
+def test_token_bucket_refills_over_time() -> None:
+    backend = InMemoryRateLimitBackend(max_keys=10)
+
+    async def main() -> None:
+        assert await backend.take("key", 2, 50) == 0
+        assert await backend.take("key", 2, 50) == 0
+        retry_after = await backend.take("key", 2, 50)
+        assert 0 < retry_after <= 1 / 50
+        assert await backend.take("other", 2, 50) == 0
+        time.sleep(retry_after + 0.01)
+        assert await backend.take("key", 2, 50) == 0
+
+    asyncio.run(main())
+
+
+def test_rate_limiter_counts_rejections_per_rule() -> None:
+    limiter = RateLimiter(InMemoryRateLimitBackend(max_keys=10))
+    rule = RateLimit("login-ip", capacity=1, period_seconds=60)
+
+    async def main() -> None:
+        await limiter.hit(rule, "10.0.0.1")
+        with pytest.raises(RateLimitExceeded) as exc_info:
+            await limiter.hit(rule, "10.0.0.1")
+        assert exc_info.value.retry_after == pytest.approx(60, abs=1)
+        await limiter.hit(rule, "10.0.0.2")
+
+    asyncio.run(main())
+    assert limiter.metrics() == {
+        "rejected": 1,
+        "allowed_login-ip": 2,
+        "rejected_login-ip": 1,
+    }
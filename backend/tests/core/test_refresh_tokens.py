@@ -0,0 +1,28 @@
+from app.core.db import AsyncSessionLocal
+from app.core.refresh_tokens import BloomFilter, RefreshTokenRevocations
+
+
+def test_bloom_filter_has_no_false_negatives() -> None:
+    bloom = BloomFilter(capacity=5000, error_rate=0.01)
+    for i in range(5000):
+        bloom.add(f"family-{i}")
+    assert all(f"family-{i}" in bloom for i in range(5000))
+    false_positives = sum(f"other-{i}" in bloom for i in range(20_000))
+    assert false_positives < 20_000 * 0.03
+
+
+def test_revocations_check_db_until_filter_is_loaded() -> None:
+    revocations = RefreshTokenRevocations(
+        session_factory=AsyncSessionLocal,
+        sync_interval_seconds=5,
+        rebuild_interval_seconds=600,
+        error_rate=0.001,
+        purge_interval_seconds=3600,
+        purge_batch_size=100,
+    )
+    assert revocations.might_be_revoked("family")
+    revocations._bloom = BloomFilter(capacity=1024, error_rate=0.001)
+    assert not revocations.might_be_revoked("family")
+    revocations.add("family")
+    assert revocations.might_be_revoked("family")
+    assert revocations.metrics()["db_checks"] == 2
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+import pytest
+from passlib.context import CryptContext
+from passlib.exc import MissingBackendError
+from passlib.hash import argon2
+
+from app.core.security import (
+    PasswordHasher,
+    PasswordHashingBusy,
+    build_pwd_context,
+    get_password_hash_async,
+    verify_password_async,
+)
+
+
+def test_password_hasher_sheds_load_when_queue_is_full() -> None:
+    hasher = PasswordHasher(max_workers=1, max_pending=2)
+    release = threading.Event()
+
+    async def main() -> None:
+        slow = [asyncio.create_task(hasher.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert len(hasher) == 2
+        with pytest.raises(PasswordHashingBusy):
+            await hasher.run(release.wait)
+        release.set()
+        assert await asyncio.gather(*slow) == [True, True]
+        assert len(hasher) == 0
+
+    asyncio.run(main())
+
+
+def test_password_hash_async_round_trip() -> None:
+    async def main() -> None:
+        hashed = await get_password_hash_async("secret-password")
+        assert await verify_password_async("secret-password", hashed)
+        assert not await verify_password_async("wrong-password", hashed)
+
+    asyncio.run(main())
+
+
+def test_pwd_context_flags_hashes_with_other_cost_for_update() -> None:
+    def context(bcrypt_rounds: int) -> CryptContext:
+        return build_pwd_context(
+            scheme="bcrypt",
+            bcrypt_rounds=bcrypt_rounds,
+            argon2_time_cost=2,
+            argon2_memory_cost_kib=19_456,
+            argon2_parallelism=1,
+        )
+
+    old_hash = context(5).hash("secret-password")
+    current = context(4)
+    assert current.needs_update(old_hash)
+    assert current.verify_and_update("wrong-password", old_hash) == (False, None)
+    verified, new_hash = current.verify_and_update("secret-password", old_hash)
+    assert verified and new_hash
+    assert not current.needs_update(new_hash)
+    assert current.verify("secret-password", new_hash)
+
+
+@pytest.mark.skipif(argon2.has_backend(), reason="argon2-cffi is installed")
+def test_pwd_context_requires_backend_of_selected_scheme() -> None:
+    options = {
+        "bcrypt_rounds": 4,
+        "argon2_time_cost": 2,
+        "argon2_memory_cost_kib": 19_456,
+        "argon2_parallelism": 1,
+    }
+    with pytest.raises(MissingBackendError):
+        build_pwd_context(scheme="argon2", **options)
+    # argon2 в списке схем только для проверки старых хешей — это не мешает
+    assert build_pwd_context(scheme="bcrypt", **options).hash("secret-password")
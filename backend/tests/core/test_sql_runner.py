@@ -0,0 +1,142 @@
+import asyncio
+from typing import Any
+from uuid import uuid4
+
+import pytest
+
+from app import sql_runner
+from app.sql_runner import InvalidSQLStep, SQLRunner, SQLRunnerBusy, SQLRunResult
+
+CONTENT = {
+    "task": "Все значения",
+    "database_schema": "create table t (x integer);",
+    "initial_data": "insert into t values (1);",
+    "test_queries": [{"query": "", "expected_result": [{"x": 1}]}],
+}
+
+
+def make_runner(max_pending: int = 8, time_limit_ms: int = 5000) -> SQLRunner:
+    return SQLRunner(
+        pool_size=1,
+        time_limit_ms=time_limit_ms,
+        max_rows=100,
+        max_templates=4,
+        max_workers=1,
+        max_pending=max_pending,
+        max_db_bytes=1024 * 1024,
+        max_result_bytes=64 * 1024,
+        max_sql_length=1000,
+    )
+
+
+async def check(
+    runner: SQLRunner, sql: str, content: dict[str, Any] = CONTENT
+) -> SQLRunResult:
+    async def load_content() -> dict[str, Any]:
+        return content
+
+    return await runner.run(
+        step_id=uuid4(), version=1, load_content=load_content, sql=sql
+    )
+
+
+def test_solution_cannot_grow_database_past_limit() -> None:
+    result = asyncio.run(
+        check(
+            make_runner(),
+            "with recursive r(i) as (select 1 union all select i + 1 from r) "
+            "insert into t select randomblob(10000) from r",
+        )
+    )
+    assert not result.is_correct
+    assert result.message == "database or disk is full"
+
+
+def test_result_and_statement_size_are_capped() -> None:
+    runner = make_runner()
+    result = asyncio.run(check(runner, "select randomblob(100000) as x"))
+    assert result.message == "string or blob too big"
+    result = asyncio.run(
+        check(
+            runner,
+            "with recursive r(i) as (select 1 union all select i + 1 from r "
+            "where i < 50) select randomblob(2000) as x from r",
+        )
+    )
+    assert result.message == "Result is larger than 65536 bytes"
+    result = asyncio.run(check(runner, "select x from t" + " " * 1000))
+    assert result.message == "Query is longer than 1000 characters"
+    assert asyncio.run(check(runner, "select x from t")).is_correct
+
+
+def test_busy_runner_sheds_load() -> None:
+    runner = make_runner(max_pending=2)
+
+    async def main() -> None:
+        results = await asyncio.gather(
+            *(check(runner, "select x from t") for _ in range(3)),
+            return_exceptions=True,
+        )
+        assert sum(isinstance(result, SQLRunnerBusy) for result in results) == 1
+        assert len(runner) == 0
+
+    asyncio.run(main())
+    runner.max_pending = 0
+    with pytest.raises(SQLRunnerBusy):
+        asyncio.run(check(runner, "select x from t"))
+
+
+@pytest.mark.parametrize(
+    ("initial_data", "message"),
+    [
+        ("attach ':memory:' as other;", "not authorized"),
+        (
+            "with recursive r(i) as (select 1 union all select i + 1 from r) "
+            "insert into t select randomblob(10000) from r;",
+            "database or disk is full",
+        ),
+        (
+            "with recursive r(i) as (select 1 union all select i + 1 from r) "
+            "insert into t select count(*) from r;",
+            "Schema and data took longer than 200 ms",
+        ),
+    ],
+)
+def test_template_build_is_bounded(initial_data: str, message: str) -> None:
+    content = CONTENT | {"initial_data": initial_data}
+    with pytest.raises(InvalidSQLStep, match=message):
+        asyncio.run(check(make_runner(time_limit_ms=200), "select x from t", content))
+
+
+def test_concurrent_checks_build_template_once(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    built = []
+
+    class Template(sql_runner._Template):
+        def __init__(self, *args: Any, **kwargs: Any) -> None:
+            built.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(sql_runner, "_Template", Template)
+    runner = make_runner()
+    step_id = uuid4()
+
+    async def load_content() -> dict[str, Any]:
+        return CONTENT
+
+    async def main() -> list[SQLRunResult]:
+        return await asyncio.gather(
+            *(
+                runner.run(
+                    step_id=step_id,
+                    version=1,
+                    load_content=load_content,
+                    sql="select x from t",
+                )
+                for _ in range(4)
+            )
+        )
+
+    assert all(result.is_correct for result in asyncio.run(main()))
+    assert len(built) == 1
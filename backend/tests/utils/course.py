@@ -0,0 +1,54 @@
+from uuid import UUID
+
+from sqlmodel import Session
+
+from app.models import Course, Lesson, Module, Step
+from tests.utils.utils import random_lower_string
+
+
+def create_random_course(
+    db: Session, *, author_id: UUID, is_published: bool = True
+) -> Course:
+    course = Course(
+        title=random_lower_string()[:32],
+        author_id=author_id,
+        is_published=is_published,
+    )
+    db.add(course)
+    db.commit()
+    db.refresh(course)
+    return course
+
+
+def create_course_tree(
+    db: Session, *, course_id: UUID, modules: int = 2, lessons: int = 2, steps: int = 2
+) -> list[Step]:
+    """Заполнить курс модулями, уроками и шагами; вернуть созданные шаги."""
+    created_steps = []
+    for module_position in range(modules):
+        module = Module(
+            title=f"Module {module_position}",
+            course_id=course_id,
+            position=module_position,
+        )
+        db.add(module)
+        for lesson_position in range(lessons):
+            lesson = Lesson(
+                title=f"Lesson {lesson_position}",
+                module_id=module.id,
+                position=lesson_position,
+            )
+            db.add(lesson)
+            for step_position in range(steps):
+                step = Step(
+                    title=f"Step {step_position}",
+                    lesson_id=lesson.id,
+                    position=step_position,
+                    content={"text": random_lower_string()},
+                )
+                db.add(step)
+                created_steps.append(step)
+    db.commit()
+    for step in created_steps:
+        db.refresh(step)
+    return created_steps
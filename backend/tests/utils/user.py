@@ -3,6 +3,7 @@ from sqlmodel import Session
 
 from app import crud
 from app.core.config import settings
+from app.core.security import get_password_hash
 from app.models import User, UserCreate, UserUpdate
 from tests.utils.utils import random_email, random_lower_string
 
@@ -27,6 +28,18 @@ def create_random_user(db: Session) -> User:
     return user
 
 
+def create_random_user_sync(db: Session) -> User:
+    """Create a user through a sync session; crud.create_user is async."""
+    user = User(
+        email=random_email(),
+        hashed_password=get_password_hash(random_lower_string()),
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
 def authentication_token_from_email(
     *, client: TestClient, email: str, db: Session
 ) -> dict[str, str]:
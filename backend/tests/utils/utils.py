@@ -1,9 +1,14 @@
 import random
 import string
+from collections.abc import Generator
+from contextlib import contextmanager
+from typing import Any
 
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 
 from app.core.config import settings
+from app.core.db import async_engine
 
 
 def random_lower_string() -> str:
@@ -24,3 +29,24 @@ def get_superuser_token_headers(client: TestClient) -> dict[str, str]:
     a_token = tokens["access_token"]
     headers = {"Authorization": f"Bearer {a_token}"}
     return headers
+
+
+@contextmanager
+def count_queries() -> Generator[list[str], None, None]:
+    """
+    Collect SQL statements executed by the application async engine.
+    """
+    statements: list[str] = []
+
+    def _before_cursor_execute(*args: Any) -> None:
+        statements.append(args[2])
+
+    event.listen(
+        async_engine.sync_engine, "before_cursor_execute", _before_cursor_execute
+    )
+    try:
+        yield statements
+    finally:
+        event.remove(
+            async_engine.sync_engine, "before_cursor_execute", _before_cursor_execute
+        )